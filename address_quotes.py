@@ -0,0 +1,216 @@
+# address_quotes.py
+"""
+Кэш проверок адреса доставки: (город кухни, адрес) -> котировка.
+
+Раньше каждый чекаут с доставкой слал сырой адрес в
+/api/v1/address/check и ждал normalized_address / delivery_price / distance_km,
+даже если покупатель заказывал на этот адрес вчера.
+
+Теперь:
+- ключ = город + нормализованный текст адреса (NFKC, регистр, пробелы)
+- котировка кладется и под введенный адрес, и под normalized_address из API
+- TTL (ADDRESS_QUOTES_TTL_SECONDS) + LRU (ADDRESS_QUOTES_MAX)
+- кэш переживает рестарт: BOT_STATE_DIR/address_quotes.json;
+  новые котировки только помечают кэш грязным, на диск он уходит
+  раз в ADDRESS_QUOTES_FLUSH_SECONDS (flush_loop) и на остановке бота,
+  а не целиком на каждый промах чекаута
+
+ВАЖНО:
+- кэшируются только успешные ответы (ok=true и delivery_price прошел контракт)
+- цена доставки могла поменяться: TTL держим в пределах дня
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+from state_dir import atomic_write_json, state_path
+from webapi_client import webapi_check_address
+
+log = logging.getLogger("ADDRESS_QUOTES")
+
+
+ADDRESS_QUOTES_TTL_SECONDS = float(os.getenv("ADDRESS_QUOTES_TTL_SECONDS", str(12 * 3600)))
+ADDRESS_QUOTES_MAX = int(os.getenv("ADDRESS_QUOTES_MAX", "5000"))
+ADDRESS_QUOTES_FLUSH_SECONDS = float(os.getenv("ADDRESS_QUOTES_FLUSH_SECONDS", "30"))
+
+QUOTES_PATH = state_path("address_quotes.json")
+
+_lock = threading.Lock()
+_save_lock = threading.Lock()
+# "city|address" -> {"quote": {...}, "at": unix time}
+_CACHE: "OrderedDict[str, dict]" = OrderedDict()
+_loaded = False
+_dirty = False
+
+_STATS = {"hits": 0, "misses": 0}
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_address(address: str) -> str:
+    text = unicodedata.normalize("NFKC", address or "")
+    text = _SPACES.sub(" ", text).strip().lower()
+    return text.rstrip(".,")
+
+
+def _key(city: str, address: str) -> str:
+    return f"{(city or '').strip().lower()}|{normalize_address(address)}"
+
+
+# -------------------------------------------------
+# Persist
+# -------------------------------------------------
+
+def _ensure_loaded() -> None:
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+
+    try:
+        with open(QUOTES_PATH, encoding="utf-8") as f:
+            items = json.load(f)
+    except FileNotFoundError:
+        return
+    except Exception:
+        log.exception(f"[ADDRESS_QUOTES] broken {QUOTES_PATH}, starting empty")
+        return
+
+    now = time.time()
+    for key, entry in items:
+        if now - entry.get("at", 0) < ADDRESS_QUOTES_TTL_SECONDS:
+            _CACHE[key] = entry
+
+    log.info(f"[ADDRESS_QUOTES] loaded {len(_CACHE)} quotes")
+
+
+def save() -> None:
+    """
+    Сбрасывает кэш на диск (блокирующий, из async через to_thread).
+    """
+    global _dirty
+    with _save_lock:
+        with _lock:
+            items = list(_CACHE.items())
+            _dirty = False
+        try:
+            atomic_write_json(QUOTES_PATH, items)
+        except Exception:
+            with _lock:
+                _dirty = True
+            raise
+
+
+def save_if_dirty() -> bool:
+    """
+    save(), только если с прошлого сброса были новые котировки.
+    """
+    with _lock:
+        if not _dirty:
+            return False
+    save()
+    return True
+
+
+# -------------------------------------------------
+# Cache
+# -------------------------------------------------
+
+def get(city: str, address: str) -> Optional[dict]:
+    key = _key(city, address)
+
+    with _lock:
+        _ensure_loaded()
+        entry = _CACHE.get(key)
+
+        if entry is None:
+            _STATS["misses"] += 1
+            return None
+
+        if time.time() - entry["at"] >= ADDRESS_QUOTES_TTL_SECONDS:
+            _CACHE.pop(key, None)
+            _STATS["misses"] += 1
+            return None
+
+        _CACHE.move_to_end(key)
+        _STATS["hits"] += 1
+        return dict(entry["quote"])
+
+
+def put(city: str, address: str, quote: dict) -> None:
+    entry = {"quote": dict(quote), "at": time.time()}
+
+    keys = {_key(city, address)}
+    if quote.get("normalized_address"):
+        keys.add(_key(city, quote["normalized_address"]))
+
+    global _dirty
+    with _lock:
+        _ensure_loaded()
+        for key in keys:
+            _CACHE[key] = entry
+            _CACHE.move_to_end(key)
+        while len(_CACHE) > ADDRESS_QUOTES_MAX:
+            _CACHE.popitem(last=False)
+        _dirty = True
+
+
+def _cacheable(quote: Optional[dict]) -> bool:
+    return bool(
+        quote
+        and quote.get("ok") is True
+        and quote.get("delivery_price") is not None
+    )
+
+
+async def check_address(city: str, address: str) -> Optional[dict]:
+    """
+    webapi_check_address с кэшем: повторный адрес без запроса в Web API.
+    """
+    cached = await asyncio.to_thread(get, city, address)
+    if cached is not None:
+        log.info(f"[ADDRESS_QUOTES] hit city={city!r} address={address!r}")
+        return cached
+
+    quote = await webapi_check_address(city, address)
+
+    if _cacheable(quote):
+        put(city, address, quote)
+
+    return quote
+
+
+async def flush_loop(
+    app,
+    *,
+    interval: float = ADDRESS_QUOTES_FLUSH_SECONDS,
+) -> None:
+    """
+    Периодический сброс кэша на диск (app.create_task из post_init).
+    Последний сброс — в post_shutdown (save_if_dirty).
+    """
+    while not app.running:
+        await asyncio.sleep(0.5)
+
+    while app.running:
+        deadline = time.monotonic() + interval
+        while app.running and time.monotonic() < deadline:
+            await asyncio.sleep(min(1.0, deadline - time.monotonic()))
+
+        try:
+            await asyncio.to_thread(save_if_dirty)
+        except Exception as e:
+            log.error(f"[ADDRESS_QUOTES] save failed: {e}")
+
+
+def quote_stats() -> dict:
+    with _lock:
+        return {**_STATS, "size": len(_CACHE)}
@@ -1,6 +1,5 @@
 # broadcast.py
 print("### BROADCAST FILE:", __file__)
-import asyncio
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
@@ -13,7 +12,9 @@ from telegram.ext import (
 )
 
 from kitchen_context import _REGISTRY
-from sheets_repo import get_sheets_service
+import sheets_async
+from storage import get_storage
+import broadcast_engine
 
 log = logging.getLogger("Broadcast")
 
@@ -23,25 +24,9 @@ def is_kitchen_admin(chat_id: int, kitchen) -> bool:
     return chat_id == kitchen.owner_chat_id or chat_id in kitchen.staff_chat_ids
 
 
-def get_all_user_ids(sheet_service, spreadsheet_id: str) -> list[int]:
-    sheet = sheet_service.spreadsheets()
-    result = sheet.values().get(
-        spreadsheetId=spreadsheet_id,
-        range="users!A2:A",
-    ).execute()
-
-    rows = result.get("values", [])
-    ids = []
-    for r in rows:
-        if r and r[0].isdigit():
-            ids.append(int(r[0]))
-    return ids
-
-
-def get_service(context):
-    if context.bot_data.get("SHEETS_SERVICE") is None:
-        context.bot_data["SHEETS_SERVICE"] = get_sheets_service()
-    return context.bot_data["SHEETS_SERVICE"]
+def get_all_user_ids(spreadsheet_id: str) -> list[int]:
+    # справочник покупателей кухни, дочитываются только новые строки
+    return get_storage().users.user_ids(spreadsheet_id)
 
 
 # ===== handlers =====
@@ -94,15 +79,15 @@ async def on_broadcast_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
         log.warning(f"on_broadcast_text: kitchen not found ({kitchen_id})")
         return
 
-    service = get_service(context)
     spreadsheet_id = kitchen.spreadsheet_id
 
-    all_ids = get_all_user_ids(service, spreadsheet_id)
+    all_ids = await sheets_async.run(get_all_user_ids, spreadsheet_id)
 
     owner = kitchen.owner_chat_id
     staff = kitchen.staff_chat_ids
 
     recipients = [uid for uid in all_ids if uid != owner and uid not in staff]
+    recipients = broadcast_engine.prune_recipients(recipients)
     broadcast["recipients"] = recipients
 
     kb = InlineKeyboardMarkup([
@@ -160,32 +145,18 @@ async def on_broadcast_confirm(update: Update, context: ContextTypes.DEFAULT_TYP
         f"Сообщений: {len(recipients)}"
     )
 
-    sent = 0
-    failed = 0
-
-    for uid in recipients:
-        try:
-            await context.bot.send_message(
-                chat_id=uid,
-                text=text,
-                parse_mode=ParseMode.HTML,
-            )
-            sent += 1
-            await asyncio.sleep(0.05)
-        except Exception:
-            failed += 1
-            await asyncio.sleep(0.1)
-
     context.user_data.pop("broadcast", None)
 
-    await context.bot.send_message(
-        chat_id=chat_id,
-        text=(
-            "📊 <b>Рассылка завершена</b>\n\n"
-            f"✅ Отправлено: <b>{sent}</b>\n"
-            f"❌ Ошибок: <b>{failed}</b>"
+    # отправка фоном: хендлер свободен сразу, итог придет отдельным сообщением
+    broadcast_engine.start(
+        context.bot,
+        broadcast_engine.BroadcastJob(
+            kitchen_id=kitchen_id,
+            admin_chat_id=chat_id,
+            text=text,
+            recipients=recipients,
+            progress_message_id=q.message.message_id,
         ),
-        parse_mode=ParseMode.HTML,
     )
 
 
@@ -0,0 +1,463 @@
+# broadcast_engine.py
+"""
+Движок рассылок.
+
+Раньше on_broadcast_confirm слал сообщения по одному прямо в хендлере
+(sleep 0.05 между ними): 10k получателей = 8+ минут, и все это время
+апдейт админа висел в обработке.
+
+Теперь:
+- рассылка = фоновая задача, хендлер освобождается сразу
+- N воркеров шлют параллельно, общий темп держит token bucket
+  (глобальный лимит Telegram ~30 msg/s, берем с запасом)
+- один чат не чаще BROADCAST_PER_CHAT_INTERVAL (лимит Telegram ~1 msg/s на чат)
+- RetryAfter: ставим на паузу ВЕСЬ bucket на указанное время и повторяем
+- прогресс раз в BROADCAST_PROGRESS_SECONDS правкой сообщения админа
+
+Надежность (broadcast_store):
+- задача сохраняется на диск при старте и раз в BROADCAST_CHECKPOINT_SECONDS
+  (получатели, sent/failed), на остановке бота тоже
+- при старте бота незавершенные рассылки продолжаются (resume_pending),
+  уже получившим повторно не шлем
+- заблокировавшие бота (Forbidden) исключаются из следующих рассылок
+
+ВАЖНО:
+- Forbidden не повторяем, считаем в blocked
+- задачи рассылок не держат остановку бота (shutdown прерывает их,
+  продолжение после рестарта)
+- между чекпоинтами окно: после падения процесса эти сообщения могут
+  уйти повторно (не больше BROADCAST_CHECKPOINT_SECONDS * BROADCAST_RATE)
+"""
+
+import asyncio
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set
+
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TimedOut
+
+import broadcast_store
+
+log = logging.getLogger("BROADCAST_ENGINE")
+
+
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))               # msg/s на бота
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "10"))
+BROADCAST_PER_CHAT_INTERVAL = float(os.getenv("BROADCAST_PER_CHAT_INTERVAL", "1"))
+BROADCAST_PROGRESS_SECONDS = float(os.getenv("BROADCAST_PROGRESS_SECONDS", "5"))
+BROADCAST_MAX_ATTEMPTS = int(os.getenv("BROADCAST_MAX_ATTEMPTS", "3"))
+BROADCAST_CHECKPOINT_SECONDS = float(os.getenv("BROADCAST_CHECKPOINT_SECONDS", "2"))
+# завершенные задачи держим в памяти для get_job, потом забываем
+BROADCAST_JOB_RETENTION_SECONDS = float(os.getenv("BROADCAST_JOB_RETENTION_SECONDS", "3600"))
+
+
+# -------------------------------------------------
+# Rate limiting
+# -------------------------------------------------
+
+class TokenBucket:
+    """
+    Асинхронный token bucket: rate токенов в секунду, запас до capacity.
+    pause(seconds) останавливает выдачу токенов всем (RetryAfter).
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = max(rate, 0.1)
+        self.capacity = capacity if capacity is not None else max(1.0, self.rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    self._updated = time.monotonic()
+                    continue
+
+                self._tokens = min(
+                    self.capacity,
+                    self._tokens + (now - self._updated) * self.rate,
+                )
+                self._updated = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class PerChatLimiter:
+    """
+    Минимальный интервал между сообщениями в один чат.
+    Записи старше interval ничего не ограничивают и периодически вычищаются,
+    иначе словарь рос бы на каждый чат, которому бот когда-либо писал.
+    """
+
+    _PRUNE_MIN = 1024
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._last: Dict[int, float] = {}
+        self._prune_at = self._PRUNE_MIN
+
+    def _prune(self, now: float) -> None:
+        self._last = {
+            chat_id: ts for chat_id, ts in self._last.items()
+            if now - ts < self.interval
+        }
+        self._prune_at = max(self._PRUNE_MIN, 2 * len(self._last))
+
+    async def wait(self, chat_id: int) -> None:
+        last = self._last.get(chat_id)
+        now = time.monotonic()
+        if last is not None and now - last < self.interval:
+            await asyncio.sleep(self.interval - (now - last))
+        now = time.monotonic()
+        self._last[chat_id] = now
+        if len(self._last) > self._prune_at:
+            self._prune(now)
+
+
+# -------------------------------------------------
+# Job
+# -------------------------------------------------
+
+@dataclass
+class BroadcastJob:
+    kitchen_id: str
+    admin_chat_id: int
+    text: str
+    recipients: List[int]
+    progress_message_id: Optional[int] = None
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    sent_ids: Set[int] = field(default_factory=set)
+    failed_ids: Set[int] = field(default_factory=set)
+    blocked: Set[int] = field(default_factory=set)
+    status: str = "pending"   # pending | running | interrupted | done
+    created_at: float = field(default_factory=time.time)
+    started_at: float = 0.0
+    finished_at: float = 0.0
+
+    @property
+    def sent(self) -> int:
+        return len(self.sent_ids)
+
+    @property
+    def failed(self) -> int:
+        return len(self.failed_ids)
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.failed
+
+    def remaining(self) -> List[int]:
+        return [
+            chat_id for chat_id in dict.fromkeys(self.recipients)
+            if chat_id not in self.sent_ids and chat_id not in self.failed_ids
+        ]
+
+    def to_state(self) -> dict:
+        return {
+            "job_id": self.job_id,
+            "kitchen_id": self.kitchen_id,
+            "admin_chat_id": self.admin_chat_id,
+            "text": self.text,
+            "recipients": self.recipients,
+            "progress_message_id": self.progress_message_id,
+            "sent": sorted(self.sent_ids),
+            "failed": sorted(self.failed_ids),
+            "blocked": sorted(self.blocked),
+            "cursor": self.done,
+            "status": self.status,
+            "created_at": self.created_at,
+        }
+
+    @classmethod
+    def from_state(cls, state: dict) -> "BroadcastJob":
+        return cls(
+            job_id=state["job_id"],
+            kitchen_id=state["kitchen_id"],
+            admin_chat_id=state["admin_chat_id"],
+            text=state["text"],
+            recipients=list(state["recipients"]),
+            progress_message_id=state.get("progress_message_id"),
+            sent_ids=set(state.get("sent", [])),
+            failed_ids=set(state.get("failed", [])),
+            blocked=set(state.get("blocked", [])),
+            status=state.get("status", "pending"),
+            created_at=state.get("created_at", time.time()),
+        )
+
+    def progress_text(self) -> str:
+        return (
+            f"🚀 Рассылка идет\n\n"
+            f"Отправлено: {self.sent} / {len(self.recipients)}\n"
+            f"Ошибок: {self.failed}"
+        )
+
+
+_bucket: Optional[TokenBucket] = None
+_chat_limiter = PerChatLimiter(BROADCAST_PER_CHAT_INTERVAL)
+_TASKS: Dict[str, asyncio.Task] = {}
+_JOBS: Dict[str, BroadcastJob] = {}
+
+
+def _get_bucket() -> TokenBucket:
+    # один bucket на процесс (и на бота): лимит Telegram общий для всех рассылок
+    global _bucket
+    if _bucket is None:
+        _bucket = TokenBucket(BROADCAST_RATE)
+    return _bucket
+
+
+async def _send_one(bot, job: BroadcastJob, chat_id: int) -> bool:
+    bucket = _get_bucket()
+
+    for attempt in range(1, BROADCAST_MAX_ATTEMPTS + 1):
+        await bucket.acquire()
+        await _chat_limiter.wait(chat_id)
+
+        try:
+            await bot.send_message(
+                chat_id=chat_id,
+                text=job.text,
+                parse_mode=ParseMode.HTML,
+            )
+            return True
+
+        except RetryAfter as e:
+            log.warning(f"[BROADCAST {job.job_id}] RetryAfter {e.retry_after}s")
+            bucket.pause(float(e.retry_after))
+
+        except Forbidden:
+            job.blocked.add(chat_id)
+            return False
+
+        except BadRequest as e:
+            log.info(f"[BROADCAST {job.job_id}] chat={chat_id} bad request: {e}")
+            return False
+
+        except (TimedOut, NetworkError) as e:
+            log.warning(
+                f"[BROADCAST {job.job_id}] chat={chat_id} attempt={attempt} error={e}"
+            )
+            await asyncio.sleep(min(2 ** attempt, 10))
+
+    return False
+
+
+async def _progress_loop(bot, job: BroadcastJob) -> None:
+    if not job.progress_message_id:
+        return
+
+    last_text = None
+    while job.status == "running":
+        await asyncio.sleep(BROADCAST_PROGRESS_SECONDS)
+        text = job.progress_text()
+        if text == last_text:
+            continue
+        try:
+            await bot.edit_message_text(
+                chat_id=job.admin_chat_id,
+                message_id=job.progress_message_id,
+                text=text,
+            )
+            last_text = text
+        except RetryAfter as e:
+            await asyncio.sleep(float(e.retry_after))
+        except Exception as e:
+            log.debug(f"[BROADCAST {job.job_id}] progress edit failed: {e}")
+
+
+async def _checkpoint(job: BroadcastJob) -> None:
+    try:
+        await asyncio.to_thread(broadcast_store.save_job, job.to_state())
+    except Exception as e:
+        log.error(f"[BROADCAST {job.job_id}] checkpoint failed: {e}")
+
+
+async def _checkpoint_loop(job: BroadcastJob) -> None:
+    last_done = -1
+    while job.status == "running":
+        await asyncio.sleep(BROADCAST_CHECKPOINT_SECONDS)
+        if job.done != last_done:
+            last_done = job.done
+            await _checkpoint(job)
+
+
+async def run_job(bot, job: BroadcastJob) -> BroadcastJob:
+    job.status = "running"
+    job.started_at = time.monotonic()
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for chat_id in job.remaining():
+        queue.put_nowait(chat_id)
+
+    await _checkpoint(job)
+
+    async def worker():
+        while True:
+            try:
+                chat_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                ok = await _send_one(bot, job, chat_id)
+            except Exception as e:
+                log.error(f"[BROADCAST {job.job_id}] chat={chat_id} error={e}")
+                ok = False
+            if ok:
+                job.sent_ids.add(chat_id)
+            else:
+                job.failed_ids.add(chat_id)
+
+    progress = asyncio.create_task(_progress_loop(bot, job))
+    checkpoints = asyncio.create_task(_checkpoint_loop(job))
+
+    try:
+        await asyncio.gather(*(worker() for _ in range(max(1, BROADCAST_CONCURRENCY))))
+        job.status = "done"
+    except asyncio.CancelledError:
+        # остановка бота: сохраняем прогресс, продолжим после рестарта
+        job.status = "interrupted"
+        await _checkpoint(job)
+        raise
+    finally:
+        job.finished_at = time.monotonic()
+        progress.cancel()
+        checkpoints.cancel()
+
+        if job.blocked:
+            try:
+                await asyncio.to_thread(broadcast_store.add_blocked, job.blocked)
+            except Exception as e:
+                log.error(f"[BROADCAST {job.job_id}] blocked save failed: {e}")
+
+        log.info(
+            f"[BROADCAST {job.job_id}] {job.status} kitchen={job.kitchen_id} "
+            f"sent={job.sent} failed={job.failed} blocked={len(job.blocked)} "
+            f"total={len(job.recipients)} "
+            f"duration={job.finished_at - job.started_at:.1f}s"
+        )
+
+    await _report(bot, job)
+    await asyncio.to_thread(broadcast_store.delete_job, job.job_id)
+    return job
+
+
+async def _report(bot, job: BroadcastJob) -> None:
+    try:
+        await bot.send_message(
+            chat_id=job.admin_chat_id,
+            text=(
+                "📊 <b>Рассылка завершена</b>\n\n"
+                f"✅ Отправлено: <b>{job.sent}</b>\n"
+                f"❌ Ошибок: <b>{job.failed}</b>"
+            ),
+            parse_mode=ParseMode.HTML,
+        )
+    except Exception as e:
+        log.error(f"[BROADCAST {job.job_id}] report failed: {e}")
+
+
+def start(bot, job: BroadcastJob) -> asyncio.Task:
+    """
+    Запускает рассылку фоном и сразу возвращает управление хендлеру.
+    """
+    _prune_jobs()
+
+    task = asyncio.create_task(run_job(bot, job))
+    _TASKS[job.job_id] = task
+    _JOBS[job.job_id] = job
+    task.add_done_callback(lambda _: _TASKS.pop(job.job_id, None))
+
+    log.info(
+        f"[BROADCAST {job.job_id}] started kitchen={job.kitchen_id} "
+        f"recipients={len(job.recipients)}"
+    )
+    return task
+
+
+def _prune_jobs() -> None:
+    now = time.monotonic()
+    for job_id, job in list(_JOBS.items()):
+        if (
+            job.status == "done"
+            and job_id not in _TASKS
+            and now - job.finished_at > BROADCAST_JOB_RETENTION_SECONDS
+        ):
+            del _JOBS[job_id]
+
+
+def get_job(job_id: str) -> Optional[BroadcastJob]:
+    _prune_jobs()
+    return _JOBS.get(job_id)
+
+
+def prune_recipients(chat_ids: List[int]) -> List[int]:
+    """
+    Убирает чаты, где бот заблокирован (по прошлым рассылкам).
+    """
+    blocked = broadcast_store.blocked_chats()
+    return [chat_id for chat_id in chat_ids if chat_id not in blocked]
+
+
+async def mark_reachable(chat_id: int) -> None:
+    """
+    Пользователь снова пишет боту: возвращаем его в рассылки.
+    Файл blocked читается/пишется в потоке, не в event loop.
+    """
+    try:
+        await asyncio.to_thread(broadcast_store.remove_blocked, chat_id)
+    except Exception as e:
+        log.error(f"[BROADCAST] unblock failed chat={chat_id}: {e}")
+
+
+def resume_pending(bot) -> int:
+    """
+    Продолжает рассылки, прерванные остановкой/падением (post_init).
+    """
+    resumed = 0
+    for state in broadcast_store.load_jobs():
+        try:
+            job = BroadcastJob.from_state(state)
+        except Exception:
+            log.exception(f"[BROADCAST] cannot restore job {state.get('job_id')}")
+            continue
+
+        if job.job_id in _TASKS:
+            continue
+
+        log.info(
+            f"[BROADCAST {job.job_id}] resuming kitchen={job.kitchen_id} "
+            f"done={job.done}/{len(job.recipients)}"
+        )
+        start(bot, job)
+        resumed += 1
+
+    return resumed
+
+
+async def shutdown() -> None:
+    """
+    Отменяет идущие рассылки (post_shutdown).
+    """
+    tasks = list(_TASKS.values())
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
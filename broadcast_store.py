@@ -0,0 +1,113 @@
+# broadcast_store.py
+"""
+Локальное хранилище рассылок.
+
+Зачем:
+- прогресс рассылки жил только в памяти: рестарт посреди большой рассылки
+  терял, кому уже отправлено, а повтор слал всем заново
+- чаты, заблокировавшие бота, попадали в каждую следующую рассылку
+
+Что хранится (BOT_STATE_DIR, по умолчанию .state/):
+- broadcasts/<job_id>.json: текст, получатели, sent/failed, статус
+- blocked_chats.json: чаты, где бот заблокирован (Forbidden)
+
+Запись атомарная (tmp + os.replace): упавший процесс не оставит битый файл.
+"""
+
+import json
+import logging
+import os
+import threading
+from typing import List, Set
+
+from state_dir import atomic_write_json as _atomic_write, state_path
+
+log = logging.getLogger("BROADCAST_STORE")
+
+
+BROADCASTS_DIR = state_path("broadcasts")
+BLOCKED_PATH = state_path("blocked_chats.json")
+
+_lock = threading.Lock()
+_blocked: Set[int] = set()
+_blocked_loaded = False
+
+
+# -------------------------------------------------
+# Jobs
+# -------------------------------------------------
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(BROADCASTS_DIR, f"{job_id}.json")
+
+
+def save_job(state: dict) -> None:
+    _atomic_write(_job_path(state["job_id"]), state)
+
+
+def delete_job(job_id: str) -> None:
+    try:
+        os.remove(_job_path(job_id))
+    except FileNotFoundError:
+        pass
+
+
+def load_jobs() -> List[dict]:
+    if not os.path.isdir(BROADCASTS_DIR):
+        return []
+
+    jobs = []
+    for name in sorted(os.listdir(BROADCASTS_DIR)):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(BROADCASTS_DIR, name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                jobs.append(json.load(f))
+        except Exception:
+            log.exception(f"[BROADCAST_STORE] broken job file {path}")
+    return jobs
+
+
+# -------------------------------------------------
+# Blocked chats
+# -------------------------------------------------
+
+def _ensure_blocked_loaded() -> None:
+    global _blocked_loaded
+    if _blocked_loaded:
+        return
+    try:
+        with open(BLOCKED_PATH, encoding="utf-8") as f:
+            _blocked.update(int(x) for x in json.load(f))
+    except FileNotFoundError:
+        pass
+    except Exception:
+        log.exception(f"[BROADCAST_STORE] broken {BLOCKED_PATH}")
+    _blocked_loaded = True
+
+
+def blocked_chats() -> Set[int]:
+    with _lock:
+        _ensure_blocked_loaded()
+        return set(_blocked)
+
+
+def add_blocked(chat_ids) -> None:
+    with _lock:
+        _ensure_blocked_loaded()
+        before = len(_blocked)
+        _blocked.update(int(x) for x in chat_ids)
+        if len(_blocked) != before:
+            _atomic_write(BLOCKED_PATH, sorted(_blocked))
+
+
+def remove_blocked(chat_id: int) -> None:
+    """
+    Пользователь снова написал боту (/start): он опять доступен.
+    """
+    with _lock:
+        _ensure_blocked_loaded()
+        if int(chat_id) in _blocked:
+            _blocked.discard(int(chat_id))
+            _atomic_write(BLOCKED_PATH, sorted(_blocked))
@@ -0,0 +1,337 @@
+# catalog_cache.py
+"""
+Кэш каталога товаров по кухням.
+
+Раньше каждый экран каталога, карточка, корзина и превью чекаута
+заново читали products!A2:M (плюс запрос метаданных таблицы).
+
+Теперь:
+- каталог кухни живет в памяти CATALOG_TTL_SECONDS
+- устаревший каталог отдается сразу, а обновляется в фоне
+  (stale-while-revalidate, не дольше CATALOG_MAX_STALE_SECONDS)
+- правки из админки (цена, наличие, описание, фото, новый товар)
+  применяются к кэшу на месте, без перечитывания
+
+Синхронное чтение Sheets остается только для холодной кухни
+(первый заход, если прогрев в post_init не успел/упал).
+
+Каталог хранится как неизменяемый CatalogSnapshot:
+- by_id: product_id -> товар (корзина, карточка, комиссия)
+- by_category: категория -> товары
+Корзина/превью/заказ берут ОДИН снимок и резолвят по нему все строки.
+
+ВАЖНО:
+- loader (main._load_products_from_sheets) бросает исключение при ошибке,
+  пустой каталог из-за сбоя Sheets в кэш не попадает
+- снимок и товары в нем read-only (MappingProxyType),
+  правки админки создают новый снимок
+"""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from config import CATALOG_TTL_SECONDS, CATALOG_MAX_STALE_SECONDS
+
+if TYPE_CHECKING:
+    from kitchen_context import KitchenContext
+
+log = logging.getLogger("CATALOG_CACHE")
+
+
+Loader = Callable[["KitchenContext"], List[dict]]
+
+
+# -------------------------------------------------
+# Snapshot
+# -------------------------------------------------
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    kitchen_id: str
+    products: Tuple[Mapping, ...]
+    by_id: Mapping[str, Mapping]
+    by_category: Mapping[str, Tuple[Mapping, ...]]
+
+    @classmethod
+    def build(cls, kitchen_id: str, products: Iterable[dict]) -> "CatalogSnapshot":
+        frozen = tuple(MappingProxyType(dict(p)) for p in products)
+
+        by_id: Dict[str, Mapping] = {}
+        by_category: Dict[str, list] = {}
+        for p in frozen:
+            # дубли product_id: как и линейный поиск раньше, берем первый
+            by_id.setdefault(p["product_id"], p)
+            by_category.setdefault(p.get("category"), []).append(p)
+
+        return cls(
+            kitchen_id=kitchen_id,
+            products=frozen,
+            by_id=MappingProxyType(by_id),
+            by_category=MappingProxyType({
+                cat: tuple(items) for cat, items in by_category.items()
+            }),
+        )
+
+    def get(self, product_id: str) -> Optional[Mapping]:
+        return self.by_id.get(product_id)
+
+    def in_category(self, category: str, *, available_only: bool = True) -> Tuple[Mapping, ...]:
+        items = self.by_category.get(category, ())
+        if available_only:
+            return tuple(p for p in items if p["available"])
+        return items
+
+    def categories(self) -> List[str]:
+        return sorted({
+            p["category"]
+            for p in self.products
+            if p["available"] and p.get("category")
+        })
+
+    def resolve_cart(self, cart: Dict[str, int]) -> List[Tuple[Mapping, int]]:
+        """
+        Строки корзины -> [(товар, qty)], неизвестные товары пропускаются.
+        """
+        lines = []
+        for pid, qty in cart.items():
+            p = self.by_id.get(pid)
+            if p:
+                lines.append((p, qty))
+        return lines
+
+    def with_product(self, product_id: str, **fields) -> Optional["CatalogSnapshot"]:
+        p = self.by_id.get(product_id)
+        if p is None:
+            return None
+        return CatalogSnapshot.build(
+            self.kitchen_id,
+            ({**x, **fields} if x["product_id"] == product_id else x for x in self.products),
+        )
+
+    def with_added(self, product: dict) -> "CatalogSnapshot":
+        return CatalogSnapshot.build(self.kitchen_id, (*self.products, product))
+
+
+EMPTY = CatalogSnapshot.build("", ())
+
+
+@dataclass
+class _Entry:
+    snapshot: CatalogSnapshot
+    loaded_at: float
+    refreshing: bool = False
+    version: int = field(default=0)
+
+
+_lock = threading.Lock()
+_CACHE: Dict[str, _Entry] = {}
+
+_STATS = {
+    "hits": 0,
+    "stale_hits": 0,
+    "misses": 0,
+    "loads": 0,
+    "load_errors": 0,
+}
+
+
+# -------------------------------------------------
+# Чтение
+# -------------------------------------------------
+
+def get_products(kitchen: "KitchenContext", loader: Loader) -> List[Mapping]:
+    return list(get_snapshot(kitchen, loader).products)
+
+
+def get_snapshot(kitchen: "KitchenContext", loader: Loader) -> CatalogSnapshot:
+    """
+    Снимок каталога кухни из кэша.
+    Свежий -> сразу; устаревший -> сразу + фоновое обновление;
+    нет/слишком старый -> синхронная загрузка.
+    """
+    key = kitchen.kitchen_id
+    now = time.monotonic()
+
+    with _lock:
+        entry = _CACHE.get(key)
+
+        if entry is not None:
+            age = now - entry.loaded_at
+
+            if age < CATALOG_TTL_SECONDS:
+                _STATS["hits"] += 1
+                return entry.snapshot
+
+            if age < CATALOG_TTL_SECONDS + CATALOG_MAX_STALE_SECONDS:
+                _STATS["stale_hits"] += 1
+                schedule = not entry.refreshing
+                entry.refreshing = True
+                snapshot = entry.snapshot
+            else:
+                schedule = False
+                snapshot = None
+        else:
+            schedule = False
+            snapshot = None
+
+        if snapshot is None:
+            _STATS["misses"] += 1
+
+    if snapshot is not None:
+        if schedule:
+            _schedule_refresh(kitchen, loader)
+        return snapshot
+
+    loaded = refresh(kitchen, loader)
+    if loaded is not None:
+        return loaded
+
+    # Sheets недоступен: лучше очень старый каталог, чем пустой
+    with _lock:
+        entry = _CACHE.get(key)
+        return entry.snapshot if entry else EMPTY
+
+
+def refresh(kitchen: "KitchenContext", loader: Loader) -> Optional[CatalogSnapshot]:
+    """
+    Перечитывает каталог кухни (блокирующий).
+    При ошибке кэш не трогает и возвращает None.
+    """
+    key = kitchen.kitchen_id
+
+    with _lock:
+        entry = _CACHE.get(key)
+        version = entry.version if entry else 0
+
+    try:
+        products = loader(kitchen)
+    except Exception:
+        with _lock:
+            _STATS["load_errors"] += 1
+            entry = _CACHE.get(key)
+            if entry:
+                entry.refreshing = False
+        log.exception(
+            f"[CATALOG_CACHE] load failed kitchen_id={key} "
+            f"spreadsheet_id={kitchen.spreadsheet_id}"
+        )
+        return None
+
+    with _lock:
+        _STATS["loads"] += 1
+        entry = _CACHE.get(key)
+
+        # пока читали, админка успела поменять товар -> наш снимок старее,
+        # оставляем кэш как есть, следующее обновление подтянет все
+        if entry is not None and entry.version != version:
+            entry.refreshing = False
+            log.info(f"[CATALOG_CACHE] refresh discarded (edited) kitchen_id={key}")
+            return entry.snapshot
+
+        snapshot = CatalogSnapshot.build(key, products)
+        _CACHE[key] = _Entry(
+            snapshot=snapshot,
+            loaded_at=time.monotonic(),
+            version=version,
+        )
+
+    log.info(f"[CATALOG_CACHE] loaded kitchen_id={key} products={len(products)}")
+    return snapshot
+
+
+def _schedule_refresh(kitchen: "KitchenContext", loader: Loader) -> None:
+    import sheets_async
+    import sheets_limiter
+
+    try:
+        with sheets_limiter.background():
+            sheets_async.submit(refresh, kitchen, loader)
+    except Exception:
+        with _lock:
+            entry = _CACHE.get(kitchen.kitchen_id)
+            if entry:
+                entry.refreshing = False
+        log.exception(
+            f"[CATALOG_CACHE] refresh schedule failed kitchen_id={kitchen.kitchen_id}"
+        )
+
+
+def warm_up(kitchens: List["KitchenContext"], loader: Loader) -> int:
+    """
+    Прогрев кэша при старте. Возвращает количество загруженных кухонь.
+    """
+    loaded = 0
+    for kitchen in kitchens:
+        if refresh(kitchen, loader) is not None:
+            loaded += 1
+    return loaded
+
+
+# -------------------------------------------------
+# Write-through (правки из админки)
+# -------------------------------------------------
+
+def update_product(kitchen: "KitchenContext", product_id: str, **fields) -> bool:
+    """
+    Применяет изменение товара к кэшу на месте.
+    Если товара в кэше нет, кэш кухни сбрасывается.
+    """
+    key = kitchen.kitchen_id
+
+    with _lock:
+        entry = _CACHE.get(key)
+        if entry is None:
+            return False
+
+        entry.version += 1
+
+        # снимок заменяем целиком: уже выданные снимки не меняются
+        snapshot = entry.snapshot.with_product(product_id, **fields)
+        if snapshot is None:
+            _CACHE.pop(key, None)
+            return False
+
+        entry.snapshot = snapshot
+        return True
+
+
+def add_product(kitchen: "KitchenContext", product: dict) -> None:
+    key = kitchen.kitchen_id
+
+    with _lock:
+        entry = _CACHE.get(key)
+        if entry is None:
+            return
+
+        entry.version += 1
+        entry.snapshot = entry.snapshot.with_added(product)
+
+
+def invalidate(kitchen: Optional["KitchenContext"] = None) -> None:
+    """
+    Сбрасывает кэш кухни (или весь кэш).
+    """
+    with _lock:
+        if kitchen is None:
+            _CACHE.clear()
+        else:
+            _CACHE.pop(kitchen.kitchen_id, None)
+
+
+def cache_stats() -> dict:
+    now = time.monotonic()
+    with _lock:
+        return {
+            **_STATS,
+            "kitchens": {
+                key: {
+                    "products": len(entry.snapshot.products),
+                    "age": round(now - entry.loaded_at, 1),
+                }
+                for key, entry in _CACHE.items()
+            },
+        }
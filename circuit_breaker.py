@@ -0,0 +1,167 @@
+# circuit_breaker.py
+"""
+Circuit breaker для внешних интеграций (Web API, курьерка).
+
+Раньше, когда Web API на Railway тормозил или лежал, каждый чекаут и каждая
+задача курьера ждали полный таймаут httpx (5-10 с) и только потом падали.
+Запросы копились, бот отвечал все медленнее.
+
+Теперь у каждого upstream свой breaker:
+- closed: запросы идут, ошибки считаются подряд
+- CIRCUIT_FAILURE_THRESHOLD ошибок подряд -> open: вызов сразу CircuitOpenError
+- через CIRCUIT_RESET_SECONDS -> half-open: пропускаем ОДИН пробный запрос,
+  успех -> closed, ошибка -> снова open
+
+Ошибка = исключение (сеть, таймаут) или HTTP 5xx. 4xx не считается:
+upstream жив, это проблема запроса.
+
+Пороги на upstream: CIRCUIT_<NAME>_FAILURE_THRESHOLD / CIRCUIT_<NAME>_RESET_SECONDS,
+NAME = имя breaker'а в верхнем регистре с "_" вместо "." (WEBAPI_ADDRESS_CHECK).
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+log = logging.getLogger("CIRCUIT_BREAKER")
+
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"circuit {name} is open, retry in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class _Call:
+    """
+    Результат одного вызова внутри guard(): 5xx отмечается через status().
+    """
+
+    def __init__(self):
+        self.failed = False
+
+    def status(self, status_code: int) -> None:
+        if status_code >= 500:
+            self.failed = True
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+
+    def before_call(self) -> None:
+        """
+        Пропускает вызов или бросает CircuitOpenError.
+        """
+        if self.state == CLOSED:
+            return
+
+        if self.state == OPEN:
+            elapsed = time.monotonic() - self.opened_at
+            if elapsed < self.reset_seconds:
+                self.rejected += 1
+                raise CircuitOpenError(self.name, self.reset_seconds - elapsed)
+            self.state = HALF_OPEN
+            log.info(f"[CIRCUIT] {self.name} half-open, probing")
+
+        # half-open: один пробный запрос за раз
+        if self._probe_in_flight:
+            self.rejected += 1
+            raise CircuitOpenError(self.name, 0)
+        self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        if self.state != CLOSED:
+            log.info(f"[CIRCUIT] {self.name} closed")
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self._probe_in_flight = False
+        self.failures += 1
+
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != OPEN:
+                log.error(
+                    f"[CIRCUIT] {self.name} OPEN after {self.failures} failures, "
+                    f"fast-fail for {self.reset_seconds}s"
+                )
+            self.state = OPEN
+            self.opened_at = time.monotonic()
+
+    @contextmanager
+    def guard(self):
+        """
+        with breaker.guard() as call:
+            resp = await client.post(...)
+            call.status(resp.status_code)
+
+        Исключение внутри (в т.ч. таймаут) = ошибка upstream.
+        Отмена задачи (CancelledError: пользователь ушел, остановка бота)
+        ничего не говорит об upstream и не считается.
+        """
+        self.before_call()
+        call = _Call()
+        try:
+            yield call
+        except asyncio.CancelledError:
+            self._probe_in_flight = False
+            raise
+        except BaseException:
+            self.record_failure()
+            raise
+        if call.failed:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def snapshot(self) -> dict:
+        return {
+            "state": self.state,
+            "failures": self.failures,
+            "rejected": self.rejected,
+        }
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+
+
+def get(name: str) -> CircuitBreaker:
+    breaker = _BREAKERS.get(name)
+    if breaker is None:
+        env = name.upper().replace(".", "_")
+        breaker = CircuitBreaker(
+            name,
+            failure_threshold=int(os.getenv(
+                f"CIRCUIT_{env}_FAILURE_THRESHOLD", str(CIRCUIT_FAILURE_THRESHOLD)
+            )),
+            reset_seconds=float(os.getenv(
+                f"CIRCUIT_{env}_RESET_SECONDS", str(CIRCUIT_RESET_SECONDS)
+            )),
+        )
+        _BREAKERS[name] = breaker
+    return breaker
+
+
+def breaker_stats() -> Dict[str, dict]:
+    return {name: b.snapshot() for name, b in _BREAKERS.items()}
@@ -28,7 +28,26 @@ SPREADSHEET_ID = PLATFORM_SPREADSHEET_ID
 # ranges
 ORDERS_RANGE = "orders!A:AF"
 
+# ====== ORDERS POLLING ======
+# пауза между циклами опроса кухонь и сколько кухонь опрашиваем одновременно
+ORDERS_POLL_INTERVAL = float(os.getenv("ORDERS_POLL_INTERVAL", "5"))
+ORDERS_POLL_CONCURRENCY = int(os.getenv("ORDERS_POLL_CONCURRENCY", "4"))
+
+# ====== ORDERS INGEST (push от Web API) ======
+# без ключа endpoint не поднимается, работает только опрос
+INGEST_API_KEY = os.getenv("INGEST_API_KEY", "")
+INGEST_HOST = os.getenv("INGEST_HOST", "0.0.0.0")
+INGEST_PORT = int(os.getenv("INGEST_PORT", os.getenv("PORT", "8080")))
+# при включенном push опрос остается страховкой и идет редко
+ORDERS_SAFETY_POLL_INTERVAL = float(os.getenv("ORDERS_SAFETY_POLL_INTERVAL", "60"))
+
 # ====== WEB API ======
 WEB_API_BASE_URL = "https://web-api-integration-production.up.railway.app"
 WEB_API_KEY = "DEV_KEY"
 WEB_API_TIMEOUT = 5
+
+# ====== CACHES ======
+# каталог кухни: сколько считаем свежим и сколько еще отдаем устаревшим,
+# пока он обновляется в фоне (stale-while-revalidate)
+CATALOG_TTL_SECONDS = int(os.getenv("CATALOG_TTL_SECONDS", "60"))
+CATALOG_MAX_STALE_SECONDS = int(os.getenv("CATALOG_MAX_STALE_SECONDS", "3600"))
@@ -2,9 +2,12 @@
 
 import os
 import logging
-import httpx
 import json
 
+import circuit_breaker
+import http_clients
+from circuit_breaker import CircuitOpenError
+
 log = logging.getLogger("COURIER_API")
 
 COURIER_API_URL = os.getenv("COURIER_API_URL", "")
@@ -28,14 +31,16 @@ async def courier_create_order(payload: dict) -> dict:
         }
 
     try:
-        async with httpx.AsyncClient(timeout=COURIER_API_TIMEOUT) as client:
-            resp = await client.post(
+        with circuit_breaker.get("courier.create").guard() as call:
+            resp = await http_clients.get_client().post(
                 f"{COURIER_API_URL}/api/v1/orders",
                 json=payload,
                 headers={
                     "X-API-KEY": API_KEY,
                 },
+                timeout=COURIER_API_TIMEOUT,
             )
+            call.status(resp.status_code)
 
         if resp.status_code != 200:
             log.error(
@@ -50,6 +55,10 @@ async def courier_create_order(payload: dict) -> dict:
 
         return resp.json()
 
+    except CircuitOpenError as e:
+        log.warning(f"COURIER create_order fast-fail: {e}")
+        return {"status": "error", "reason": "circuit_open"}
+
     except Exception as e:
         log.exception(f"COURIER create_order exception: {e}")
         return {"status": "error", "reason": "exception"}
@@ -0,0 +1,315 @@
+# courier_queue.py
+"""
+Очередь вызова курьера (ETA кухни -> Web API -> Sheets -> покупатель).
+
+Раньше on_staff_eta делал все прямо в хендлере: чтение строки, запись ETA,
+перечитывание строки, send_to_courier_and_persist (два запроса в Web API),
+поиск покупателя и сообщение ему. Кухня ждала ответа на кнопку секунды.
+
+Теперь:
+- клик ETA только кладет задачу в локальную SQLite (BOT_STATE_DIR/courier_jobs.sqlite3)
+- одна задача на order_id: повторный клик / двойное нажатие не создают второй
+  (кроме dead: новая постановка или requeue() запускают ее заново)
+- COURIER_QUEUE_WORKERS воркеров разбирают очередь в фоне
+- ошибка -> повтор с экспоненциальной задержкой
+  (COURIER_QUEUE_BACKOFF_BASE * 2^n, не больше COURIER_QUEUE_BACKOFF_MAX),
+  после COURIER_QUEUE_MAX_ATTEMPTS задача помечается dead и зовется on_dead
+- задачи переживают рестарт: running после падения снова становятся queued
+
+ВАЖНО:
+- обработчик получает job.state и отмечает пройденные шаги через checkpoint(),
+  чтобы повтор не делал уже сделанное (например, второе сообщение покупателю)
+- очередь только локальная: один процесс бота на один BOT_STATE_DIR
+- enqueue/requeue зовутся из потоков (asyncio.to_thread): воркеров будим
+  через call_soon_threadsafe, asyncio.Event не thread-safe
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, Optional
+
+from state_dir import state_path
+
+log = logging.getLogger("COURIER_QUEUE")
+
+
+COURIER_QUEUE_WORKERS = int(os.getenv("COURIER_QUEUE_WORKERS", "2"))
+COURIER_QUEUE_MAX_ATTEMPTS = int(os.getenv("COURIER_QUEUE_MAX_ATTEMPTS", "8"))
+COURIER_QUEUE_BACKOFF_BASE = float(os.getenv("COURIER_QUEUE_BACKOFF_BASE", "2"))
+COURIER_QUEUE_BACKOFF_MAX = float(os.getenv("COURIER_QUEUE_BACKOFF_MAX", "300"))
+
+DB_PATH = state_path("courier_jobs.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS courier_jobs (
+    order_id        TEXT PRIMARY KEY,
+    kitchen_id      TEXT NOT NULL,
+    payload         TEXT NOT NULL,
+    state           TEXT NOT NULL DEFAULT '{}',
+    status          TEXT NOT NULL DEFAULT 'queued',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error      TEXT NOT NULL DEFAULT '',
+    created_at      REAL NOT NULL,
+    updated_at      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS courier_jobs_due
+    ON courier_jobs (status, next_attempt_at);
+"""
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+_wakeup: Optional[asyncio.Event] = None
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+@dataclass
+class CourierJob:
+    order_id: str
+    kitchen_id: str
+    payload: dict
+    attempts: int
+    state: dict = field(default_factory=dict)
+
+
+# -------------------------------------------------
+# SQLite
+# -------------------------------------------------
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+        _conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(_SCHEMA)
+    return _conn
+
+
+def _wake() -> None:
+    if _loop is not None and _wakeup is not None:
+        _loop.call_soon_threadsafe(_wakeup.set)
+
+
+def enqueue(order_id: str, kitchen_id: str, payload: dict) -> bool:
+    """
+    Ставит вызов курьера в очередь.
+    False, если задача на этот order_id уже есть и она не dead.
+    Dead-задача перезапускается с новым payload; state (пройденные шаги) остается.
+    """
+    now = time.time()
+    with _lock:
+        cur = _db().execute(
+            "INSERT INTO courier_jobs "
+            "(order_id, kitchen_id, payload, next_attempt_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (order_id) DO UPDATE SET "
+            "kitchen_id = excluded.kitchen_id, payload = excluded.payload, "
+            "status = 'queued', attempts = 0, last_error = '', "
+            "next_attempt_at = excluded.next_attempt_at, updated_at = excluded.updated_at "
+            "WHERE courier_jobs.status = 'dead'",
+            (str(order_id), str(kitchen_id), json.dumps(payload, ensure_ascii=False), now, now, now),
+        )
+        created = cur.rowcount == 1
+
+    if created:
+        log.info(f"[COURIER_QUEUE] enqueued order={order_id} kitchen={kitchen_id}")
+        _wake()
+    else:
+        log.info(f"[COURIER_QUEUE] duplicate ignored order={order_id}")
+    return created
+
+
+def requeue(order_id: str) -> bool:
+    """
+    Dead-задача -> снова в очередь с тем же payload (кнопка «повторить»).
+    False, если задачи нет или она не dead.
+    """
+    now = time.time()
+    with _lock:
+        cur = _db().execute(
+            "UPDATE courier_jobs SET status = 'queued', attempts = 0, last_error = '', "
+            "next_attempt_at = ?, updated_at = ? WHERE order_id = ? AND status = 'dead'",
+            (now, now, str(order_id)),
+        )
+        requeued = cur.rowcount == 1
+
+    if requeued:
+        log.info(f"[COURIER_QUEUE] requeued order={order_id}")
+        _wake()
+    return requeued
+
+
+def _claim() -> Optional[CourierJob]:
+    now = time.time()
+    with _lock:
+        db = _db()
+        row = db.execute(
+            "SELECT order_id, kitchen_id, payload, state, attempts FROM courier_jobs "
+            "WHERE status = 'queued' AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at LIMIT 1",
+            (now,),
+        ).fetchone()
+        if row is None:
+            return None
+
+        db.execute(
+            "UPDATE courier_jobs SET status = 'running', attempts = attempts + 1, "
+            "updated_at = ? WHERE order_id = ?",
+            (now, row[0]),
+        )
+
+    return CourierJob(
+        order_id=row[0],
+        kitchen_id=row[1],
+        payload=json.loads(row[2]),
+        state=json.loads(row[3]),
+        attempts=row[4] + 1,
+    )
+
+
+def checkpoint(order_id: str, **state) -> None:
+    """
+    Отмечает пройденные шаги задачи (повтор их пропустит).
+    """
+    with _lock:
+        db = _db()
+        row = db.execute(
+            "SELECT state FROM courier_jobs WHERE order_id = ?", (str(order_id),)
+        ).fetchone()
+        if row is None:
+            return
+        merged = {**json.loads(row[0]), **state}
+        db.execute(
+            "UPDATE courier_jobs SET state = ?, updated_at = ? WHERE order_id = ?",
+            (json.dumps(merged, ensure_ascii=False), time.time(), str(order_id)),
+        )
+
+
+def _finish(order_id: str) -> None:
+    with _lock:
+        _db().execute(
+            "UPDATE courier_jobs SET status = 'done', last_error = '', updated_at = ? "
+            "WHERE order_id = ?",
+            (time.time(), order_id),
+        )
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(COURIER_QUEUE_BACKOFF_MAX, COURIER_QUEUE_BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def _fail(job: CourierJob, error: str) -> str:
+    now = time.time()
+    status = "dead" if job.attempts >= COURIER_QUEUE_MAX_ATTEMPTS else "queued"
+    with _lock:
+        _db().execute(
+            "UPDATE courier_jobs SET status = ?, next_attempt_at = ?, last_error = ?, "
+            "updated_at = ? WHERE order_id = ?",
+            (status, now + _backoff(job.attempts), error[:500], now, job.order_id),
+        )
+    return status
+
+
+def _recover() -> int:
+    """
+    running после падения процесса -> снова в очередь.
+    """
+    with _lock:
+        cur = _db().execute(
+            "UPDATE courier_jobs SET status = 'queued', updated_at = ? "
+            "WHERE status = 'running'",
+            (time.time(),),
+        )
+        return cur.rowcount
+
+
+def queue_stats() -> Dict[str, int]:
+    with _lock:
+        rows = _db().execute(
+            "SELECT status, COUNT(*) FROM courier_jobs GROUP BY status"
+        ).fetchall()
+    return {status: count for status, count in rows}
+
+
+# -------------------------------------------------
+# Workers
+# -------------------------------------------------
+
+Handler = Callable[[object, CourierJob], Awaitable[None]]
+DeadHandler = Callable[[object, CourierJob, str], Awaitable[None]]
+
+
+async def _worker(app, handler: Handler, on_dead: Optional[DeadHandler], n: int) -> None:
+    while app.running:
+        job = await asyncio.to_thread(_claim)
+
+        if job is None:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=1.0)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        log.info(
+            f"[COURIER_QUEUE] worker={n} start order={job.order_id} attempt={job.attempts}"
+        )
+        try:
+            await handler(app.bot, job)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            status = await asyncio.to_thread(_fail, job, error)
+            if status == "dead":
+                log.exception(
+                    f"[COURIER_QUEUE] order={job.order_id} gave up after {job.attempts} attempts"
+                )
+                if on_dead is not None:
+                    try:
+                        await on_dead(app.bot, job, error)
+                    except Exception:
+                        log.exception(f"[COURIER_QUEUE] on_dead failed order={job.order_id}")
+            else:
+                log.warning(
+                    f"[COURIER_QUEUE] order={job.order_id} attempt={job.attempts} failed: {e}"
+                )
+            continue
+
+        await asyncio.to_thread(_finish, job.order_id)
+        log.info(f"[COURIER_QUEUE] done order={job.order_id}")
+
+
+async def courier_queue_loop(
+    app,
+    handler: Handler,
+    *,
+    on_dead: Optional[DeadHandler] = None,
+    workers: int = COURIER_QUEUE_WORKERS,
+) -> None:
+    """
+    Воркеры очереди (app.create_task из post_init).
+    Выходят, когда приложение останавливается; недоделанное продолжится после рестарта.
+    on_dead(bot, job, error) — задача исчерпала попытки (алерт стаффу).
+    """
+    global _wakeup, _loop
+    _wakeup = asyncio.Event()
+    _loop = asyncio.get_running_loop()
+
+    recovered = await asyncio.to_thread(_recover)
+    if recovered:
+        log.info(f"[COURIER_QUEUE] recovered interrupted jobs={recovered}")
+
+    while not app.running:
+        await asyncio.sleep(0.5)
+
+    log.info(f"[COURIER_QUEUE] workers={workers} stats={queue_stats()}")
+    await asyncio.gather(*(_worker(app, handler, on_dead, n) for n in range(workers)))
@@ -0,0 +1,392 @@
+# fake_sheets_server.py
+"""
+Локальная замена Google Sheets API v4 для нагрузочных тестов.
+
+Раньше померить пропускную способность бота было нельзя: любой путь
+шел в настоящий Google Sheets (квоты, сеть, боевые таблицы).
+
+Здесь подмножество REST API, которым пользуется бот:
+- GET  /v4/spreadsheets/{id}/values/{range}            values.get
+- PUT  /v4/spreadsheets/{id}/values/{range}            values.update
+- POST /v4/spreadsheets/{id}/values:batchUpdate        values.batchUpdate
+- POST /v4/spreadsheets/{id}/values/{range}:append     values.append
+- GET  /v4/spreadsheets/{id}                           spreadsheets.get
+
+Данные в памяти. Неизвестная таблица создается на лету с листами
+FAKE_SHEETS_TABS; начальные данные: FAKE_SHEETS_DATA=<path.json>
+в формате {"<spreadsheet_id>": {"orders": [[...], ...], ...}}.
+
+Искажения (env или POST /_fake/config):
+- FAKE_SHEETS_LATENCY_MS / FAKE_SHEETS_JITTER_MS: задержка каждого ответа
+- FAKE_SHEETS_ERROR_RATE: доля ответов 429 RESOURCE_EXHAUSTED
+- FAKE_SHEETS_QUOTA_PER_MINUTE: лимит запросов в минуту на таблицу
+  (как квота Google), сверх него 429
+
+Запуск:
+
+    python fake_sheets_server.py
+    SHEETS_API_ENDPOINT=http://127.0.0.1:8099/ python main.py
+
+GET /_fake/stats: счетчики, p50/p95 задержки; POST /_fake/reset: очистка.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from sheets_a1 import col_idx, col_letters
+
+log = logging.getLogger("FAKE_SHEETS")
+
+
+FAKE_SHEETS_HOST = os.getenv("FAKE_SHEETS_HOST", "127.0.0.1")
+FAKE_SHEETS_PORT = int(os.getenv("FAKE_SHEETS_PORT", "8099"))
+FAKE_SHEETS_TABS = [
+    t.strip()
+    for t in os.getenv("FAKE_SHEETS_TABS", "orders,users,products,kitchen").split(",")
+    if t.strip()
+]
+FAKE_SHEETS_DATA = os.getenv("FAKE_SHEETS_DATA", "")
+
+_config = {
+    "latency_ms": float(os.getenv("FAKE_SHEETS_LATENCY_MS", "0")),
+    "jitter_ms": float(os.getenv("FAKE_SHEETS_JITTER_MS", "0")),
+    "error_rate": float(os.getenv("FAKE_SHEETS_ERROR_RATE", "0")),
+    "quota_per_minute": int(os.getenv("FAKE_SHEETS_QUOTA_PER_MINUTE", "0")),
+}
+
+_ROW_LIMIT = 10 ** 7
+
+# "'My tab'!A2:M" / "orders!C1" / "orders!A:A" / "orders"
+_A1_RE = re.compile(
+    r"^(?:'?(?P<sheet>[^'!]+)'?!)?"
+    r"(?:(?P<c1>[A-Z]*)(?P<r1>\d*)(?::(?P<c2>[A-Z]*)(?P<r2>\d*))?)?$"
+)
+
+
+class ApiError(Exception):
+    def __init__(self, code: int, status: str, message: str):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.message = message
+
+
+# -------------------------------------------------
+# Данные
+# -------------------------------------------------
+
+class _Book:
+    def __init__(self, spreadsheet_id: str, tabs: Optional[Dict[str, List[list]]] = None):
+        self.spreadsheet_id = spreadsheet_id
+        self.tabs: Dict[str, List[list]] = {name: [] for name in FAKE_SHEETS_TABS}
+        for name, rows in (tabs or {}).items():
+            self.tabs[name] = [list(r) for r in rows]
+
+    def parse(self, a1: str) -> Tuple[str, int, int, int, int]:
+        """
+        -> (sheet, row_from, col_from, row_to, col_to), 0-based, включительно.
+        """
+        m = _A1_RE.match(a1 or "")
+        if not m:
+            raise ApiError(400, "INVALID_ARGUMENT", f"Unable to parse range: {a1}")
+
+        sheet = m.group("sheet") or next(iter(self.tabs), "")
+        if sheet not in self.tabs:
+            raise ApiError(400, "INVALID_ARGUMENT", f"Unable to parse range: {a1}")
+
+        c1, r1 = m.group("c1") or "", m.group("r1") or ""
+        c2, r2 = m.group("c2"), m.group("r2")
+        if c2 is None:            # одна ячейка "C1" или весь лист
+            c2, r2 = c1, r1
+
+        return (
+            sheet,
+            int(r1) - 1 if r1 else 0,
+            col_idx(c1) if c1 else 0,
+            int(r2) - 1 if r2 else _ROW_LIMIT,
+            col_idx(c2) if c2 else _ROW_LIMIT,
+        )
+
+    def read(self, a1: str) -> List[list]:
+        sheet, r1, c1, r2, c2 = self.parse(a1)
+        out = []
+        for row in self.tabs[sheet][r1:r2 + 1]:
+            cells = [_formatted(v) for v in row[c1:c2 + 1]]
+            while cells and cells[-1] == "":
+                cells.pop()
+            out.append(cells)
+        while out and not out[-1]:
+            out.pop()
+        return out
+
+    def write(self, a1: str, values: List[list]) -> dict:
+        sheet, r1, c1, _, _ = self.parse(a1)
+        rows = self.tabs[sheet]
+        cells = 0
+        width = 0
+        for i, new in enumerate(values):
+            while len(rows) <= r1 + i:
+                rows.append([])
+            row = rows[r1 + i]
+            if len(row) < c1 + len(new):
+                row.extend([""] * (c1 + len(new) - len(row)))
+            for j, v in enumerate(new):
+                row[c1 + j] = "" if v is None else v
+            cells += len(new)
+            width = max(width, len(new))
+        end_col = col_letters(c1 + max(width, 1) - 1)
+        return {
+            "spreadsheetId": self.spreadsheet_id,
+            "updatedRange": f"{sheet}!{col_letters(c1)}{r1 + 1}:{end_col}{r1 + max(len(values), 1)}",
+            "updatedRows": len(values),
+            "updatedColumns": width,
+            "updatedCells": cells,
+        }
+
+    def append(self, a1: str, values: List[list]) -> dict:
+        sheet, _, c1, _, _ = self.parse(a1)
+        rows = self.tabs[sheet]
+        last = len(rows)
+        while last and not any(v not in ("", None) for v in rows[last - 1]):
+            last -= 1
+        col = col_letters(c1)
+        updates = self.write(f"{sheet}!{col}{last + 1}", values)
+        return {
+            "spreadsheetId": self.spreadsheet_id,
+            "tableRange": f"{sheet}!{col}1:{col}{last}" if last else "",
+            "updates": updates,
+        }
+
+    def meta(self) -> dict:
+        return {
+            "spreadsheetId": self.spreadsheet_id,
+            "properties": {"title": f"fake {self.spreadsheet_id}"},
+            "sheets": [
+                {
+                    "properties": {
+                        "sheetId": i,
+                        "title": name,
+                        "index": i,
+                        "gridProperties": {
+                            "rowCount": max(1000, len(rows)),
+                            "columnCount": max([26] + [len(r) for r in rows]),
+                        },
+                    },
+                }
+                for i, (name, rows) in enumerate(self.tabs.items())
+            ],
+        }
+
+
+def _formatted(v) -> str:
+    # valueRenderOption=FORMATTED_VALUE: Google отдает строки
+    if v is None:
+        return ""
+    if isinstance(v, bool):
+        return "TRUE" if v else "FALSE"
+    return str(v)
+
+
+_lock = threading.Lock()
+_BOOKS: Dict[str, _Book] = {}
+
+
+def _book(spreadsheet_id: str) -> _Book:
+    book = _BOOKS.get(spreadsheet_id)
+    if book is None:
+        book = _BOOKS[spreadsheet_id] = _Book(spreadsheet_id)
+    return book
+
+
+def seed(data: Dict[str, Dict[str, List[list]]]) -> None:
+    with _lock:
+        for spreadsheet_id, tabs in data.items():
+            _BOOKS[spreadsheet_id] = _Book(spreadsheet_id, tabs)
+
+
+def reset() -> None:
+    with _lock:
+        _BOOKS.clear()
+        _STATS.clear()
+        _QUOTA.clear()
+        _LATENCY.clear()
+
+
+# -------------------------------------------------
+# Искажения и статистика
+# -------------------------------------------------
+
+_STATS: Dict[str, int] = defaultdict(int)
+_QUOTA: Dict[str, Deque[float]] = defaultdict(deque)
+_LATENCY: Deque[float] = deque(maxlen=5000)
+
+
+async def _gate(spreadsheet_id: str, method: str) -> None:
+    _STATS[method] += 1
+
+    delay = _config["latency_ms"] + random.uniform(0, _config["jitter_ms"])
+    if delay > 0:
+        await asyncio.sleep(delay / 1000)
+
+    limit = _config["quota_per_minute"]
+    if limit:
+        now = time.monotonic()
+        window = _QUOTA[spreadsheet_id]
+        while window and now - window[0] > 60:
+            window.popleft()
+        if len(window) >= limit:
+            _STATS["quota_429"] += 1
+            raise ApiError(
+                429,
+                "RESOURCE_EXHAUSTED",
+                "Quota exceeded for quota metric 'Read requests' and limit "
+                "'Read requests per minute per user'",
+            )
+        window.append(now)
+
+    if _config["error_rate"] and random.random() < _config["error_rate"]:
+        _STATS["injected_429"] += 1
+        raise ApiError(429, "RESOURCE_EXHAUSTED", "Injected rate limit")
+
+
+def _percentile(samples: List[float], p: float) -> float:
+    return round(samples[min(len(samples) - 1, int(len(samples) * p))], 1)
+
+
+def fake_stats() -> dict:
+    samples = sorted(_LATENCY)
+    latency = {}
+    if samples:
+        latency = {
+            "p50_ms": _percentile(samples, 0.5),
+            "p95_ms": _percentile(samples, 0.95),
+            "p99_ms": _percentile(samples, 0.99),
+            "max_ms": round(samples[-1], 1),
+        }
+    return {
+        "requests": dict(_STATS),
+        "latency": latency,
+        "config": dict(_config),
+        "spreadsheets": len(_BOOKS),
+    }
+
+
+# -------------------------------------------------
+# API
+# -------------------------------------------------
+
+def create_app() -> FastAPI:
+    api = FastAPI(title="fake-sheets", docs_url=None, redoc_url=None)
+
+    @api.middleware("http")
+    async def timing(request: Request, call_next):
+        started = time.monotonic()
+        response = await call_next(request)
+        if request.url.path.startswith("/v4/"):
+            _LATENCY.append((time.monotonic() - started) * 1000)
+        return response
+
+    @api.exception_handler(ApiError)
+    async def api_error(request: Request, exc: ApiError):
+        return JSONResponse(
+            status_code=exc.code,
+            content={"error": {"code": exc.code, "message": exc.message, "status": exc.status}},
+        )
+
+    @api.get("/v4/spreadsheets/{spreadsheet_id}")
+    async def spreadsheets_get(spreadsheet_id: str):
+        await _gate(spreadsheet_id, "spreadsheets.get")
+        with _lock:
+            return _book(spreadsheet_id).meta()
+
+    @api.post("/v4/spreadsheets/{spreadsheet_id}/values:batchUpdate")
+    async def values_batch_update(spreadsheet_id: str, request: Request):
+        await _gate(spreadsheet_id, "values.batchUpdate")
+        body = await request.json()
+        with _lock:
+            book = _book(spreadsheet_id)
+            responses = [book.write(d["range"], d.get("values", [])) for d in body.get("data", [])]
+        return {
+            "spreadsheetId": spreadsheet_id,
+            "totalUpdatedCells": sum(r["updatedCells"] for r in responses),
+            "totalUpdatedRows": sum(r["updatedRows"] for r in responses),
+            "responses": responses,
+        }
+
+    @api.get("/v4/spreadsheets/{spreadsheet_id}/values/{a1:path}")
+    async def values_get(spreadsheet_id: str, a1: str):
+        await _gate(spreadsheet_id, "values.get")
+        with _lock:
+            values = _book(spreadsheet_id).read(a1)
+        resp = {"range": a1, "majorDimension": "ROWS"}
+        if values:
+            resp["values"] = values
+        return resp
+
+    @api.put("/v4/spreadsheets/{spreadsheet_id}/values/{a1:path}")
+    async def values_update(spreadsheet_id: str, a1: str, request: Request):
+        await _gate(spreadsheet_id, "values.update")
+        body = await request.json()
+        with _lock:
+            return _book(spreadsheet_id).write(a1, body.get("values", []))
+
+    @api.post("/v4/spreadsheets/{spreadsheet_id}/values/{a1:path}")
+    async def values_append(spreadsheet_id: str, a1: str, request: Request):
+        if not a1.endswith(":append"):
+            raise ApiError(404, "NOT_FOUND", f"Unknown method: {a1}")
+        await _gate(spreadsheet_id, "values.append")
+        body = await request.json()
+        with _lock:
+            return _book(spreadsheet_id).append(a1[: -len(":append")], body.get("values", []))
+
+    @api.get("/_fake/stats")
+    async def stats():
+        return fake_stats()
+
+    @api.post("/_fake/config")
+    async def configure(request: Request):
+        body = await request.json()
+        for key in _config:
+            if key in body:
+                _config[key] = type(_config[key])(body[key])
+        return dict(_config)
+
+    @api.post("/_fake/seed")
+    async def seed_data(request: Request):
+        seed(await request.json())
+        return {"spreadsheets": len(_BOOKS)}
+
+    @api.post("/_fake/reset")
+    async def reset_data():
+        reset()
+        return {"ok": True}
+
+    return api
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+
+    if FAKE_SHEETS_DATA:
+        with open(FAKE_SHEETS_DATA, encoding="utf-8") as f:
+            seed(json.load(f))
+        log.info(f"seeded from {FAKE_SHEETS_DATA}: spreadsheets={len(_BOOKS)}")
+
+    log.info(f"fake Sheets API on http://{FAKE_SHEETS_HOST}:{FAKE_SHEETS_PORT}/ config={_config}")
+    uvicorn.run(create_app(), host=FAKE_SHEETS_HOST, port=FAKE_SHEETS_PORT, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
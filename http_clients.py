@@ -0,0 +1,157 @@
+# http_clients.py
+"""
+Общий HTTP-клиент процесса (курьерка, Web API).
+
+Раньше каждый вызов открывал свой httpx.AsyncClient:
+новый TCP + TLS handshake на каждый заказ, ETA, отмену.
+
+Теперь:
+- один httpx.AsyncClient с keep-alive пулом на весь процесс
+- открывается в post_init, закрывается в post_shutdown
+- HTTP/2 по желанию (HTTP_CLIENT_HTTP2=1, нужен пакет h2)
+- латентность по хостам (event hooks): latency_stats()
+
+Таймауты задаются на вызове (timeout=...), у клиента только дефолт.
+"""
+
+import logging
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+import httpx
+
+log = logging.getLogger("HTTP_CLIENTS")
+
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_DEFAULT_TIMEOUT = float(os.getenv("HTTP_DEFAULT_TIMEOUT", "10"))
+HTTP_CLIENT_HTTP2 = os.getenv("HTTP_CLIENT_HTTP2", "0") == "1"
+
+_LATENCY_WINDOW = 200
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+# -------------------------------------------------
+# Латентность по хостам
+# -------------------------------------------------
+
+class _HostStats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.samples: Deque[float] = deque(maxlen=_LATENCY_WINDOW)
+
+    def snapshot(self) -> dict:
+        samples = sorted(self.samples)
+        if not samples:
+            return {"requests": self.requests, "errors": self.errors}
+
+        def pct(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(len(samples) * p))], 1)
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "avg_ms": round(sum(samples) / len(samples), 1),
+            "p50_ms": pct(0.5),
+            "p95_ms": pct(0.95),
+            "max_ms": round(samples[-1], 1),
+        }
+
+
+_HOSTS: Dict[str, _HostStats] = {}
+
+
+async def _on_request(request: httpx.Request) -> None:
+    request.extensions["started_at"] = time.monotonic()
+
+
+async def _on_response(response: httpx.Response) -> None:
+    request = response.request
+    started = request.extensions.get("started_at")
+    stats = _HOSTS.setdefault(request.url.host, _HostStats())
+    stats.requests += 1
+    if started is not None:
+        stats.samples.append((time.monotonic() - started) * 1000)
+    if response.status_code >= 500:
+        stats.errors += 1
+
+
+def latency_stats() -> Dict[str, dict]:
+    """
+    {"courier.example.com": {"requests": 12, "avg_ms": 83.1, "p95_ms": 140.2, ...}}
+    """
+    return {host: s.snapshot() for host, s in _HOSTS.items()}
+
+
+# -------------------------------------------------
+# Клиент
+# -------------------------------------------------
+
+def _http2_available() -> bool:
+    if not HTTP_CLIENT_HTTP2:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        log.warning("HTTP_CLIENT_HTTP2=1, but package h2 is not installed, using HTTP/1.1")
+        return False
+    return True
+
+
+def _build() -> httpx.AsyncClient:
+    http2 = _http2_available()
+    log.info(
+        f"HTTP client pool opened max_connections={HTTP_MAX_CONNECTIONS} "
+        f"keepalive={HTTP_MAX_KEEPALIVE} http2={http2}"
+    )
+    return httpx.AsyncClient(
+        timeout=HTTP_DEFAULT_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+        event_hooks={
+            "request": [_on_request],
+            "response": [_on_response],
+        },
+    )
+
+
+async def start() -> httpx.AsyncClient:
+    """
+    Открывает общий клиент (post_init).
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build()
+    return _client
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Общий клиент. Если post_init еще не отработал (скрипты, dev),
+    создается лениво в текущем loop.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build()
+    return _client
+
+
+async def close() -> None:
+    """
+    Закрывает пул (post_shutdown).
+    """
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+        log.info(f"HTTP client pool closed, latency={latency_stats()}")
+    _client = None
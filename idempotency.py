@@ -0,0 +1,102 @@
+# idempotency.py
+"""
+Идемпотентные запросы на стороне клиента (single-flight + кэш ответа).
+
+Раньше send_to_courier_and_persist вызывал create_webapi_order дважды
+с одним и тем же payload («best-effort» и «настоящий»), а двойной клик
+или повтор из очереди слали еще по запросу. Web API получал дубли,
+кухня ждала двойную латентность.
+
+Теперь:
+- ключ = X-IDEMPOTENCY-KEY (обычно order_id) + тип запроса
+- одновременные вызовы с одним ключом ждут ОДИН запрос в полете
+- успешный ответ переиспользуется IDEMPOTENCY_WINDOW_SECONDS
+- ошибка не кэшируется: ее получают все ждущие, следующий вызов идет в сеть
+
+ВАЖНО:
+- кэш в памяти процесса (после рестарта защищает заголовок X-IDEMPOTENCY-KEY
+  на стороне Web API)
+- ответ отдается копией, вызывающий может его менять
+"""
+
+import asyncio
+import copy
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+log = logging.getLogger("IDEMPOTENCY")
+
+
+IDEMPOTENCY_WINDOW_SECONDS = float(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", "600"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "2000"))
+
+# key -> (ответ, время)
+_DONE: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+_IN_FLIGHT: Dict[str, asyncio.Future] = {}
+
+_STATS = {"calls": 0, "cached": 0, "joined": 0}
+
+
+def _cached(key: str):
+    entry = _DONE.get(key)
+    if entry is None:
+        return None
+    if time.monotonic() - entry[1] >= IDEMPOTENCY_WINDOW_SECONDS:
+        _DONE.pop(key, None)
+        return None
+    return entry
+
+
+async def single_flight(key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Выполняет call() не больше одного раза на key в окне IDEMPOTENCY_WINDOW_SECONDS.
+    """
+    entry = _cached(key)
+    if entry is not None:
+        _STATS["cached"] += 1
+        log.info(f"[IDEMPOTENCY] reuse cached response key={key}")
+        return copy.deepcopy(entry[0])
+
+    in_flight = _IN_FLIGHT.get(key)
+    if in_flight is not None:
+        _STATS["joined"] += 1
+        log.info(f"[IDEMPOTENCY] join in-flight request key={key}")
+        return copy.deepcopy(await asyncio.shield(in_flight))
+
+    _STATS["calls"] += 1
+    future = asyncio.get_running_loop().create_future()
+    _IN_FLIGHT[key] = future
+
+    try:
+        result = await call()
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # ждущих может не быть: не шумим "exception was never retrieved"
+        future.exception()
+        raise
+    else:
+        future.set_result(result)
+        _DONE[key] = (result, time.monotonic())
+        _DONE.move_to_end(key)
+        while len(_DONE) > IDEMPOTENCY_MAX_KEYS:
+            _DONE.popitem(last=False)
+        return copy.deepcopy(result)
+    finally:
+        _IN_FLIGHT.pop(key, None)
+
+
+def forget(key: str) -> None:
+    """
+    Сбрасывает кэшированный ответ (например, заказ отменили и создают заново).
+    """
+    _DONE.pop(key, None)
+
+
+def idempotency_stats() -> dict:
+    return {**_STATS, "cached_keys": len(_DONE), "in_flight": len(_IN_FLIGHT)}
@@ -0,0 +1,191 @@
+# ingest_server.py
+"""
+Push-прием заказов от Web API.
+
+Раньше новый заказ из web-app доходил до стаффа только когда
+поллер (webapp_orders_sync) в очередной раз читал маркеры AE/AF:
+до 5 секунд паузы + проход по всем кухням.
+
+Теперь Web API после записи заказа дергает:
+
+    POST /orders/notify
+    X-API-KEY: <INGEST_API_KEY>
+    {"kitchen_id": "kitchen_1", "order_id": "..."}
+
+и бот сразу уведомляет стафф об этом одном заказе
+(webapp_orders_sync.notify_order, с теми же маркерами AE/AF).
+
+Сервер (uvicorn) крутится в том же event loop, что и бот,
+стартует в post_init и останавливается в post_shutdown.
+Опрос остается страховкой с редким интервалом.
+
+ВАЖНО:
+- без INGEST_API_KEY сервер не поднимается
+- ответ 202 сразу, уведомление идет фоном (Web API не ждет Telegram)
+"""
+
+import asyncio
+import contextlib
+import hmac
+import logging
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Header, HTTPException
+from pydantic import BaseModel
+
+from config import INGEST_API_KEY, INGEST_HOST, INGEST_PORT
+
+INGEST_START_TIMEOUT = 5.0
+
+log = logging.getLogger("INGEST")
+
+
+class OrderNotify(BaseModel):
+    kitchen_id: str
+    order_id: str
+
+
+class _EmbeddedServer(uvicorn.Server):
+    """
+    Сигналы (SIGINT/SIGTERM) обрабатывает PTB, uvicorn их не перехватывает.
+    """
+
+    def install_signal_handlers(self) -> None:
+        pass
+
+    def capture_signals(self):
+        return contextlib.nullcontext()
+
+
+_server: Optional[_EmbeddedServer] = None
+_server_task: Optional[asyncio.Task] = None
+_pending: set = set()
+
+
+def enabled() -> bool:
+    return bool(INGEST_API_KEY)
+
+
+def create_app(bot) -> FastAPI:
+    api = FastAPI(title="orders-ingest", docs_url=None, redoc_url=None)
+
+    @api.get("/health")
+    async def health():
+        return {"ok": True}
+
+    @api.post("/orders/notify", status_code=202)
+    async def orders_notify(
+        payload: OrderNotify,
+        x_api_key: str = Header(default=""),
+    ):
+        if not hmac.compare_digest(x_api_key, INGEST_API_KEY):
+            raise HTTPException(status_code=401, detail="invalid api key")
+
+        from kitchen_context import get
+
+        kitchen = get(payload.kitchen_id)
+        if not kitchen or kitchen.status != "active":
+            raise HTTPException(status_code=404, detail="unknown kitchen")
+
+        log.info(
+            f"[INGEST] order={payload.order_id} kitchen={payload.kitchen_id}"
+        )
+
+        task = asyncio.create_task(_notify(bot, kitchen, payload.order_id))
+        _pending.add(task)
+        task.add_done_callback(_pending.discard)
+
+        return {"status": "accepted", "order_id": payload.order_id}
+
+    return api
+
+
+async def _notify(bot, kitchen, order_id: str) -> None:
+    from webapp_orders_sync import notify_order
+
+    try:
+        result = await notify_order(bot, kitchen, order_id)
+        log.info(f"[INGEST] order={order_id} result={result}")
+    except Exception:
+        log.exception(f"[INGEST] notify failed order={order_id}")
+
+
+async def _serve(server: _EmbeddedServer) -> None:
+    # uvicorn на ошибке bind делает sys.exit(1): SystemExit из задачи
+    # уронил бы event loop бота
+    try:
+        await server.serve()
+    except SystemExit as e:
+        raise RuntimeError(f"uvicorn exited with code {e.code}") from None
+
+
+async def start(bot) -> bool:
+    """
+    Поднимает HTTP-сервер в текущем loop (post_init).
+    False, если сервер выключен или не смог занять INGEST_HOST:INGEST_PORT.
+    """
+    global _server, _server_task
+
+    if not enabled():
+        log.info("INGEST_API_KEY not set, ingest endpoint disabled")
+        return False
+
+    config = uvicorn.Config(
+        create_app(bot),
+        host=INGEST_HOST,
+        port=INGEST_PORT,
+        lifespan="off",
+        log_level="warning",
+        access_log=False,
+    )
+    _server = _EmbeddedServer(config)
+    _server_task = asyncio.create_task(_serve(_server))
+
+    # True = push реально работает (post_init по нему включает редкий опрос),
+    # поэтому ждем, пока uvicorn забиндит порт
+    deadline = asyncio.get_running_loop().time() + INGEST_START_TIMEOUT
+    while not _server.started and not _server_task.done():
+        if asyncio.get_running_loop().time() >= deadline:
+            break
+        await asyncio.sleep(0.05)
+
+    if not _server.started:
+        if _server_task.done():
+            exc = _server_task.exception()
+            log.error(f"❌ ingest endpoint failed on {INGEST_HOST}:{INGEST_PORT}: {exc!r}")
+        else:
+            log.error(
+                f"❌ ingest endpoint not started on {INGEST_HOST}:{INGEST_PORT} "
+                f"within {INGEST_START_TIMEOUT}s"
+            )
+            _server.should_exit = True
+            _server_task.cancel()
+            with contextlib.suppress(BaseException):
+                await _server_task
+
+        _server = None
+        _server_task = None
+        return False
+
+    log.info(f"📥 ingest endpoint on {INGEST_HOST}:{INGEST_PORT}")
+    return True
+
+
+async def stop() -> None:
+    global _server, _server_task
+
+    if _server is None:
+        return
+
+    _server.should_exit = True
+
+    if _pending:
+        await asyncio.gather(*_pending, return_exceptions=True)
+
+    if _server_task is not None:
+        with contextlib.suppress(Exception):
+            await asyncio.wait_for(_server_task, 10)
+
+    _server = None
+    _server_task = None
@@ -3,13 +3,13 @@
 # - Python + python-telegram-bot v20+
 
 import os
+import asyncio
 import logging
 logger = logging.getLogger("FlowerShopKR")
 from typing import Dict, List, Optional
 from contextlib import ExitStack
 from datetime import datetime, timedelta
 import json
-from google.oauth2.service_account import Credentials
 
 
 # -------------------------
@@ -24,7 +24,7 @@ except ImportError:
 
     from kitchen_context import require
 
-    async def webapi_create_order(payload: dict) -> dict:
+    async def webapi_create_order(payload: dict, *, idempotency_key: str | None = None) -> dict:
         log.warning("⚠️ Web API unavailable, using STUB webapi_create_order")
         return {
             "status": "ok",
@@ -63,8 +63,20 @@ from telegram.ext import (
     ApplicationBuilder,
 )
 from sheets_repo import get_sheets_service
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
+import sheets_async
+import sheets_writer
+import catalog_cache
+import ingest_server
+import webapp_orders_sync
+import users_directory
+import user_registrations
+import broadcast_engine
+import http_clients
+import courier_queue
+import idempotency
+import circuit_breaker
+import order_store
+from storage import get_storage
 from broadcast import register_broadcast_handlers
 from dotenv import load_dotenv
 load_dotenv()
@@ -85,69 +97,12 @@ from kitchen_context import KitchenContext
 from config import BOT_TOKEN, ADMIN_IDS, SPREADSHEET_ID, ORDERS_RANGE
 HOME_PHOTO_FILE_ID = "AgACAgUAAxkBAAIWCmmGZ2GWXQps1gltns_1ooxuNy6DAAKVDGsbOoE4VJIjd_TNBfS3AQADAgADeQADOAQ"
 import inspect
-import requests
-from config import WEB_API_BASE_URL, WEB_API_KEY, WEB_API_TIMEOUT
-
-import os
-import json
-import base64
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
-
-def get_sheets_service():
-    b64 = os.getenv("GOOGLE_SERVICE_ACCOUNT_B64")
-    if not b64:
-        raise RuntimeError("GOOGLE_SERVICE_ACCOUNT_B64 not set")
-
-    info = json.loads(
-        base64.b64decode(b64).decode("utf-8")
-    )
-
-    creds = Credentials.from_service_account_info(
-        info,
-        scopes=["https://www.googleapis.com/auth/spreadsheets"],
-    )
-
-    return build("sheets", "v4", credentials=creds)
+from config import WEB_API_BASE_URL, WEB_API_KEY
+import address_quotes
 
 
 logger = logging.getLogger(__name__)
 
-def webapi_check_address(city: str, address: str) -> dict | None:
-    try:
-        logger.info(
-            "[WEBAPI] address check city=%r address=%r url=%s",
-            city,
-            address,
-            WEB_API_BASE_URL,
-        )
-
-        resp = requests.post(
-            f"{WEB_API_BASE_URL}/api/v1/address/check",
-            json={
-                "city": city,
-                "address": address,
-            },
-            headers={
-                "X-API-KEY": WEB_API_KEY,
-            },
-            timeout=WEB_API_TIMEOUT,
-        )
-
-        if resp.status_code != 200:
-            logger.error(
-                "[WEBAPI] address check failed %s %s",
-                resp.status_code,
-                resp.text,
-            )
-            return None
-
-        return resp.json()
-
-    except Exception as e:
-        logger.exception("[WEBAPI] address check exception: %s", e)
-        return None
-    
 # -------------------------
 # logging
 # -------------------------
@@ -186,19 +141,9 @@ def get_kitchen_address_cached() -> str:
 
 def get_kitchen_city_cached(*, kitchen: KitchenContext) -> str | None:
     try:
-        service = get_sheets_service()
-        result = service.spreadsheets().values().get(
-            spreadsheetId=kitchen.spreadsheet_id,
-            range="kitchen!C1",
-        ).execute()
-
-        values = result.get("values", [])
-        if values and values[0]:
-            return values[0][0].strip()
+        return get_storage().settings.city(kitchen.spreadsheet_id)
     except Exception:
-        pass
-
-    return None
+        return None
 
 def save_user_contacts(
     *,
@@ -208,46 +153,13 @@ def save_user_contacts(
     phone_number: str,
     telegram_chat_id: int | None = None,
 ) -> bool:
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-
-    # читаем пользователей (с запасом под chat_id)
-    result = sheet.values().get(
-        spreadsheetId=kitchen.spreadsheet_id,
-        range="users!A2:G",
-    ).execute()
-
-    rows = result.get("values", [])
-    target_row = None
-
-    for idx, row in enumerate(rows, start=2):
-        if row and row[0] == str(user_id):
-            target_row = idx
-            break
-
-    if not target_row:
-        return False
-
-    updates = [
-        {"range": f"users!E{target_row}", "values": [[real_name]]},
-        {"range": f"users!F{target_row}", "values": [[phone_number]]},
-    ]
-
-    # 👇 НОВОЕ, но НЕ ломащее старый флоу
-    if telegram_chat_id is not None:
-        updates.append(
-            {"range": f"users!G{target_row}", "values": [[str(telegram_chat_id)]]}
-        )
-
-    sheet.values().batchUpdate(
-        spreadsheetId=kitchen.spreadsheet_id,
-        body={
-            "valueInputOption": "RAW",
-            "data": updates,
-        },
-    ).execute()
-
-    return True
+    return get_storage().users.save_contacts(
+        kitchen.spreadsheet_id,
+        user_id,
+        name=real_name,
+        phone=phone_number,
+        telegram_chat_id=telegram_chat_id,
+    )
 
 
 def pop_waiting_desc(context: ContextTypes.DEFAULT_TYPE) -> str | None:
@@ -265,37 +177,21 @@ def set_product_price(
     product_id: str,
     price: int,
 ) -> bool:
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-
-    result = sheet.values().get(
-        spreadsheetId=kitchen.spreadsheet_id,
-        range="products!A2:A",
-    ).execute()
-
-    rows = result.get("values", [])
-    row_index = None
-
-    for idx, row in enumerate(rows, start=2):
-        if row and row[0] == product_id:
-            row_index = idx
-            break
+    customer_price = calc_customer_price(price)
 
-    if row_index is None:
+    if not get_storage().products.update_cells(
+        kitchen.spreadsheet_id,
+        product_id,
+        {"C": price, "M": customer_price},
+    ):
         return False
 
-    customer_price = calc_customer_price(price)
-
-    sheet.values().batchUpdate(
-        spreadsheetId=kitchen.spreadsheet_id,
-        body={
-            "valueInputOption": "RAW",
-            "data": [
-                {"range": f"products!C{row_index}", "values": [[price]]},
-                {"range": f"products!M{row_index}", "values": [[customer_price]]},
-            ],
-        },
-    ).execute()
+    catalog_cache.update_product(
+        kitchen,
+        product_id,
+        owner_price=price,
+        customer_price=customer_price,
+    )
 
     return True
 
@@ -338,9 +234,28 @@ from typing import Optional
 def read_products_from_sheets(
     kitchen: "KitchenContext",
 ) -> list[dict]:
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
+    """
+    Каталог кухни. Отдается из catalog_cache, Sheets читается
+    только для холодной кухни (обновление устаревшего идет в фоне).
+    """
+    return catalog_cache.get_products(kitchen, _load_products_from_sheets)
+
 
+def get_catalog(kitchen: "KitchenContext") -> "catalog_cache.CatalogSnapshot":
+    """
+    Неизменяемый снимок каталога кухни (by_id / by_category).
+    Один снимок на операцию: корзина, превью и заказ считаются по нему.
+    """
+    return catalog_cache.get_snapshot(kitchen, _load_products_from_sheets)
+
+
+def _load_products_from_sheets(
+    kitchen: "KitchenContext",
+) -> list[dict]:
+    """
+    Прямое чтение products!A2:M. При ошибке Sheets бросает исключение
+    (catalog_cache не кэширует пустой каталог из-за сбоя).
+    """
     logger.info(
         f"[READ_PRODUCTS] kitchen_id={kitchen.kitchen_id} "
         f"spreadsheet_id={kitchen.spreadsheet_id} "
@@ -348,39 +263,30 @@ def read_products_from_sheets(
     )
 
     try:
-        meta = service.spreadsheets().get(
-            spreadsheetId=kitchen.spreadsheet_id
-        ).execute()
-
-        sheet_titles = [
-            s["properties"]["title"]
-            for s in meta.get("sheets", [])
-        ]
-
-        logger.info(
-            f"[READ_PRODUCTS] kitchen_id={kitchen.kitchen_id} "
-            f"available_sheets={sheet_titles}"
-        )
-    except Exception as e:
-        logger.error(
-            f"[READ_PRODUCTS] metadata fetch failed "
-            f"kitchen_id={kitchen.kitchen_id} err={e}"
-        )
-
-    try:
-        result = sheet.values().get(
-            spreadsheetId=kitchen.spreadsheet_id,
-            range="products!A2:M",
-        ).execute()
+        rows = get_storage().products.rows(kitchen.spreadsheet_id)
     except Exception:
-        logger.exception(
-            f"[READ_PRODUCTS] FAILED "
-            f"kitchen_id={kitchen.kitchen_id} "
-            f"spreadsheet_id={kitchen.spreadsheet_id}"
-        )
-        return []
+        # структура таблицы могла поменяться: только на сбое спрашиваем
+        # названия листов (узкий fields) и пишем в лог, какие реально есть
+        try:
+            meta = get_sheets_service().spreadsheets().get(
+                spreadsheetId=kitchen.spreadsheet_id,
+                fields="sheets.properties.title",
+            ).execute()
+            sheet_titles = [
+                s["properties"]["title"]
+                for s in meta.get("sheets", [])
+            ]
+            logger.error(
+                f"[READ_PRODUCTS] read failed kitchen_id={kitchen.kitchen_id} "
+                f"available_sheets={sheet_titles}"
+            )
+        except Exception as e:
+            logger.error(
+                f"[READ_PRODUCTS] metadata fetch failed "
+                f"kitchen_id={kitchen.kitchen_id} err={e}"
+            )
+        raise
 
-    rows = result.get("values", [])
     products: list[dict] = []
 
     for row in rows:
@@ -443,9 +349,6 @@ def append_product_to_sheets(
     category: str,
     description: str,
 ) -> str | None:
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-
     product_id = f"P{uuid4().hex[:10]}"
 
     customer_price = calc_customer_price(price)
@@ -463,16 +366,23 @@ def append_product_to_sheets(
     ]
 
     try:
-        sheet.values().append(
-            spreadsheetId=kitchen.spreadsheet_id,
-            range="products!A:G",
-            valueInputOption="RAW",
-            body={"values": [row]},
-        ).execute()
-        return product_id
+        get_storage().products.append(kitchen.spreadsheet_id, row)
     except Exception:
         return None
 
+    catalog_cache.add_product(kitchen, {
+        "product_id": product_id,
+        "name": name,
+        "owner_price": price,
+        "customer_price": customer_price,
+        "available": True,
+        "category": category,
+        "photo_file_id": "",
+        "description": description or "",
+    })
+
+    return product_id
+
 def save_order_to_sheets(
     *,
     kitchen: KitchenContext,
@@ -487,16 +397,10 @@ def save_order_to_sheets(
     payment_photo_file_id: str | None = None,  # 👈 фото оплаты
 ) -> str | None:
     
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-
     items = []
     subtotal = 0
 
-    for pid, qty in cart.items():
-        p = get_product_by_id(pid, kitchen=kitchen)
-        if not p:
-            continue
+    for p, qty in get_catalog(kitchen).resolve_cart(cart):
         items.append(f"{p['name']} x{qty}")
         subtotal += p["customer_price"] * qty
 
@@ -570,31 +474,18 @@ def save_order_to_sheets(
         # Валидация ПЕРЕД записью
         #validate_order_row(row_values)
         
-        # Находим следующую пустую строку
-        existing = sheet.values().get(
-            spreadsheetId=kitchen.spreadsheet_id,
-            range=ORDERS_RANGE,
-        ).execute().get("values", [])
-        
-        next_row = len(existing) + 1
-        target_range = f"orders!A{next_row}:AD{next_row}"
-        
-        log.info(
-            f"[save_order_to_sheets] Existing rows: {len(existing)}, "
-            f"Writing to: {target_range}"
+        # append без чтения вкладки: строку назначает Google,
+        # номер строки запоминается в order_index.
+        # В outbox order_store не идет (см. order_store, ВАЖНО): все
+        # дальнейшие записи по заказу адресуются этой строкой
+        row_idx = get_storage().orders.append(
+            kitchen.spreadsheet_id,
+            row_values,
+            kitchen_id=kitchen.kitchen_id,
         )
-        
-        # Используем update вместо append для гарантии правильной позиции
-        resp = sheet.values().update(
-            spreadsheetId=kitchen.spreadsheet_id,
-            range=target_range,
-            valueInputOption="RAW",
-            body={"values": [row_values]},
-        ).execute()
 
         log.info(
-            f"✅ ORDER WRITTEN: order_id={order_id} "
-            f"range={resp.get('updatedRange')}"
+            f"✅ ORDER WRITTEN: order_id={order_id} row={row_idx}"
         )
         return order_id
 
@@ -634,14 +525,12 @@ def set_waiting_photo(context: ContextTypes.DEFAULT_TYPE, product_id: str):
 def pop_waiting_photo(context: ContextTypes.DEFAULT_TYPE) -> str | None:
     return context.user_data.pop("waiting_photo_for", None)
 
-def cart_total(cart: Dict[str, int], kitchen) -> int:
-    total = 0
-    for pid, qty in cart.items():
-        p = get_product_by_id(pid, kitchen)
-        if not p:
-            continue
-        total += p["customer_price"] * qty
-    return total
+def cart_total(cart: Dict[str, int], kitchen, catalog=None) -> int:
+    catalog = catalog or get_catalog(kitchen)
+    return sum(
+        p["customer_price"] * qty
+        for p, qty in catalog.resolve_cart(cart)
+    )
 
 def calc_delivery_fee(cart: dict, kind: str) -> int:
     if kind != "delivery":
@@ -651,21 +540,20 @@ def calc_delivery_fee(cart: dict, kind: str) -> int:
     result = webapi_calculate_delivery(cart, address=None)
     return int(result.get("price", 0))
 
-def cart_text(cart: Dict[str, int], kitchen) -> str:
+def cart_text(cart: Dict[str, int], kitchen, catalog=None) -> str:
     if not cart:
         return "Корзина пустая."
 
+    catalog = catalog or get_catalog(kitchen)
+
     lines: List[str] = []
-    for pid, qty in cart.items():
-        p = get_product_by_id(pid, kitchen)
-        if not p:
-            continue
+    for p, qty in catalog.resolve_cart(cart):
         lines.append(
             f"• {p['name']} × {qty} = {_fmt_money(p['customer_price'] * qty)}"
         )
 
     lines.append("")
-    lines.append(f"Итого: {_fmt_money(cart_total(cart, kitchen))}")
+    lines.append(f"Итого: {_fmt_money(cart_total(cart, kitchen, catalog))}")
     return "\n".join(lines)
 
 
@@ -717,15 +605,8 @@ def kb_checkout_send() -> InlineKeyboardMarkup:
 
 
 def kb_products(category: str, kitchen) -> InlineKeyboardMarkup:
-    products = read_products_from_sheets(kitchen)
-
     rows = []
-    for p in products:
-        if not p["available"]:
-            continue
-        if p["category"] != category:
-            continue
-
+    for p in get_catalog(kitchen).in_category(category):
         rows.append([
             InlineKeyboardButton(
                 f"{p['name']} — {_fmt_money(p['customer_price'])}",
@@ -778,9 +659,12 @@ def kb_checkout_preview():
         [InlineKeyboardButton("❌ Отмена", callback_data="checkout:cancel")],
     ])
 
-def kb_retry_courier(order_id: str) -> InlineKeyboardMarkup:
+def kb_retry_courier(order_id: str, kitchen_id: str) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup([
-        [InlineKeyboardButton("🔁 Повторить отправку курьеру", callback_data=f"staff:courier_retry:{order_id}")]
+        [InlineKeyboardButton(
+            "🔁 Повторить отправку курьеру",
+            callback_data=f"staff:courier_retry:{kitchen_id}:{order_id}",
+        )]
     ])
 
 def kb_owner_paid():
@@ -896,7 +780,7 @@ async def render_categories(
         return
 
     try:
-        products = read_products_from_sheets(kitchen)
+        products = await sheets_async.run(read_products_from_sheets, kitchen)
     except Exception:
         log.exception("[render_categories] read_products_from_sheets failed kitchen=%s", getattr(kitchen, "kitchen_id", None))
         await clear_ui(context, chat_id)
@@ -1001,7 +885,7 @@ async def send_category_preview(
 
 async def render_product_card(context: ContextTypes.DEFAULT_TYPE, chat_id: int, pid: str):
     kitchen = get_active_kitchen(context)
-    p = get_product_by_id(pid, kitchen)
+    p = await sheets_async.run(get_product_by_id, pid, kitchen)
     if not p:
         await render_categories(context, chat_id)
         return
@@ -1052,7 +936,7 @@ async def render_cart(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
 
     await clear_ui(context, chat_id)
 
-    text = "🧺 <b>Корзина</b>\n\n" + cart_text(cart, kitchen)
+    text = "🧺 <b>Корзина</b>\n\n" + await sheets_async.run(cart_text, cart, kitchen)
     m = await context.bot.send_message(
         chat_id=chat_id,
         text=text,
@@ -1095,12 +979,13 @@ async def render_product_list(
     await clear_ui(context, chat_id)
 
     kitchen = get_active_kitchen(context)
+    reply_markup = await sheets_async.run(kb_products, category, kitchen)
 
     msg = await context.bot.send_message(
         chat_id=chat_id,
         text=f"📦 <b>{category}</b>\nВыберите позицию:",
         parse_mode=ParseMode.HTML,
-        reply_markup=kb_products(category, kitchen),
+        reply_markup=reply_markup,
     )
     track_msg(context, msg.message_id)
 
@@ -1113,7 +998,10 @@ async def start_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
 
     # базовая регистрация (как было)
-    register_user_if_new(user)
+    await sheets_async.run(register_user_if_new, user)
+
+    # написал боту -> снова доступен для рассылок
+    await broadcast_engine.mark_reachable(chat_id)
 
     # фиксируем связку в памяти диалога
     context.user_data["user_id"] = user.id
@@ -1152,30 +1040,13 @@ async def start_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await render_home(context, chat_id)
 
 def get_client_chat_id(*, kitchen: KitchenContext, user_id: int) -> int | None:
-    service = get_sheets_service()
-    result = service.spreadsheets().values().get(
-        spreadsheetId=kitchen.spreadsheet_id,
-        range="users!A2:G",
-    ).execute()
-
-    for row in result.get("values", []):
-        if row and row[0] == str(user_id):
-            return int(row[6]) if len(row) > 6 and row[6] else None
-
-    return None
+    user = get_storage().users.get(kitchen.spreadsheet_id, user_id)
+    return user.telegram_chat_id if user else None
 
 async def dash_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
 
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-
-    result = sheet.values().get(
-        spreadsheetId=SPREADSHEET_ID,
-        range=ORDERS_RANGE,
-    ).execute()
-
-    rows = result.get("values", [])
+    rows = await sheets_async.run(get_storage().orders.rows, SPREADSHEET_ID)
     if len(rows) < 2:
         await context.bot.send_message(
             chat_id=chat_id,
@@ -1346,8 +1217,8 @@ async def on_checkout_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
             return
 
         # 🔗 WEB API: verify address
-        city_code = get_kitchen_city_cached(kitchen=kitchen) or "unknown"
-        check = webapi_check_address(city_code, text)
+        city_code = await sheets_async.run(get_kitchen_city_cached, kitchen=kitchen) or "unknown"
+        check = await address_quotes.check_address(city_code, text)
         if not check or not check.get("ok"):
             await msg.reply_text(
                 "❌ Адрес не прошел проверку.\n"
@@ -1435,7 +1306,8 @@ async def on_checkout_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     kitchen = get_active_kitchen(context)
 
-    preview_text = build_checkout_preview(
+    preview_text = await sheets_async.run(
+        build_checkout_preview,
         cart=cart,
         kitchen=kitchen,
         kind_label=kind_label,
@@ -1592,11 +1464,14 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         
         import uuid
-        
-        order_id = str(uuid.uuid4())
+
+        # order_id и ключ идемпотентности живут в checkout до успеха:
+        # двойной тап / повтор после таймаута -> тот же заказ в Web API
+        order_id = checkout.setdefault("order_id", str(uuid.uuid4()))
+        idempotency_key = checkout.setdefault("idempotency_key", f"checkout:{order_id}")
         kitchen = get_active_kitchen(context)
-        pickup_address = get_kitchen_address_cached(kitchen=kitchen)
-        city_code = get_kitchen_city_cached(kitchen=kitchen) or "unknown"
+        pickup_address = await sheets_async.run(get_kitchen_address_cached, kitchen=kitchen)
+        city_code = await sheets_async.run(get_kitchen_city_cached, kitchen=kitchen) or "unknown"
 
         if not pickup_address:
             pickup_address = "KITCHEN_ADDRESS_NOT_SET"
@@ -1631,7 +1506,7 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except ImportError:
             log.warning("⚠️ webapi_create_order not available, using stub")
 
-            async def webapi_create_order(payload):
+            async def webapi_create_order(payload, *, idempotency_key=None):
                 return {
                     "status": "ok",
                     "external_delivery_ref": None,  # НОРМА для самовывоза
@@ -1661,7 +1536,7 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
 
         try:
-            resp = await webapi_create_order(order_payload)
+            resp = await webapi_create_order(order_payload, idempotency_key=idempotency_key)
         except Exception:
             log.exception("❌ Web API order create failed")
             await context.bot.send_message(
@@ -1699,7 +1574,8 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
             external_delivery_ref = resp.get("external_delivery_ref")
 
         # ⬇️ ТОЛЬКО ТЕПЕРЬ пишем в Sheets
-        saved = save_order_to_sheets(
+        saved = await sheets_async.run(
+            save_order_to_sheets,
             kitchen=kitchen,                # 👈 ВАЖНО
             user=user,
             cart=cart,
@@ -1735,6 +1611,12 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
             reply_markup=kb_home(),
         )
         track_msg(context, m.message_id)
+
+        # стафф узнает о заказе сразу: push от Web API для него приходит
+        # раньше, чем строка записана (not_found), а опрос с INGEST_API_KEY
+        # редкий. Ошибка -> AF пустой, заказ подберет опрос
+        if saved:
+            await webapp_orders_sync.notify_order(context.bot, kitchen, saved)
         return
 
     if data == "checkout:start":
@@ -1746,7 +1628,7 @@ async def on_button(update: Update, context: ContextTypes.DEFAULT_TYPE):
         checkout = context.user_data["checkout"]
 
         kitchen = get_active_kitchen(context)
-        profile = get_user_profile(kitchen, q.from_user.id)
+        profile = await sheets_async.run(get_user_profile, kitchen, q.from_user.id)
         
         if profile and profile.get("real_name") and profile.get("phone_number"):
             checkout.update({
@@ -1924,7 +1806,8 @@ async def on_buyer_payment_photo(update: Update, context: ContextTypes.DEFAULT_T
 
     kitchen = get_active_kitchen(context)
 
-    preview_text = build_checkout_preview(
+    preview_text = await sheets_async.run(
+        build_checkout_preview,
         cart=cart,
         kitchen=kitchen,
         kind_label=kind_label,
@@ -2053,10 +1936,7 @@ async def on_staff_decision(update: Update, context: ContextTypes.DEFAULT_TYPE):
             platform_commission = 0
             cart = parse_items_from_order(target_row[4])
 
-            for pid, qty in cart.items():
-                p = get_product_by_id(pid)
-                if not p:
-                    continue
+            for p, qty in get_catalog(kitchen).resolve_cart(cart):
                 platform_commission += (p["customer_price"] - p["owner_price"]) * qty
         except Exception:
             platform_commission = 0
@@ -2358,9 +2238,28 @@ async def on_staff_eta(update: Update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    # 3️⃣ Подключение к Sheets
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
+    # 3️⃣ Защита от повторного решения (например, «без курьера» раньше):
+    # одна строка по индексу, с еще не реплицированными записями
+    try:
+        _, order_row = await sheets_async.get_order_row(
+            order_id,
+            spreadsheet_id=spreadsheet_id,
+            kitchen_id=kitchen_id,
+        )
+    except Exception as e:
+        # не прочитали: решит задача очереди (у нее та же проверка)
+        log.warning(f"ETA pre-check read failed for order {order_id}: {e}")
+        order_row = None
+
+    current_status = order_row[19] if order_row and len(order_row) > 19 else ""
+
+    if current_status in ("courier_requested", "courier_not_requested"):
+        await q.answer("Решение по курьеру уже принято", show_alert=True)
+        try:
+            await q.message.delete()
+        except Exception:
+            pass
+        return
 
     # 4️⃣ Формирование ETA
     from datetime import timezone, timedelta
@@ -2368,149 +2267,208 @@ async def on_staff_eta(update: Update, context: ContextTypes.DEFAULT_TYPE):
     eta_dt = now + timedelta(minutes=minutes)
     pickup_eta_at = eta_dt.isoformat()
 
-    # 5️⃣ Поиск заказа в ПРАВИЛЬНОЙ таблице
-    rows = sheet.values().get(
-        spreadsheetId=spreadsheet_id,  # ✅ ИЗ KITCHEN
-        range=ORDERS_RANGE,
-    ).execute().get("values", [])
+    # 5️⃣ Фиксируем решение и отдаем работу очереди (Sheets, Web API, покупатель)
+    created = await asyncio.to_thread(
+        courier_queue.enqueue,
+        order_id,
+        kitchen_id,
+        {"minutes": minutes, "pickup_eta_at": pickup_eta_at},
+    )
 
-    target_idx = None
-    current_status = ""
+    if not created:
+        await q.answer("Решение по курьеру уже принято", show_alert=True)
 
-    for i, r in enumerate(rows[1:], start=2):
-        if r and r[0] == order_id:
-            target_idx = i
-            current_status = r[19] if len(r) > 19 else ""
-            break
+    try:
+        await q.message.delete()
+    except Exception:
+        pass
 
-    if not target_idx:
-        log.error(f"Order {order_id} not found in kitchen {kitchen_id}")
-        return
+    log.info(f"=== EXIT on_staff_eta: {order_id} queued={created} ===")
 
-    # ✅ ВАЖНО: гарантированно получаем строку заказа ДО работы с comment
-    if target_idx - 1 >= len(rows):
-        log.error(f"Order row index out of range: idx={target_idx}")
-        return
 
-    order_row = rows[target_idx - 1]
+async def _record_staff_eta(
+    *,
+    order_id: str,
+    spreadsheet_id: str,
+    target_idx: int,
+    order_row: list,
+    minutes: int,
+    pickup_eta_at: str,
+) -> list:
+    """
+    Шаг 2 задачи курьера: ETA, comment, accepted одной операцией.
+    Возвращает перечитанную строку заказа.
+    """
+    COMMENT_COL_IDX = 26
 
-    # 6️⃣ Защита от повторного решения
-    if current_status in ("courier_requested", "courier_not_requested"):
-        await q.answer("Решение по курьеру уже принято", show_alert=True)
-        try:
-            await q.message.delete()
-        except Exception:
-            pass
-        return
+    existing_comment = (
+        order_row[COMMENT_COL_IDX]
+        if len(order_row) > COMMENT_COL_IDX
+        else ""
+    )
 
-    # 7️⃣ Обновление ETA + comment в ПРАВИЛЬНОЙ таблице
-    order_row_before = rows[target_idx - 1]
+    eta_note = f"Курьер через {minutes} мин"
 
-    try:
-        COMMENT_COL_IDX = 26
+    if existing_comment and existing_comment.strip():
+        new_comment = f"{existing_comment} | {eta_note}"
+    else:
+        new_comment = eta_note
+
+    async with sheets_writer.operation("staff_eta") as batch:
+        batch.set_row_cells(spreadsheet_id, target_idx, {
+            "R": pickup_eta_at,
+            "S": "preset",
+            "T": "courier_requested",
+            "AA": new_comment,
+            "AG": "accepted",
+            "AH": datetime.utcnow().isoformat(),
+        })
 
-        existing_comment = (
-            order_row[COMMENT_COL_IDX]
-            if len(order_row) > COMMENT_COL_IDX
-            else ""
-        )
+    await asyncio.to_thread(courier_queue.checkpoint, order_id, sheet_recorded=True)
 
-        eta_note = f"Курьер через {minutes} мин"
+    log.info(
+        f"Order {order_id} updated: pickup_eta_at={pickup_eta_at}, "
+        f"courier_state=courier_requested, comment='{new_comment}'"
+    )
 
-        if existing_comment and existing_comment.strip():
-            new_comment = f"{existing_comment} | {eta_note}"
-        else:
-            new_comment = eta_note
+    # перечитываем строку после записи
+    return await sheets_async.read_order_row(spreadsheet_id, target_idx)
 
-        log.info(
-            f"[ETA_COMMENT] order={order_id} "
-            f"old='{existing_comment}' new='{new_comment}'"
-        )
 
-        # 1️⃣ ETA + courier decision + comment
-        sheet.values().batchUpdate(
-            spreadsheetId=spreadsheet_id,
-            body={
-                "valueInputOption": "RAW",
-                "data": [
-                    {"range": f"orders!R{target_idx}", "values": [[pickup_eta_at]]},
-                    {"range": f"orders!S{target_idx}", "values": [["preset"]]},
-                    {"range": f"orders!T{target_idx}", "values": [["courier_requested"]]},
-                    {"range": f"orders!AA{target_idx}", "values": [[new_comment]]},
-                ],
-            },
-        ).execute()
+async def process_courier_job(bot, job: courier_queue.CourierJob):
+    """
+    Обработчик courier_queue: то, что раньше делал on_staff_eta синхронно.
+    Шаги отмечаются checkpoint'ами, повтор после ошибки их не повторяет.
+    """
+    from kitchen_context import require
 
-        # 2️⃣ kitchen accepted (AG / AH)
-        sheet.values().batchUpdate(
-            spreadsheetId=spreadsheet_id,
-            body={
-                "valueInputOption": "RAW",
-                "data": [
-                    {"range": f"orders!AG{target_idx}", "values": [["accepted"]]},
-                    {"range": f"orders!AH{target_idx}", "values": [[datetime.utcnow().isoformat()]]},
-                ],
-            },
-        ).execute()
+    order_id = job.order_id
+    kitchen = require(job.kitchen_id)
+    spreadsheet_id = kitchen.spreadsheet_id
+    minutes = job.payload["minutes"]
+    pickup_eta_at = job.payload["pickup_eta_at"]
 
-        log.info(
-            f"Order {order_id} updated: pickup_eta_at={pickup_eta_at}, "
-            f"courier_state=courier_requested, comment='{new_comment}'"
-        )
+    # 1️⃣ Поиск заказа в таблице кухни (индекс + одна строка)
+    target_idx, order_row = await sheets_async.get_order_row(
+        order_id,
+        spreadsheet_id=spreadsheet_id,
+        kitchen_id=job.kitchen_id,
+    )
 
-    except Exception:
-        log.exception(f"Failed to update ETA/comment for order {order_id}")
-        return
+    if not target_idx:
+        raise RuntimeError(f"order {order_id} not found in kitchen {job.kitchen_id}")
 
-    # 8️⃣ Перечитываем строку
-    rows = sheet.values().get(
-        spreadsheetId=spreadsheet_id,  # ✅ ИЗ KITCHEN
-        range=ORDERS_RANGE,
-    ).execute().get("values", [])
+    # 2️⃣ ETA + comment + accepted
+    if not job.state.get("sheet_recorded"):
+        current_status = order_row[19] if len(order_row) > 19 else ""
+        current_eta = order_row[17] if len(order_row) > 17 else ""
 
-    order_row = rows[target_idx - 1]
+        if current_status == "courier_requested" and current_eta == pickup_eta_at:
+            # наша же запись: процесс упал между записью и checkpoint,
+            # строку не трогаем (comment задублировался бы), идем дальше
+            log.info(f"[COURIER_JOB] order={order_id} sheet already recorded by this job")
+            await asyncio.to_thread(courier_queue.checkpoint, order_id, sheet_recorded=True)
 
-    # 9️⃣ Вызов курьера
-    success = await send_to_courier_and_persist(
-        order_row=order_row,
-        target_idx=target_idx,
-        pickup_eta_at=pickup_eta_at,
-        eta_minutes=minutes,
-        kitchen=kitchen,
-    )
+        # защита от повторного решения (например, «без курьера» раньше)
+        elif current_status in ("courier_requested", "courier_not_requested"):
+            log.info(
+                f"[COURIER_JOB] order={order_id} already decided: {current_status}"
+            )
+            return
 
-    if not success:
-        log.error(f"Failed to send order {order_id} to courier")
+        else:
+            order_row = await _record_staff_eta(
+                order_id=order_id,
+                spreadsheet_id=spreadsheet_id,
+                target_idx=target_idx,
+                order_row=order_row,
+                minutes=minutes,
+                pickup_eta_at=pickup_eta_at,
+            )
 
-    # 🔟 Уведомление клиента
-    buyer_user_id = int(order_row[2])
+    # 3️⃣ Вызов курьера
+    # ошибка не блокирует покупателя (как раньше в on_staff_eta):
+    # отмечаем ее, сообщаем ETA и только потом отдаем задачу на повтор
+    courier_error = None
+
+    if not job.state.get("courier_sent"):
+        success = await send_to_courier_and_persist(
+            order_row=order_row,
+            target_idx=target_idx,
+            pickup_eta_at=pickup_eta_at,
+            eta_minutes=minutes,
+            kitchen=kitchen,
+        )
 
-    buyer_chat_id = get_client_chat_id(
-        kitchen=kitchen,
-        user_id=buyer_user_id,
-    )
+        if success:
+            await asyncio.to_thread(courier_queue.checkpoint, order_id, courier_sent=True)
+        else:
+            courier_error = f"courier dispatch failed for order {order_id}"
+            await asyncio.to_thread(
+                courier_queue.checkpoint,
+                order_id,
+                courier_failed_attempt=job.attempts,
+            )
 
-    if buyer_chat_id:
-        await context.bot.send_message(
-            chat_id=buyer_chat_id,
-            text=(
-                "Ваш заказ принят в работу.\n"
-                f"Курьер приедет примерно через {minutes} минут.\n"
-                "Вы можете отслеживать доставку в боте курьерской службы."
-            ),
-        )
-    else:
-        log.info(
-            "Client notification skipped: no telegram_chat_id "
-            f"(user_id={buyer_user_id})"
+    # 4️⃣ Уведомление клиента
+    if not job.state.get("buyer_notified"):
+        buyer_user_id = int(order_row[2])
+
+        buyer_chat_id = await sheets_async.run(
+            get_client_chat_id,
+            kitchen=kitchen,
+            user_id=buyer_user_id,
         )
 
-    try:
-        await q.message.delete()
-    except Exception:
-        pass
-    
-    log.info(f"=== EXIT on_staff_eta: {order_id} processed ===")
+        if buyer_chat_id:
+            await bot.send_message(
+                chat_id=buyer_chat_id,
+                text=(
+                    "Ваш заказ принят в работу.\n"
+                    f"Курьер приедет примерно через {minutes} минут.\n"
+                    "Вы можете отслеживать доставку в боте курьерской службы."
+                ),
+            )
+        else:
+            log.info(
+                "Client notification skipped: no telegram_chat_id "
+                f"(user_id={buyer_user_id})"
+            )
+
+        await asyncio.to_thread(courier_queue.checkpoint, order_id, buyer_notified=True)
+
+    if courier_error:
+        raise RuntimeError(courier_error)
+
+
+async def notify_courier_job_dead(bot, job: courier_queue.CourierJob, error: str):
+    """
+    courier_queue.on_dead: попытки кончились, ETA-кнопки уже удалены,
+    поэтому стафф получает алерт с кнопкой повтора.
+    """
+    from kitchen_context import require
+
+    kitchen = require(job.kitchen_id)
+
+    chat_ids = set(kitchen.staff_chat_ids or ())
+    if not chat_ids and kitchen.owner_chat_id:
+        chat_ids.add(kitchen.owner_chat_id)
+
+    text = (
+        f"⚠️ Не удалось вызвать курьера для заказа {job.order_id}\n"
+        f"Попыток: {job.attempts}\n"
+        f"Ошибка: {error[:300]}"
+    )
+
+    for chat_id in chat_ids:
+        try:
+            await bot.send_message(
+                chat_id=chat_id,
+                text=text,
+                reply_markup=kb_retry_courier(job.order_id, job.kitchen_id),
+            )
+        except Exception:
+            log.exception(f"[COURIER_JOB] dead alert failed chat_id={chat_id} order={job.order_id}")
 
 async def on_staff_no_courier(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
@@ -2562,33 +2520,18 @@ async def on_staff_no_courier(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     _, _, order_id = q.data.split(":", 2)
 
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-
-    rows = sheet.values().get(
-        spreadsheetId=kitchen.spreadsheet_id,
-        range=ORDERS_RANGE,
-    ).execute().get("values", [])
-
     # защита от повторных действий
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-    rows = sheet.values().get(
-        spreadsheetId=kitchen.spreadsheet_id,
-        range=ORDERS_RANGE,
-    ).execute().get("values", [])
-
-    target_idx = None
-    current_status = ""
-    for i, r in enumerate(rows[1:], start=2):
-        if r and r[0] == order_id:
-            target_idx = i
-            current_status = r[19] if len(r) > 19 else ""  # колонка T
-            break
+    target_idx, order_row = await sheets_async.get_order_row(
+        order_id,
+        spreadsheet_id=kitchen.spreadsheet_id,
+        kitchen_id=kitchen_id,
+    )
 
     if not target_idx:
         return
 
+    current_status = order_row[19] if len(order_row) > 19 else ""  # колонка T
+
     if current_status in ("courier_requested", "courier_not_requested"):
         await q.answer("Решение по курьеру уже принято", show_alert=True)
         try:
@@ -2597,17 +2540,8 @@ async def on_staff_no_courier(update: Update, context: ContextTypes.DEFAULT_TYPE
             pass
         return
 
-    target_idx = None
-    for i, r in enumerate(rows[1:], start=2):
-        if r and r[0] == order_id:
-            target_idx = i
-            break
-    if not target_idx:
-        return
-
     COL_COURIER_EXTERNAL_ID_IDX = ord("W") - ord("A")  # = 22
 
-    order_row = rows[target_idx - 1]
     external_id = (
         order_row[COL_COURIER_EXTERNAL_ID_IDX]
         if len(order_row) > COL_COURIER_EXTERNAL_ID_IDX
@@ -2619,20 +2553,16 @@ async def on_staff_no_courier(update: Update, context: ContextTypes.DEFAULT_TYPE
     except Exception as e:
         log.warning(f"⚠️ courier cancel failed for order {order_id}: {e}")
 
-    sheet.values().batchUpdate(
-        spreadsheetId=spreadsheet_id,
-        body={
-            "valueInputOption": "RAW",
-            "data": [
-                {"range": f"orders!T{target_idx}", "values": [["courier_not_requested"]]},
-                {"range": f"orders!U{target_idx}", "values": [[""]]},  # courier_no_reason (резерв)
-            ],
-        },
-    ).execute()
+    async with sheets_writer.operation("staff_no_courier") as batch:
+        batch.extend(spreadsheet_id, [
+            {"range": f"orders!T{target_idx}", "values": [["courier_not_requested"]]},
+            {"range": f"orders!U{target_idx}", "values": [[""]]},  # courier_no_reason (резерв)
+        ])
 
-    buyer_user_id = int(rows[target_idx - 1][2])
+    buyer_user_id = int(order_row[2])
 
-    buyer_chat_id = get_client_chat_id(
+    buyer_chat_id = await sheets_async.run(
+        get_client_chat_id,
         kitchen=kitchen,
         user_id=buyer_user_id,
     )
@@ -2753,14 +2683,17 @@ async def courier_update_order(external_id: str, patch: dict) -> dict:
         "Content-Type": "application/json",
     }
 
-    async with httpx.AsyncClient(timeout=COURIER_TIMEOUT) as client:
-        r = await client.patch(
+    # open breaker -> CircuitOpenError сразу, без ожидания таймаута
+    with circuit_breaker.get("courier.update").guard() as call:
+        r = await http_clients.get_client().patch(
             f"{COURIER_API_BASE}/orders/{external_id}",
             headers=headers,
             json=patch,
+            timeout=COURIER_TIMEOUT,
         )
-        r.raise_for_status()
-        return {"ok": True}
+        call.status(r.status_code)
+    r.raise_for_status()
+    return {"ok": True}
 
 
 async def courier_cancel_order(external_id: str) -> dict:
@@ -2779,14 +2712,16 @@ async def courier_cancel_order(external_id: str) -> dict:
         "Content-Type": "application/json",
     }
 
-    async with httpx.AsyncClient(timeout=COURIER_TIMEOUT) as client:
-        r = await client.post(
+    with circuit_breaker.get("courier.cancel").guard() as call:
+        r = await http_clients.get_client().post(
             f"{COURIER_API_BASE}/orders/{external_id}/cancel",
             headers=headers,
             json={},
+            timeout=COURIER_TIMEOUT,
         )
-        r.raise_for_status()
-        return {"ok": True}
+        call.status(r.status_code)
+    r.raise_for_status()
+    return {"ok": True}
 
 
 # =========================
@@ -2815,18 +2750,32 @@ async def create_webapi_order(payload: dict) -> dict:
         url,
     )
 
-    async with httpx.AsyncClient(timeout=timeout) as client:
-        resp = await client.post(url, json=payload, headers=headers)
+    async def _post() -> dict:
+        # open breaker -> CircuitOpenError сразу (очередь курьера повторит позже)
+        with circuit_breaker.get("webapi.create_order").guard() as call:
+            resp = await http_clients.get_client().post(
+                url,
+                json=payload,
+                headers=headers,
+                timeout=timeout,
+            )
+            call.status(resp.status_code)
 
-    if resp.status_code != 200:
-        log.error(
-            "[WEBAPI] create order failed %s %s",
-            resp.status_code,
-            resp.text,
-        )
-        raise RuntimeError("WEB API order create failed")
+        if resp.status_code != 200:
+            log.error(
+                "[WEBAPI] create order failed %s %s",
+                resp.status_code,
+                resp.text,
+            )
+            raise RuntimeError("WEB API order create failed")
 
-    return resp.json()
+        return resp.json()
+
+    if not order_id:
+        return await _post()
+
+    # повтор / параллельный вызов по тому же заказу -> один запрос
+    return await idempotency.single_flight(f"kitchen:create_order:{order_id}", _post)
 
 from datetime import datetime, timezone
 async def send_to_courier_and_persist(
@@ -2837,9 +2786,6 @@ async def send_to_courier_and_persist(
     eta_minutes: int | None = None,
     kitchen=None,
 ):
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-
     # spreadsheetId должен быть кухни, если мы ее знаем
     spreadsheet_id = None
     if kitchen is not None:
@@ -2900,29 +2846,7 @@ async def send_to_courier_and_persist(
         f"{kitchen_id!r} → {kitchen_id_for_webapi} (type={type(kitchen_id_for_webapi)})"
     )
 
-    # 2) регистрируем заказ в Web API (best-effort, не ломает флоу)
-    try:
-        await create_webapi_order({
-            "order_id": payload["order_id"],
-            "source": "kitchen",
-            "kitchen_id": kitchen_id_for_webapi,
-            "client_tg_id": payload["client_tg_id"],
-            "client_name": payload["client_name"],
-            "client_phone": payload["client_phone"],
-            "pickup_address": payload["pickup_address"],
-            "delivery_address": payload["delivery_address"],
-            "pickup_eta_at": payload.get("pickup_eta_at"),
-            "city": payload["city"],
-            "comment": payload.get("comment"),
-            # ⚠️ ВАЖНО: цена берется ИЗ payload
-            "price_krw": payload.get("price_krw"),
-            "eta_minutes": eta_minutes,
-        })
-    except Exception:
-        log.exception("[send_to_courier_and_persist] WebAPI create_order failed")
-        # ❗️ не ломаем флоу кухни
-
-    # 3) финальная защита перед отправкой курьеру
+    # 2) финальная защита перед отправкой курьеру
     if not payload.get("pickup_eta_at"):
         payload["pickup_eta_at"] = datetime.now(timezone.utc).isoformat()
         log.error(
@@ -2930,7 +2854,7 @@ async def send_to_courier_and_persist(
             f"{payload['pickup_eta_at']}"
         )
 
-   # 2) Отправляем заказ в Web API
+    # 3) Отправляем заказ в Web API (один раз, см. idempotency)
     # Web API сам вызовет курьерку через courier_adapter
     try:
         webapi_response = await create_webapi_order({
@@ -2958,22 +2882,17 @@ async def send_to_courier_and_persist(
         # external_id может быть в ответе от Web API (опционально)
         external_id = webapi_response.get("delivery_order_id", "")
         
-        sheet.values().batchUpdate(
-            spreadsheetId=spreadsheet_id,
-            body={
-                "valueInputOption": "RAW",
-                "data": [
-                    {"range": f"orders!W{target_idx}", "values": [[external_id]]},
-                    {"range": f"orders!T{target_idx}", "values": [["courier_requested"]]},
-                    {"range": f"orders!X{target_idx}", "values": [["ok"]]},
-                    {"range": f"orders!Y{target_idx}", "values": [[""]]},
-                    {
-                        "range": f"orders!Z{target_idx}",
-                        "values": [[datetime.now(timezone.utc).isoformat()]],
-                    },
-                ],
-            },
-        ).execute()
+        async with sheets_writer.operation("courier_persist") as batch:
+            batch.extend(spreadsheet_id, [
+                {"range": f"orders!W{target_idx}", "values": [[external_id]]},
+                {"range": f"orders!T{target_idx}", "values": [["courier_requested"]]},
+                {"range": f"orders!X{target_idx}", "values": [["ok"]]},
+                {"range": f"orders!Y{target_idx}", "values": [[""]]},
+                {
+                    "range": f"orders!Z{target_idx}",
+                    "values": [[datetime.now(timezone.utc).isoformat()]],
+                },
+            ])
         
         log.info(
             "[send_to_courier_and_persist] Sheet updated | "
@@ -2989,16 +2908,11 @@ async def send_to_courier_and_persist(
 
         # Фиксируем ошибку в Sheets
         try:
-            sheet.values().batchUpdate(
-                spreadsheetId=spreadsheet_id,
-                body={
-                    "valueInputOption": "RAW",
-                    "data": [
-                        {"range": f"orders!X{target_idx}", "values": [["failed"]]},
-                        {"range": f"orders!Y{target_idx}", "values": [[str(e)[:500]]]},
-                    ],
-                },
-            ).execute()
+            async with sheets_writer.operation("courier_persist") as batch:
+                batch.extend(spreadsheet_id, [
+                    {"range": f"orders!X{target_idx}", "values": [["failed"]]},
+                    {"range": f"orders!Y{target_idx}", "values": [[str(e)[:500]]]},
+                ])
         except Exception:
             log.exception("Failed to update sheet with error status")
 
@@ -3007,13 +2921,22 @@ async def send_to_courier_and_persist(
 
 async def on_staff_courier_retry(update: Update, context: ContextTypes.DEFAULT_TYPE):
     q = update.callback_query
-    await q.answer()
+
+    # staff:courier_retry:kitchen_id:order_id
+    parts = q.data.split(":", 3)
+    if len(parts) != 4:
+        await q.answer()
+        log.error(f"Invalid courier_retry callback: {q.data}")
+        return
+
+    _, _, kitchen_id, order_id = parts
 
     chat_id = q.message.chat_id
     from kitchen_context import _REGISTRY
 
     kitchen = _REGISTRY.get(kitchen_id)
     if not kitchen:
+        await q.answer()
         return
 
     allowed_chat_ids = set()
@@ -3025,26 +2948,22 @@ async def on_staff_courier_retry(update: Update, context: ContextTypes.DEFAULT_T
         allowed_chat_ids.update(kitchen.staff_chat_ids)
 
     if chat_id not in allowed_chat_ids:
+        await q.answer()
         return
 
-    _, _, order_id = q.data.split(":", 2)
-
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-    rows = sheet.values().get(
-        spreadsheetId=SPREADSHEET_ID,
-        range=ORDERS_RANGE,
-    ).execute().get("values", [])
+    # повтор идет через очередь: шаги, которые уже прошли, не повторятся
+    requeued = await asyncio.to_thread(courier_queue.requeue, order_id)
 
-    target_idx = None
-    for i, r in enumerate(rows[1:], start=2):
-        if r and r[0] == order_id:
-            target_idx = i
-            break
-    if not target_idx:
+    if not requeued:
+        await q.answer("Отправка курьеру уже в работе или выполнена", show_alert=True)
         return
 
-    await send_to_courier_and_persist(rows[target_idx - 1], target_idx)
+    await q.answer("Повторяем отправку курьеру")
+
+    try:
+        await q.message.edit_reply_markup(reply_markup=None)
+    except Exception:
+        pass
 
 import uuid
 
@@ -3209,36 +3128,14 @@ def get_user_profile(
     kitchen: KitchenContext,
     user_id: int,
 ) -> dict | None:
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-
-    rows = (
-        sheet.values()
-        .get(
-            spreadsheetId=kitchen.spreadsheet_id,
-            range="users!A:G",
-        )
-        .execute()
-        .get("values", [])
-    )
-
-    uid = str(user_id)
-
-    for r in rows:
-        if not r:
-            continue
-
-        # на случай, если первая строка это заголовки
-        if r[0].strip().lower() in ("user_id", "userid", "id"):
-            continue
-
-        if r[0] == uid:
-            return {
-                "name": r[4] if len(r) > 4 else "",
-                "phone": r[5] if len(r) > 5 else "",
-            }
+    user = get_storage().users.get(kitchen.spreadsheet_id, user_id)
+    if user is None:
+        return None
 
-    return None
+    return {
+        "name": user.name,
+        "phone": user.phone,
+    }
 
 # -------------------------
 # checkout conversation
@@ -3600,23 +3497,14 @@ def get_kitchen_address_cached(
     if cache and cache.get("address") and now - cache["loaded_at"] < ttl:
         return cache["address"]
 
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-
-    rows = sheet.values().get(
-        spreadsheetId=kitchen.spreadsheet_id,
-        range="kitchen!A:B",
-    ).execute().get("values", [])
-
-    for r in rows:
-        if len(r) >= 2 and r[0] == "address":
-            _KITCHEN_CACHE[kitchen.kitchen_id] = {
-                "address": r[1],
-                "loaded_at": now,
-            }
-            return r[1]
+    address = get_storage().settings.get(kitchen.spreadsheet_id, "address")
+    if address is not None:
+        _KITCHEN_CACHE[kitchen.kitchen_id] = {
+            "address": address,
+            "loaded_at": now,
+        }
 
-    return None
+    return address
 # -------------------------
 # WEBAPP
 # -------------------------
@@ -3676,65 +3564,23 @@ def set_product_description(
     product_id: str,
     description: str,
 ) -> bool:
-
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-
-    result = sheet.values().get(
-        spreadsheetId=kitchen.spreadsheet_id,
-        range="products!A2:A",
-    ).execute()
-
-    rows = result.get("values", [])
-    row_index = None
-
-    for idx, row in enumerate(rows, start=2):
-        if row and row[0] == product_id:
-            row_index = idx
-            break
-
-    if row_index is None:
+    if not get_storage().products.update_cells(
+        kitchen.spreadsheet_id,
+        product_id,
+        {"G": description},
+    ):
         return False
 
-    sheet.values().update(
-        spreadsheetId=kitchen.spreadsheet_id,
-        range=f"products!G{row_index}",
-        valueInputOption="RAW",
-        body={"values": [[description]]},
-    ).execute()
+    catalog_cache.update_product(kitchen, product_id, description=description)
 
     return True
 
 def register_user_if_new(user):
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-
-    result = sheet.values().get(
-        spreadsheetId=SPREADSHEET_ID,
-        range="users!A2:A",
-    ).execute()
-
-    rows = result.get("values", [])
-    existing_ids = {row[0] for row in rows if row}
-
-    if str(user.id) in existing_ids:
-        return False
-
-    sheet.values().append(
-        spreadsheetId=SPREADSHEET_ID,
-        range="users!A:D",
-        valueInputOption="RAW",
-        body={
-            "values": [[
-                str(user.id),
-                user.username or "",
-                user.full_name or "",
-                datetime.utcnow().isoformat(),
-            ]]
-        },
-    ).execute()
-
-    return True
+    """
+    Регистрация в users платформы: проверка по множеству в памяти,
+    запись копится и уходит пачкой (user_registrations).
+    """
+    return user_registrations.register(user)
 
 
 
@@ -3743,31 +3589,14 @@ def set_product_available(
     product_id: str,
     available: bool,
 ) -> bool:
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-
-    result = sheet.values().get(
-        spreadsheetId=kitchen.spreadsheet_id,
-        range="products!A2:A",
-    ).execute()
-
-    rows = result.get("values", [])
-    row_index = None
-
-    for idx, row in enumerate(rows, start=2):
-        if row and row[0] == product_id:
-            row_index = idx
-            break
-
-    if row_index is None:
+    if not get_storage().products.update_cells(
+        kitchen.spreadsheet_id,
+        product_id,
+        {"D": "TRUE" if available else "FALSE"},
+    ):
         return False
 
-    sheet.values().update(
-        spreadsheetId=kitchen.spreadsheet_id,
-        range=f"products!D{row_index}",
-        valueInputOption="RAW",
-        body={"values": [["TRUE" if available else "FALSE"]]},
-    ).execute()
+    catalog_cache.update_product(kitchen, product_id, available=available)
 
     return True
 
@@ -3776,31 +3605,14 @@ def set_product_photo(
     product_id: str,
     file_id: str,
 ) -> bool:
-    service = get_sheets_service()
-    sheet = service.spreadsheets()
-
-    result = sheet.values().get(
-        spreadsheetId=kitchen.spreadsheet_id,
-        range="products!A2:A",
-    ).execute()
-
-    rows = result.get("values", [])
-    row_index = None
-
-    for idx, row in enumerate(rows, start=2):
-        if row and row[0] == product_id:
-            row_index = idx
-            break
-
-    if row_index is None:
+    if not get_storage().products.update_cells(
+        kitchen.spreadsheet_id,
+        product_id,
+        {"F": file_id},
+    ):
         return False
 
-    sheet.values().update(
-        spreadsheetId=kitchen.spreadsheet_id,
-        range=f"products!F{row_index}",
-        valueInputOption="RAW",
-        body={"values": [[file_id]]},
-    ).execute()
+    catalog_cache.update_product(kitchen, product_id, photo_file_id=file_id)
 
     return True
 
@@ -4116,7 +3928,56 @@ async def on_open_payment_proof(update: Update, context: ContextTypes.DEFAULT_TY
 
 #===========NOTIFY STAFF======================#
 
-async def notify_staff(bot, kitchen, order_id: str):
+async def read_users_snapshot(spreadsheet_id: str):
+    """
+    Срез справочника покупателей: user_id -> UserRecord.
+    Для пачки уведомлений берется один раз на цикл.
+    """
+    return await sheets_async.run(users_directory.snapshot, spreadsheet_id)
+
+
+async def notify_staff_batch(bot, kitchen, order_rows: list, users: dict | None = None) -> dict:
+    """
+    Уведомляет стафф о нескольких заказах по уже прочитанным строкам.
+    users читается один раз на всю пачку (если не передан).
+    Возвращает {order_id: Exception | message | None}.
+    """
+    results = {}
+    if not order_rows:
+        return results
+
+    if users is None:
+        users = await read_users_snapshot(kitchen.spreadsheet_id)
+
+    for row in order_rows:
+        order_id = str(row[0]) if row else ""
+        try:
+            results[order_id] = await notify_staff(
+                bot,
+                kitchen,
+                order_id,
+                order_row=row,
+                users=users,
+            )
+        except Exception as e:
+            log.error(f"notify_staff failed for {order_id}: {e}", exc_info=True)
+            results[order_id] = e
+
+    return results
+
+
+async def notify_staff(
+    bot,
+    kitchen,
+    order_id: str,
+    *,
+    order_row: list | None = None,
+    users: dict | None = None,
+):
+    """
+    order_row / users можно передать готовыми (поллер, push),
+    тогда Sheets не читается.
+    """
     log.error("🔥🔥🔥 notify_staff CALLED")
 
     # --- защита ---
@@ -4145,27 +4006,13 @@ async def notify_staff(bot, kitchen, order_id: str):
 
     # --- sheets ---
     spreadsheet_id = kitchen.spreadsheet_id
-    service = get_sheets_service()
 
-    rows = (
-        service.spreadsheets()
-        .values()
-        .get(
-            spreadsheetId=spreadsheet_id,
-            range=ORDERS_RANGE,
+    if order_row is None:
+        _, order_row = await sheets_async.get_order_row(
+            order_id,
+            spreadsheet_id=spreadsheet_id,
+            kitchen_id=kitchen.kitchen_id,
         )
-        .execute()
-        .get("values", [])
-    )
-
-    if len(rows) < 2:
-        return None
-
-    order_row = None
-    for r in rows[1:]:
-        if r and r[0] == order_id:
-            order_row = r
-            break
 
     if not order_row:
         log.warning(f"order {order_id} not found")
@@ -4192,22 +4039,13 @@ async def notify_staff(bot, kitchen, order_id: str):
     buyer_name = ""
     buyer_phone = ""
 
-    users = (
-        service.spreadsheets()
-        .values()
-        .get(
-            spreadsheetId=spreadsheet_id,
-            range="users!A:G",
-        )
-        .execute()
-        .get("values", [])
-    )
+    if users is None:
+        users = await read_users_snapshot(spreadsheet_id)
 
-    for u in users:
-        if u and u[0] == buyer_chat_id:
-            buyer_name = u[4] if len(u) > 4 else ""
-            buyer_phone = u[5] if len(u) > 5 else ""
-            break
+    u = users.get(buyer_chat_id)
+    if u:
+        buyer_name = u.name
+        buyer_phone = u.phone
 
     # --- текст ---
     address_block = (
@@ -4305,7 +4143,8 @@ def build_checkout_preview(
 ) -> str:
     kind = "delivery" if kind_label == "Доставка" else "pickup"
 
-    subtotal = cart_total(cart, kitchen)
+    catalog = get_catalog(kitchen)
+    subtotal = cart_total(cart, kitchen, catalog)
 
     # Используем цену из геокодинга, если есть
     if delivery_price_krw is not None:
@@ -4329,7 +4168,7 @@ def build_checkout_preview(
 
     return (
         "🧾 <b>Проверьте заказ</b>\n\n"
-        f"{cart_text(cart, kitchen)}\n\n"
+        f"{cart_text(cart, kitchen, catalog)}\n\n"
         f"{delivery_block}"
         f"💰 <b>Итого к оплате: {_fmt_money(total)}</b>\n\n"
         f"Способ: <b>{kind_label}</b>\n"
@@ -4351,53 +4190,101 @@ def main():
     )
 
     # -------------------------------
-    # MANUAL ORDERS LOOP
+    # POST INIT (PTB LIFECYCLE)
     # -------------------------------
 
-    async def manual_orders_loop(app):
-        await asyncio.sleep(2)  # дать боту полностью стартануть
+    async def post_init(app: Application):
+        # общий HTTP-пул (курьерка, Web API): keep-alive вместо handshake на вызов
+        await http_clients.start()
 
-        from kitchen_context import load_registry, list_kitchens, get
-        from webapp_orders_sync import orders_job
+        # общий Sheets-клиент строим заранее, а не в первом хендлере
+        try:
+            await sheets_async.run(get_sheets_service)
+        except Exception:
+            log.exception("Sheets client warm-up failed")
 
-        load_registry()
-        kitchen_ids = list_kitchens()
+        # каталоги кухонь грузим заранее: меню не ждет Sheets
+        try:
+            from kitchen_context import load_registry, list_kitchens, get
+
+            load_registry()
+            kitchens = [
+                k for k in (get(kid) for kid in list_kitchens())
+                if k and k.status == "active"
+            ]
+
+            loaded = await sheets_async.run(
+                catalog_cache.warm_up,
+                kitchens,
+                _load_products_from_sheets,
+                timeout=60,
+            )
+            log.info(f"📦 catalog cache warmed: {loaded}/{len(kitchens)} kitchens")
 
-        log.info("🟡 manual_orders_loop started")
+            await sheets_async.run(
+                users_directory.warm_up,
+                [k.spreadsheet_id for k in kitchens],
+                timeout=60,
+            )
+        except Exception:
+            log.exception("Catalog cache warm-up failed")
 
-        while True:
-            for kitchen_id in kitchen_ids:
-                try:
-                    kitchen = get(kitchen_id)
-                    if not kitchen or kitchen.status != "active":
-                        continue
+        # известные пользователи платформы: один раз, а не на каждый /start
+        try:
+            await sheets_async.run(user_registrations.seed, timeout=60)
+        except Exception:
+            log.exception("Known users seed failed")
 
-                    fake_context = SimpleNamespace(
-                        bot=app.bot,
-                        job=SimpleNamespace(
-                            data={
-                                "spreadsheet_id": kitchen.spreadsheet_id,
-                                "kitchen_id": kitchen_id,
-                            }
-                        ),
-                    )
+        app.create_task(user_registrations.registrations_flush_loop(app))
 
-                    await orders_job(fake_context)
+        # котировки адресов на диск пачкой, а не на каждый промах чекаута
+        app.create_task(address_quotes.flush_loop(app))
 
-                except Exception as e:
-                    log.error(
-                        f"[manual-orders] kitchen={kitchen_id} error={e}",
-                        exc_info=True,
-                    )
+        # изменения заказов пишутся локально, в Sheets уходят пачками
+        app.create_task(order_store.replication_loop(app))
 
-            await asyncio.sleep(5)
+        # вызовы курьера из очереди (клик ETA только ставит задачу)
+        app.create_task(courier_queue.courier_queue_loop(
+            app,
+            process_courier_job,
+            on_dead=notify_courier_job_dead,
+        ))
 
-    # -------------------------------
-    # POST INIT (PTB LIFECYCLE)
-    # -------------------------------
+        # рассылки, прерванные рестартом, продолжаем с места остановки
+        try:
+            resumed = broadcast_engine.resume_pending(app.bot)
+            if resumed:
+                log.info(f"📢 resumed broadcasts: {resumed}")
+        except Exception:
+            log.exception("Broadcast resume failed")
 
-    async def post_init(app: Application):
-        app.create_task(manual_orders_loop(app))
+        from webapp_orders_sync import orders_poll_loop
+        from config import ORDERS_POLL_INTERVAL, ORDERS_SAFETY_POLL_INTERVAL
+
+        # push от Web API (+ заказы из бота уведомляются сразу после записи);
+        # если поднялся, опрос остается редкой страховкой
+        try:
+            push_enabled = await ingest_server.start(app.bot)
+        except Exception:
+            log.exception("Ingest endpoint failed to start")
+            push_enabled = False
+
+        app.create_task(orders_poll_loop(
+            app,
+            interval=ORDERS_SAFETY_POLL_INTERVAL if push_enabled else ORDERS_POLL_INTERVAL,
+        ))
+
+    async def post_shutdown(app: Application):
+        await ingest_server.stop()
+        await broadcast_engine.shutdown()
+
+        try:
+            await asyncio.to_thread(address_quotes.save_if_dirty)
+        except Exception:
+            log.exception("Address quotes final save failed")
+
+        await http_clients.close()
+        sheets_async.shutdown()
 
     # -------------------------------
     # APPLICATION INIT
@@ -4407,6 +4294,7 @@ def main():
         Application.builder()
         .token(BOT_TOKEN)
         .post_init(post_init)
+        .post_shutdown(post_shutdown)
         .build()
     )
 
@@ -4544,8 +4432,6 @@ def main():
         group=10
     )
 
-    app.bot_data["SHEETS_SERVICE"] = None
-
     register_broadcast_handlers(app)
 
     log.info("### START POLLING ###")
@@ -4556,10 +4442,7 @@ def main():
 print("### MAIN FILE REACHED END ###")
     
 def get_product_by_id(product_id: str, kitchen):
-    for p in read_products_from_sheets(kitchen):
-        if p["product_id"] == product_id:
-            return p
-    return None
+    return get_catalog(kitchen).get(product_id)
 
 def get_categories_from_products(products: list[dict]) -> list[str]:
     return sorted({
@@ -0,0 +1,124 @@
+# order_index.py
+"""
+In-memory индекс заказов.
+
+spreadsheet_id -> order_id -> (номер строки, kitchen_id)
+
+Зачем:
+- раньше каждый поиск заказа читал весь orders!A:AF и шел по нему циклом
+- теперь строку знаем заранее и проверяем одной узкой выборкой
+
+Наполняется:
+- из чтений поллера (webapp_orders_sync.orders_job)
+- из записей новых заказов (save_order_to_sheets)
+- из поиска по колонке A при промахе (sheets_repo.get_order_row)
+
+ВАЖНО:
+- индекс только подсказка, источник истины остается Sheets
+- перед использованием строка сверяется по order_id (sheets_repo)
+"""
+
+import threading
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional
+
+
+@dataclass(frozen=True)
+class OrderLocation:
+    spreadsheet_id: str
+    order_id: str
+    row_idx: int
+    kitchen_id: Optional[str] = None
+
+
+_lock = threading.Lock()
+_INDEX: Dict[str, Dict[str, OrderLocation]] = {}
+
+
+def remember(
+    spreadsheet_id: str,
+    order_id: str,
+    row_idx: int,
+    kitchen_id: Optional[str] = None,
+) -> None:
+    if not order_id or not row_idx:
+        return
+
+    with _lock:
+        _INDEX.setdefault(spreadsheet_id, {})[str(order_id)] = OrderLocation(
+            spreadsheet_id=spreadsheet_id,
+            order_id=str(order_id),
+            row_idx=int(row_idx),
+            kitchen_id=kitchen_id,
+        )
+
+
+def forget(spreadsheet_id: str, order_id: str) -> None:
+    with _lock:
+        _INDEX.get(spreadsheet_id, {}).pop(str(order_id), None)
+
+
+def index_rows(
+    spreadsheet_id: str,
+    rows: Iterable[list],
+    kitchen_id: Optional[str] = None,
+) -> int:
+    """
+    Индексирует строки, прочитанные с A1 (первая строка заголовки).
+    Подходит и для orders!A:AF, и для orders!A:A.
+    Возвращает количество проиндексированных заказов.
+    """
+    fresh: Dict[str, OrderLocation] = {}
+
+    for idx, row in enumerate(rows, start=1):
+        if idx == 1 or not row or not row[0]:
+            continue
+        order_id = str(row[0])
+        fresh[order_id] = OrderLocation(
+            spreadsheet_id=spreadsheet_id,
+            order_id=order_id,
+            row_idx=idx,
+            kitchen_id=kitchen_id,
+        )
+
+    with _lock:
+        _INDEX.setdefault(spreadsheet_id, {}).update(fresh)
+
+    return len(fresh)
+
+
+def lookup(spreadsheet_id: str, order_id: str) -> Optional[OrderLocation]:
+    with _lock:
+        return _INDEX.get(spreadsheet_id, {}).get(str(order_id))
+
+
+def order_at(spreadsheet_id: str, row_idx: int) -> Optional[str]:
+    """
+    Заказ, который индекс последним видел в строке row_idx
+    (None, если не знает или строку делят несколько записей).
+    """
+    with _lock:
+        found = [
+            loc.order_id
+            for loc in _INDEX.get(spreadsheet_id, {}).values()
+            if loc.row_idx == row_idx
+        ]
+    return found[0] if len(found) == 1 else None
+
+
+def locate(order_id: str) -> Optional[OrderLocation]:
+    """
+    Ищет заказ во всех известных таблицах (когда кухня неизвестна).
+    """
+    order_id = str(order_id)
+    with _lock:
+        for orders in _INDEX.values():
+            loc = orders.get(order_id)
+            if loc:
+                return loc
+    return None
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        return {sid: len(orders) for sid, orders in _INDEX.items()}
@@ -0,0 +1,400 @@
+# order_store.py
+"""
+Локальное хранилище изменений заказов (SQLite WAL) + репликация в Sheets.
+
+Раньше каждое изменение заказа (решение стафа, ETA, результат курьерки,
+«без курьера») ждало round trip в Google Sheets, а квота Sheets ограничивала,
+сколько заказов в минуту бот вообще может провести.
+
+Теперь:
+- sheets_writer.WriteBatch.flush пишет ячейки в локальный outbox
+  (BOT_STATE_DIR/orders.sqlite3, одна транзакция) и сразу возвращается
+- replication_loop раз в ORDER_STORE_REPLICATE_SECONDS забирает outbox,
+  схлопывает повторные записи одной ячейки и отправляет ОДИН batchUpdate
+  на таблицу кухни; отправленное удаляется из outbox
+- ошибка Sheets: записи остаются в outbox, повтор с растущей паузой
+  (до ORDER_STORE_MAX_BACKOFF); после рестарта outbox дописывается
+- read_order_row накладывает еще не отправленные ячейки (overlay),
+  поэтому хендлеры видят свои записи сразу
+- запись outbox помнит order_id строки (по order_index): владелец мог
+  отсортировать / удалить строки, пока запись ждала репликации. Перед
+  batchUpdate репликация читает колонку A и переносит ячейки на новую строку
+  заказа, а для удаленного заказа пропускает (один лишний get на таблицу)
+
+ВАЖНО:
+- Sheets становится eventually-consistent витриной для владельцев:
+  отставание = интервал репликации (+ время недоступности Sheets)
+- новые заказы (save_order_to_sheets -> orders.append) в outbox НЕ идут и
+  пишутся в Sheets сразу. Строку назначает Google, а дальше заказ адресуется
+  номером строки: order_index, уведомление стафа, решение, ETA, курьер.
+  До репликации такого заказа не было бы ни в Sheets, ни в overlay.
+  Цена: один values.append на заказ, вне event loop (sheets_async), с
+  приоритетом покупателя в лимитере; все последующие изменения заказа
+  идут через outbox
+- ORDER_STORE_ENABLED=0 возвращает прямую запись в Sheets
+"""
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import order_index
+import sheets_a1
+from state_dir import state_path
+
+log = logging.getLogger("ORDER_STORE")
+
+
+ORDER_STORE_ENABLED = os.getenv("ORDER_STORE_ENABLED", "1") == "1"
+ORDER_STORE_REPLICATE_SECONDS = float(os.getenv("ORDER_STORE_REPLICATE_SECONDS", "1"))
+ORDER_STORE_BATCH = int(os.getenv("ORDER_STORE_BATCH", "1000"))
+ORDER_STORE_MAX_BACKOFF = float(os.getenv("ORDER_STORE_MAX_BACKOFF", "60"))
+
+DB_PATH = state_path("orders.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id             INTEGER PRIMARY KEY AUTOINCREMENT,
+    spreadsheet_id TEXT NOT NULL,
+    range          TEXT NOT NULL,
+    "values"       TEXT NOT NULL,
+    sheet          TEXT,
+    row_idx        INTEGER,
+    col_idx        INTEGER,
+    operation      TEXT NOT NULL DEFAULT '',
+    created_at     REAL NOT NULL,
+    order_id       TEXT
+);
+CREATE INDEX IF NOT EXISTS outbox_row
+    ON outbox (spreadsheet_id, sheet, row_idx);
+"""
+
+# outbox, созданный до колонки order_id
+_MIGRATIONS = (
+    ("order_id", "ALTER TABLE outbox ADD COLUMN order_id TEXT"),
+)
+
+_lock = threading.Lock()
+_conn: Optional[sqlite3.Connection] = None
+
+_STATS = {
+    "written_cells": 0,
+    "replicated_cells": 0,
+    "requests": 0,
+    "failures": 0,
+    "retargeted_cells": 0,
+    "dropped_cells": 0,
+}
+
+
+# -------------------------------------------------
+# SQLite
+# -------------------------------------------------
+
+def _db() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(DB_PATH) or ".", exist_ok=True)
+        _conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.executescript(_SCHEMA)
+        columns = {row[1] for row in _conn.execute("PRAGMA table_info(outbox)")}
+        for column, ddl in _MIGRATIONS:
+            if column not in columns:
+                _conn.execute(ddl)
+        _conn.execute(
+            "CREATE INDEX IF NOT EXISTS outbox_order ON outbox (spreadsheet_id, order_id)"
+        )
+    return _conn
+
+
+def write(pending: Dict[str, Dict[str, list]], *, operation: str = "") -> int:
+    """
+    pending: spreadsheet_id -> A1 range -> values (формат WriteBatch).
+    Одна локальная транзакция. Возвращает количество ячеек.
+    """
+    now = time.time()
+    rows = []
+
+    for spreadsheet_id, ranges in pending.items():
+        for range_, values in ranges.items():
+            sheet = row_idx = col_idx = order_id = None
+            cell = sheets_a1.split_cell(range_)
+            if cell:
+                sheet, col, row_idx = cell
+                col_idx = sheets_a1.col_idx(col)
+                if sheet == "orders":
+                    order_id = order_index.order_at(spreadsheet_id, row_idx)
+            rows.append((
+                spreadsheet_id,
+                range_,
+                json.dumps(values, ensure_ascii=False),
+                sheet,
+                row_idx,
+                col_idx,
+                operation,
+                now,
+                order_id,
+            ))
+
+    if not rows:
+        return 0
+
+    with _lock:
+        db = _db()
+        db.execute("BEGIN")
+        try:
+            db.executemany(
+                'INSERT INTO outbox (spreadsheet_id, range, "values", sheet, row_idx, '
+                "col_idx, operation, created_at, order_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
+        _STATS["written_cells"] += len(rows)
+
+    return len(rows)
+
+
+def overlay(spreadsheet_id: str, row_idx: int, row: list, *, sheet: str = "orders") -> list:
+    """
+    Накладывает на прочитанную из Sheets строку еще не реплицированные ячейки.
+    """
+    if not ORDER_STORE_ENABLED or not row_idx:
+        return row
+
+    # ячейки заказа, который сейчас в этой строке (он мог переехать),
+    # и ячейки без order_id, записанные в эту строку
+    order_id = str(row[0]) if row and row[0] else None
+
+    with _lock:
+        cells = _db().execute(
+            'SELECT col_idx, "values" FROM outbox '
+            "WHERE spreadsheet_id = ? AND sheet = ? AND col_idx IS NOT NULL AND ("
+            "(row_idx = ? AND (order_id IS NULL OR order_id = ?)) OR order_id = ?"
+            ") ORDER BY id",
+            (spreadsheet_id, sheet, int(row_idx), order_id, order_id),
+        ).fetchall()
+
+    if not cells:
+        return row
+
+    row = list(row)
+    for col_idx, values in cells:
+        value = json.loads(values)[0][0]
+        if len(row) <= col_idx:
+            row.extend([""] * (col_idx + 1 - len(row)))
+        row[col_idx] = value
+    return row
+
+
+def overlay_rows(spreadsheet_id: str, rows: List[list], *, sheet: str = "orders") -> List[list]:
+    """
+    overlay для листа целиком (rows[0] = строка 1): один запрос к outbox.
+    """
+    if not ORDER_STORE_ENABLED or not rows:
+        return rows
+
+    with _lock:
+        cells = _db().execute(
+            'SELECT row_idx, col_idx, "values", order_id FROM outbox '
+            "WHERE spreadsheet_id = ? AND sheet = ? AND row_idx IS NOT NULL ORDER BY id",
+            (spreadsheet_id, sheet),
+        ).fetchall()
+
+    if not cells:
+        return rows
+
+    where = _order_rows(rows)
+    rows = list(rows)
+    for row_idx, col_idx, values, order_id in cells:
+        if order_id:
+            row_idx = where.get(order_id)
+        if not row_idx or row_idx > len(rows):
+            continue
+        row = rows[row_idx - 1] = list(rows[row_idx - 1])
+        if len(row) <= col_idx:
+            row.extend([""] * (col_idx + 1 - len(row)))
+        row[col_idx] = json.loads(values)[0][0]
+    return rows
+
+
+def _order_rows(rows: List[list]) -> Dict[str, int]:
+    """
+    order_id -> номер строки (rows[0] = строка 1; дубли: первая строка).
+    """
+    where: Dict[str, int] = {}
+    for idx, row in enumerate(rows, start=1):
+        if row and row[0]:
+            where.setdefault(str(row[0]), idx)
+    return where
+
+
+def pending_count() -> int:
+    with _lock:
+        return _db().execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+def store_stats() -> dict:
+    return {**_STATS, "pending": pending_count()}
+
+
+# -------------------------------------------------
+# Replication
+# -------------------------------------------------
+
+def _resolve(service, spreadsheet_id: str, entries: list) -> Dict[str, list]:
+    """
+    range -> values для batchUpdate (поздняя запись перетирает раннюю).
+
+    Записи с order_id сверяются с колонкой A: заказ переехал -> ячейка
+    уходит в его новую строку, заказа нет -> ячейка пропускается.
+    """
+    columns: Dict[str, Dict[str, int]] = {}
+    for sheet in {e[4] for e in entries if e[7]}:
+        ids = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=f"{sheet}!A:A",
+        ).execute().get("values", [])
+        columns[sheet] = ids
+
+    ranges: Dict[str, list] = {}
+    for _id, _sid, range_, values, sheet, row_idx, col_idx, order_id in entries:
+        if order_id:
+            ids = columns[sheet]
+            current = ids[row_idx - 1][0] if row_idx <= len(ids) and ids[row_idx - 1] else ""
+            if current != order_id:
+                moved = _order_rows(ids).get(order_id)
+                order_index.forget(spreadsheet_id, order_id)
+                if moved is None:
+                    _STATS["dropped_cells"] += 1
+                    log.warning(
+                        f"[ORDER_STORE] order={order_id} gone from {spreadsheet_id}, "
+                        f"skip {range_}"
+                    )
+                    continue
+                range_ = f"{sheet}!{sheets_a1.col_letters(col_idx)}{moved}"
+                _STATS["retargeted_cells"] += 1
+                log.warning(
+                    f"[ORDER_STORE] order={order_id} moved row {row_idx} -> {moved}, "
+                    f"write {range_}"
+                )
+        ranges[range_] = json.loads(values)
+    return ranges
+
+
+def replicate_once(limit: int = ORDER_STORE_BATCH) -> int:
+    """
+    Отправляет накопленное: один batchUpdate на таблицу (блокирующий).
+    Возвращает количество разобранных записей outbox; ошибки таблиц
+    пробрасывает после того, как остальные таблицы отправлены.
+    """
+    from sheets_repo import get_sheets_service
+
+    with _lock:
+        rows = _db().execute(
+            'SELECT id, spreadsheet_id, range, "values", sheet, row_idx, col_idx, order_id '
+            "FROM outbox ORDER BY id LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+    if not rows:
+        return 0
+
+    grouped: Dict[str, list] = {}
+    for entry in rows:
+        grouped.setdefault(entry[1], []).append(entry)
+
+    service = get_sheets_service()
+    sent = 0
+    consumed = 0
+    error: Optional[Exception] = None
+
+    for spreadsheet_id, entries in grouped.items():
+        try:
+            ranges = _resolve(service, spreadsheet_id, entries)
+            if ranges:
+                service.spreadsheets().values().batchUpdate(
+                    spreadsheetId=spreadsheet_id,
+                    body={
+                        "valueInputOption": "RAW",
+                        "data": [{"range": r, "values": v} for r, v in ranges.items()],
+                    },
+                ).execute()
+        except Exception as e:
+            _STATS["failures"] += 1
+            log.error(
+                f"[ORDER_STORE] replicate failed spreadsheet={spreadsheet_id} "
+                f"entries={len(entries)}: {e}"
+            )
+            error = e
+            continue
+
+        with _lock:
+            _db().executemany("DELETE FROM outbox WHERE id = ?", [(e[0],) for e in entries])
+
+        if ranges:
+            _STATS["requests"] += 1
+        _STATS["replicated_cells"] += len(ranges)
+        sent += len(ranges)
+        consumed += len(entries)
+
+    if sent:
+        log.info(f"[ORDER_STORE] replicated cells={sent} spreadsheets={len(grouped)}")
+
+    if error is not None:
+        raise error
+    return consumed
+
+
+async def replication_loop(
+    app,
+    *,
+    interval: float = ORDER_STORE_REPLICATE_SECONDS,
+) -> None:
+    """
+    Фоновая репликация outbox -> Sheets (app.create_task из post_init).
+    На остановке приложения дописывает остаток.
+    """
+    import sheets_async
+    import sheets_limiter
+
+    while not app.running:
+        await asyncio.sleep(0.5)
+
+    sheets_limiter.mark_background()
+
+    pending = await asyncio.to_thread(pending_count)
+    if pending:
+        log.info(f"[ORDER_STORE] resuming replication pending={pending}")
+
+    delay = interval
+    while app.running:
+        deadline = time.monotonic() + delay
+        while app.running and time.monotonic() < deadline:
+            await asyncio.sleep(min(0.5, deadline - time.monotonic()))
+
+        try:
+            while await sheets_async.run(replicate_once) >= ORDER_STORE_BATCH:
+                pass
+            delay = interval
+        except Exception:
+            delay = min(ORDER_STORE_MAX_BACKOFF, delay * 2)
+            log.warning(f"[ORDER_STORE] replication retry in {delay:.0f}s")
+
+    try:
+        while await sheets_async.run(replicate_once) >= ORDER_STORE_BATCH:
+            pass
+    except Exception:
+        log.exception(
+            f"[ORDER_STORE] final replication failed, pending={pending_count()} "
+            "(will be sent after restart)"
+        )
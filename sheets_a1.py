@@ -0,0 +1,44 @@
+# sheets_a1.py
+"""
+Буквы колонок A1-нотации <-> индексы (с нуля).
+
+Без зависимостей от config: нужен и боту (order_store, storage_memory),
+и автономному fake_sheets_server.
+"""
+
+import re
+from typing import Optional, Tuple
+
+_CELL_RE = re.compile(r"^([^!]+)!([A-Z]+)(\d+)$")
+
+
+def split_cell(range_: str) -> Optional[Tuple[str, str, int]]:
+    """
+    "orders!AG12" -> ("orders", "AG", 12); не одна ячейка -> None
+    """
+    m = _CELL_RE.match(range_)
+    if not m:
+        return None
+    return m.group(1), m.group(2), int(m.group(3))
+
+
+def col_idx(letters: str) -> int:
+    """
+    "A" -> 0, "AA" -> 26
+    """
+    n = 0
+    for ch in letters:
+        n = n * 26 + (ord(ch) - ord("A") + 1)
+    return n - 1
+
+
+def col_letters(idx: int) -> str:
+    """
+    0 -> "A", 26 -> "AA"
+    """
+    s = ""
+    idx += 1
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        s = chr(ord("A") + rem) + s
+    return s
@@ -0,0 +1,236 @@
+# sheets_async.py
+"""
+Async-фасад над Google Sheets.
+
+googleapiclient блокирующий: любой .execute() внутри async-хендлера
+замораживает event loop PTB, и вместе с ним все остальные чаты.
+
+Здесь все вызовы Sheets уходят в ограниченный пул потоков,
+а каждый вызов ждется с таймаутом.
+
+ВАЖНО:
+- клиент общий (sheets_repo.get_sheets_service), он thread-safe
+- таймаут отменяет только ожидание, поток доработает сам
+  (его ограничивает SHEETS_HTTP_TIMEOUT транспорта)
+- фоновые вызовы (sheets_limiter.background) идут в отдельный маленький пул:
+  пока они ждут квоту в лимитере, потоки для покупателей и стаффа свободны
+"""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import sheets_limiter
+import sheets_repo
+from sheets_repo import get_sheets_service
+from storage import get_storage
+
+log = logging.getLogger("SHEETS_ASYNC")
+
+
+# -------------------------------------------------
+# Executor
+# -------------------------------------------------
+
+MAX_WORKERS = int(os.getenv("SHEETS_MAX_WORKERS", "8"))
+BACKGROUND_WORKERS = int(os.getenv("SHEETS_BACKGROUND_WORKERS", "2"))
+CALL_TIMEOUT = float(os.getenv("SHEETS_CALL_TIMEOUT", "20"))
+
+_executor: Optional[ThreadPoolExecutor] = None
+_background_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor, _background_executor
+    if sheets_limiter.is_background():
+        if _background_executor is None:
+            _background_executor = ThreadPoolExecutor(
+                max_workers=BACKGROUND_WORKERS,
+                thread_name_prefix="sheets-bg",
+            )
+        return _background_executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=MAX_WORKERS,
+            thread_name_prefix="sheets",
+        )
+    return _executor
+
+
+def submit(func: Callable[..., Any], *args, **kwargs):
+    """
+    Фоновая задача в пуле Sheets без ожидания (можно звать из sync-кода).
+    Возвращает concurrent.futures.Future.
+    """
+    ctx = contextvars.copy_context()
+    return _get_executor().submit(ctx.run, func, *args, **kwargs)
+
+
+def shutdown() -> None:
+    global _executor, _background_executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
+    if _background_executor is not None:
+        _background_executor.shutdown(wait=False)
+        _background_executor = None
+
+
+def _run_until(deadline_at: float, func: Callable[..., Any], *args, **kwargs) -> Any:
+    with sheets_limiter.deadline(deadline_at):
+        return func(*args, **kwargs)
+
+
+async def run(
+    func: Callable[..., Any],
+    *args,
+    timeout: Optional[float] = None,
+    **kwargs,
+) -> Any:
+    """
+    Выполняет блокирующую функцию в пуле Sheets и ждет ее с таймаутом.
+    contextvars пробрасываются в поток, таймаут — как deadline лимитера:
+    после него запросы внутри не ждут квоту и не повторяются.
+    """
+    loop = asyncio.get_running_loop()
+    limit = timeout if timeout is not None else CALL_TIMEOUT
+    ctx = contextvars.copy_context()
+    call = functools.partial(
+        ctx.run,
+        _run_until,
+        time.monotonic() + limit,
+        func,
+        *args,
+        **kwargs,
+    )
+
+    fut = loop.run_in_executor(_get_executor(), call)
+
+    try:
+        return await asyncio.wait_for(fut, limit)
+    except asyncio.TimeoutError:
+        log.error(
+            f"[SHEETS_ASYNC] timeout after {limit}s "
+            f"func={getattr(func, '__qualname__', func)!r}"
+        )
+        raise
+
+
+async def execute(request, *, timeout: Optional[float] = None) -> dict:
+    """
+    Исполняет готовый googleapiclient request (…values().get(...)) вне loop.
+    """
+    return await run(request.execute, timeout=timeout)
+
+
+# -------------------------------------------------
+# Values
+# -------------------------------------------------
+
+async def get_values(
+    spreadsheet_id: str,
+    range_: str,
+    *,
+    timeout: Optional[float] = None,
+) -> list:
+    request = get_sheets_service().spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id,
+        range=range_,
+    )
+    resp = await execute(request, timeout=timeout)
+    return resp.get("values", [])
+
+
+async def update_values(
+    spreadsheet_id: str,
+    range_: str,
+    values: list,
+    *,
+    timeout: Optional[float] = None,
+) -> dict:
+    request = get_sheets_service().spreadsheets().values().update(
+        spreadsheetId=spreadsheet_id,
+        range=range_,
+        valueInputOption="RAW",
+        body={"values": values},
+    )
+    return await execute(request, timeout=timeout)
+
+
+async def batch_update_values(
+    spreadsheet_id: str,
+    data: list,
+    *,
+    timeout: Optional[float] = None,
+) -> dict:
+    """
+    data: [{"range": "orders!J5", "values": [["approved"]]}, ...]
+    """
+    request = get_sheets_service().spreadsheets().values().batchUpdate(
+        spreadsheetId=spreadsheet_id,
+        body={
+            "valueInputOption": "RAW",
+            "data": data,
+        },
+    )
+    return await execute(request, timeout=timeout)
+
+
+async def append_values(
+    spreadsheet_id: str,
+    range_: str,
+    values: list,
+    *,
+    timeout: Optional[float] = None,
+) -> dict:
+    request = get_sheets_service().spreadsheets().values().append(
+        spreadsheetId=spreadsheet_id,
+        range=range_,
+        valueInputOption="RAW",
+        body={"values": values},
+    )
+    return await execute(request, timeout=timeout)
+
+
+# -------------------------------------------------
+# Заказы (awaitable, через storage)
+# -------------------------------------------------
+
+async def get_order_row(
+    order_id: str,
+    *,
+    spreadsheet_id: str,
+    kitchen_id: Optional[str] = None,
+):
+    return await run(
+        get_storage().orders.get,
+        spreadsheet_id,
+        order_id,
+        kitchen_id=kitchen_id,
+    )
+
+
+async def read_order_row(spreadsheet_id: str, row_idx: int) -> list:
+    return await run(get_storage().orders.read_row, spreadsheet_id, row_idx)
+
+
+async def locate_order(order_id: str, kitchens: dict):
+    return await run(get_storage().orders.locate, order_id, kitchens)
+
+
+async def update_order_cells(*, row_idx: int, updates: dict, spreadsheet_id: str):
+    cells = sheets_repo.order_field_cells(updates)
+    if not cells:
+        return
+    return await run(
+        get_storage().orders.update_cells,
+        spreadsheet_id,
+        row_idx,
+        cells,
+    )
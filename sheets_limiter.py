@@ -0,0 +1,318 @@
+# sheets_limiter.py
+"""
+Общий лимитер запросов к Google Sheets (квоты + повторы на 429/5xx).
+
+Раньше поллер, хендлеры стафа и покупатели били в Sheets API без всякой
+координации. В обед первый 429 превращался в исключение в логе
+и потерянную запись (например, маркер AF в orders_job).
+
+Теперь каждый запрос (sheets_repo._SharedHttpRequest.execute) проходит здесь:
+- token bucket на проект и на таблицу, отдельно чтение и запись
+  (квоты Google считаются в минуту: SHEETS_*_PER_MINUTE)
+- приоритет: интерактивные запросы (покупатель, стафф) берут токены первыми,
+  фоновые (поллер, репликация, прогревы) ждут, пока интерактивных нет,
+  и не трогают резерв SHEETS_INTERACTIVE_RESERVE
+- 429 / 5xx -> повтор с экспоненциальной задержкой и джиттером;
+  на 429 bucket проекта ставится на паузу, чтобы притормозили все
+- у каждого вызова есть срок: таймаут sheets_async.run (deadline в contextvar),
+  иначе SHEETS_INTERACTIVE_BUDGET / SHEETS_BACKGROUND_BUDGET. Когда срок вышел,
+  вызов не ждет токен и не повторяется (SheetsDeadlineExceeded):
+  вызывающий уже ушел, а поток и токены нужны следующим
+- append (не идемпотентен) на 5xx не повторяем: запись могла пройти
+
+Фоновый код помечает себя:
+
+    sheets_limiter.mark_background()            # в начале фоновой задачи
+    with sheets_limiter.background(): ...        # на участок кода / submit
+
+Приоритет живет в contextvar и доезжает до потоков sheets_async;
+фоновые вызовы sheets_async отправляет в свой пул (SHEETS_BACKGROUND_WORKERS).
+"""
+
+import contextlib
+import contextvars
+import logging
+import os
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from googleapiclient.errors import HttpError
+
+log = logging.getLogger("SHEETS_LIMITER")
+
+
+# квоты Sheets API: в минуту на проект и на пользователя (service account)
+SHEETS_READS_PER_MINUTE = float(os.getenv("SHEETS_READS_PER_MINUTE", "60"))
+SHEETS_WRITES_PER_MINUTE = float(os.getenv("SHEETS_WRITES_PER_MINUTE", "60"))
+# одна горячая кухня не должна съедать всю квоту проекта
+SHEETS_SPREADSHEET_READS_PER_MINUTE = float(os.getenv("SHEETS_SPREADSHEET_READS_PER_MINUTE", "40"))
+SHEETS_SPREADSHEET_WRITES_PER_MINUTE = float(os.getenv("SHEETS_SPREADSHEET_WRITES_PER_MINUTE", "40"))
+# доля емкости bucket'а, которую фоновые запросы не трогают
+SHEETS_INTERACTIVE_RESERVE = float(os.getenv("SHEETS_INTERACTIVE_RESERVE", "0.25"))
+# срок вызова без deadline (sync-код, sheets_async.submit):
+# ожидание токена + повторы укладываются в этот бюджет
+SHEETS_INTERACTIVE_BUDGET = float(os.getenv("SHEETS_INTERACTIVE_BUDGET", "15"))
+SHEETS_BACKGROUND_BUDGET = float(os.getenv("SHEETS_BACKGROUND_BUDGET", "60"))
+SHEETS_MAX_RETRIES = int(os.getenv("SHEETS_MAX_RETRIES", "5"))
+SHEETS_BACKOFF_BASE = float(os.getenv("SHEETS_BACKOFF_BASE", "1"))
+SHEETS_BACKOFF_MAX = float(os.getenv("SHEETS_BACKOFF_MAX", "32"))
+SHEETS_LIMITER_ENABLED = os.getenv("SHEETS_LIMITER_ENABLED", "1") == "1"
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+_priority: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "sheets_priority",
+    default=INTERACTIVE,
+)
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar(
+    "sheets_deadline",
+    default=None,
+)
+
+_SPREADSHEET_RE = re.compile(r"/spreadsheets/([^/:?]+)")
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+# -------------------------------------------------
+# Приоритет
+# -------------------------------------------------
+
+def mark_background() -> None:
+    """
+    Все запросы текущей задачи / контекста фоновые.
+    """
+    _priority.set(BACKGROUND)
+
+
+@contextlib.contextmanager
+def background():
+    token = _priority.set(BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def is_background() -> bool:
+    return _priority.get() == BACKGROUND
+
+
+@contextlib.contextmanager
+def deadline(at: float):
+    """
+    Срок (time.monotonic) для запросов внутри: после него вызывающий уже не ждет.
+    """
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class SheetsDeadlineExceeded(TimeoutError):
+    pass
+
+
+# -------------------------------------------------
+# Token bucket (блокирующий: запросы идут из потоков sheets_async)
+# -------------------------------------------------
+
+class PriorityBucket:
+    """
+    rate токенов в минуту, емкость = запас на 10 секунд (но не меньше 1).
+    Фоновые ждут, пока есть интерактивные ожидающие, и оставляют резерв.
+    """
+
+    def __init__(self, name: str, per_minute: float):
+        self.name = name
+        self.rate = max(per_minute, 1.0) / 60.0
+        self.capacity = max(1.0, self.rate * 10)
+        # резерв не больше емкости-1, иначе фоновые не получат токен никогда
+        self.reserve = min(self.capacity * SHEETS_INTERACTIVE_RESERVE, self.capacity - 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._interactive_waiting = 0
+        self._cond = threading.Condition()
+        self.waited = 0
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float) -> None:
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._updated = time.monotonic()
+
+    def acquire(self, priority: str, deadline: float) -> bool:
+        """
+        False, если до deadline токен так и не достался.
+        """
+        interactive = priority == INTERACTIVE
+        need = 1.0 if interactive else 1.0 + self.reserve
+        waited = False
+
+        with self._cond:
+            if interactive:
+                self._interactive_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if now >= deadline:
+                        return False
+
+                    if now < self._paused_until:
+                        wait = self._paused_until - now
+                    else:
+                        self._refill(now)
+                        blocked = not interactive and self._interactive_waiting > 0
+                        if not blocked and self._tokens >= need:
+                            self._tokens -= 1.0
+                            return True
+                        wait = max((need - self._tokens) / self.rate, 0.05)
+
+                    if not waited:
+                        waited = True
+                        self.waited += 1
+                    self._cond.wait(min(wait, deadline - now))
+            finally:
+                if interactive:
+                    self._interactive_waiting -= 1
+                    self._cond.notify_all()
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            self._refill(time.monotonic())
+            return {
+                "tokens": round(self._tokens, 2),
+                "capacity": round(self.capacity, 2),
+                "waited": self.waited,
+            }
+
+
+_lock = threading.Lock()
+_BUCKETS: Dict[Tuple[str, str], PriorityBucket] = {}
+
+_STATS = {
+    "requests": 0,
+    "retries": 0,
+    "rate_limited": 0,
+    "server_errors": 0,
+    "gave_up": 0,
+    "expired": 0,
+}
+
+
+def _bucket(scope: str, kind: str) -> PriorityBucket:
+    key = (scope, kind)
+    bucket = _BUCKETS.get(key)
+    if bucket is None:
+        with _lock:
+            bucket = _BUCKETS.get(key)
+            if bucket is None:
+                if scope == "project":
+                    rate = SHEETS_READS_PER_MINUTE if kind == "read" else SHEETS_WRITES_PER_MINUTE
+                else:
+                    rate = (
+                        SHEETS_SPREADSHEET_READS_PER_MINUTE
+                        if kind == "read"
+                        else SHEETS_SPREADSHEET_WRITES_PER_MINUTE
+                    )
+                bucket = _BUCKETS[key] = PriorityBucket(f"{scope}:{kind}", rate)
+    return bucket
+
+
+def _backoff(attempt: int) -> float:
+    # full jitter: равномерно в [0, min(max, base * 2^attempt)]
+    return random.uniform(0, min(SHEETS_BACKOFF_MAX, SHEETS_BACKOFF_BASE * 2 ** attempt))
+
+
+def _acquire(spreadsheet_id: str, kind: str, priority: str, deadline: float) -> None:
+    for bucket in (_bucket(spreadsheet_id, kind), _bucket("project", kind)):
+        if not bucket.acquire(priority, deadline):
+            _STATS["expired"] += 1
+            log.warning(
+                f"[SHEETS_LIMITER] {bucket.name} no token before deadline, "
+                f"dropped priority={priority}"
+            )
+            raise SheetsDeadlineExceeded(f"no Sheets quota for {bucket.name} before deadline")
+
+
+# -------------------------------------------------
+# Исполнение
+# -------------------------------------------------
+
+def execute(request, call: Callable[[], dict]) -> dict:
+    """
+    Выполняет HttpRequest через лимитер (sheets_repo._SharedHttpRequest).
+    """
+    if not SHEETS_LIMITER_ENABLED:
+        return call()
+
+    m = _SPREADSHEET_RE.search(request.uri or "")
+    spreadsheet_id = m.group(1) if m else "unknown"
+    kind = "read" if request.method == "GET" else "write"
+    is_append = ":append" in (request.uri or "")
+    priority = _priority.get()
+
+    budget = SHEETS_INTERACTIVE_BUDGET if priority == INTERACTIVE else SHEETS_BACKGROUND_BUDGET
+    deadline_at = time.monotonic() + budget
+    caller_deadline = _deadline.get()
+    if caller_deadline is not None:
+        deadline_at = min(deadline_at, caller_deadline)
+
+    attempt = 0
+    while True:
+        _acquire(spreadsheet_id, kind, priority, deadline_at)
+        _STATS["requests"] += 1
+
+        try:
+            return call()
+        except HttpError as e:
+            status = int(getattr(e.resp, "status", 0) or 0)
+            if status not in _RETRY_STATUSES:
+                raise
+
+            if status == 429:
+                _STATS["rate_limited"] += 1
+            else:
+                _STATS["server_errors"] += 1
+                if is_append:
+                    # append мог примениться: повтор = дубль строки
+                    raise
+
+            delay = _backoff(attempt)
+            out_of_budget = time.monotonic() + delay > deadline_at
+
+            if attempt >= SHEETS_MAX_RETRIES or out_of_budget:
+                _STATS["gave_up"] += 1
+                log.error(
+                    f"[SHEETS_LIMITER] {kind} spreadsheet={spreadsheet_id} "
+                    f"status={status} gave up after {attempt} retries priority={priority}"
+                )
+                raise
+
+            if status == 429:
+                # квота кончилась у всех: тормозим весь проект
+                _bucket("project", kind).pause(delay)
+
+            attempt += 1
+            _STATS["retries"] += 1
+            log.warning(
+                f"[SHEETS_LIMITER] {kind} spreadsheet={spreadsheet_id} status={status} "
+                f"retry {attempt}/{SHEETS_MAX_RETRIES} in {delay:.1f}s priority={priority}"
+            )
+            time.sleep(delay)
+
+
+def limiter_stats() -> dict:
+    with _lock:
+        buckets = {f"{scope}:{kind}": b.snapshot() for (scope, kind), b in _BUCKETS.items()}
+    return {**_STATS, "buckets": buckets}
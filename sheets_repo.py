@@ -3,10 +3,22 @@
 import os
 import json
 import base64
-from typing import Tuple, Optional
+import logging
+import re
+import threading
+from typing import Dict, Tuple, Optional
 
+import httplib2
+from google.auth.transport.requests import Request
 from google.oauth2.service_account import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
+from googleapiclient.http import HttpRequest
+
+import order_index
+import sheets_limiter
+
+log = logging.getLogger("SHEETS_REPO")
 
 
 # -------------------------------------------------
@@ -14,21 +26,42 @@ from googleapiclient.discovery import build
 # -------------------------------------------------
 
 ORDERS_RANGE = "orders!A:AD"
+ORDER_IDS_RANGE = "orders!A:A"
+ORDER_ROW_RANGE = "orders!A{row}:AF{row}"
+ORDERS_APPEND_RANGE = "orders!A:AF"
 _SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+_HTTP_TIMEOUT = int(os.getenv("SHEETS_HTTP_TIMEOUT", "30"))
+
+# локальная замена API (fake_sheets_server.py): без credentials и без Google
+SHEETS_API_ENDPOINT = os.getenv("SHEETS_API_ENDPOINT", "").strip()
 
 
 # -------------------------------------------------
-# Sheets service (lazy, b64, Railway-safe)
+# Sheets service (shared, thread-safe, Railway-safe)
 # -------------------------------------------------
+#
+# Один клиент на процесс:
+# - service account декодируется из b64 один раз
+# - build("sheets", "v4") выполняется один раз
+# - токен общий, обновляется под локом и только когда истек
+# - httplib2.Http не thread-safe, поэтому транспорт (keep-alive)
+#   держим свой на каждый поток и переиспользуем между запросами
 
+_lock = threading.Lock()
+_thread_local = threading.local()
+
+_credentials: Optional[Credentials] = None
 _sheets_service = None
 
+_STATS = {
+    "client_builds": 0,
+    "credential_loads": 0,
+    "token_refreshes": 0,
+    "transports": 0,
+}
 
-def get_sheets_service():
-    global _sheets_service
-    if _sheets_service:
-        return _sheets_service
 
+def _load_credentials() -> Credentials:
     b64 = os.getenv("GOOGLE_SERVICE_ACCOUNT_B64", "").strip()
     if not b64:
         raise RuntimeError("GOOGLE_SERVICE_ACCOUNT_B64 is not set")
@@ -40,84 +73,267 @@ def get_sheets_service():
     except Exception as e:
         raise RuntimeError("Invalid GOOGLE_SERVICE_ACCOUNT_B64") from e
 
-    creds = Credentials.from_service_account_info(
+    _STATS["credential_loads"] += 1
+
+    return Credentials.from_service_account_info(
         service_account_info,
         scopes=_SCOPES,
     )
 
-    _sheets_service = build(
-        "sheets",
-        "v4",
-        credentials=creds,
-        cache_discovery=False,
+
+def _ensure_token() -> None:
+    """
+    Обновляет access token, только если он истек (или его еще нет).
+    Лок не дает нескольким потокам обновлять токен одновременно.
+    """
+    if _credentials is None:  # SHEETS_API_ENDPOINT: авторизации нет
+        return
+
+    if _credentials.valid:
+        return
+
+    with _lock:
+        if _credentials.valid:
+            return
+        _credentials.refresh(Request())
+        _STATS["token_refreshes"] += 1
+
+
+def _new_http():
+    if _credentials is None:
+        return httplib2.Http(timeout=_HTTP_TIMEOUT)
+    return AuthorizedHttp(
+        _credentials,
+        http=httplib2.Http(timeout=_HTTP_TIMEOUT),
     )
 
+
+def _thread_http():
+    http = getattr(_thread_local, "http", None)
+    if http is None:
+        http = _new_http()
+        _thread_local.http = http
+        with _lock:
+            _STATS["transports"] += 1
+    return http
+
+
+class _SharedHttpRequest(HttpRequest):
+    """
+    HttpRequest, который исполняется на транспорте текущего потока.
+    Благодаря этому один service можно безопасно дергать из разных потоков.
+    Квоты и повторы на 429/5xx — в sheets_limiter.
+    """
+
+    def execute(self, http=None, num_retries=0):
+        _ensure_token()
+        return sheets_limiter.execute(
+            self,
+            lambda: super(_SharedHttpRequest, self).execute(
+                http=http or _thread_http(),
+                num_retries=num_retries,
+            ),
+        )
+
+
+def get_sheets_service():
+    global _sheets_service, _credentials
+    if _sheets_service:
+        return _sheets_service
+
+    with _lock:
+        if _sheets_service:
+            return _sheets_service
+
+        options = {}
+        if SHEETS_API_ENDPOINT:
+            options["client_options"] = {"api_endpoint": SHEETS_API_ENDPOINT}
+            log.warning(f"Sheets API endpoint overridden: {SHEETS_API_ENDPOINT}")
+        elif _credentials is None:
+            _credentials = _load_credentials()
+
+        service = build(
+            "sheets",
+            "v4",
+            http=_new_http(),
+            requestBuilder=_SharedHttpRequest,
+            cache_discovery=False,
+            **options,
+        )
+        _STATS["client_builds"] += 1
+        _sheets_service = service
+
     return _sheets_service
 
 
+def sheets_client_stats() -> dict:
+    """
+    Счетчики клиента: сколько раз строили service, грузили credentials,
+    обновляли токен и создавали транспорты. В норме client_builds == 1.
+    """
+    with _lock:
+        return dict(_STATS)
+
+
 # -------------------------------------------------
 # Orders
 # -------------------------------------------------
 
-def find_order_row_by_id(
+def read_order_row(spreadsheet_id: str, row_idx: int) -> list:
+    """
+    Читает одну строку заказа (A:AF)
+    с еще не реплицированными записями order_store поверх.
+    """
+    import order_store
+
+    service = get_sheets_service()
+
+    values = service.spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id,
+        range=ORDER_ROW_RANGE.format(row=row_idx),
+    ).execute().get("values", [])
+
+    if not values:
+        return []
+    return order_store.overlay(spreadsheet_id, row_idx, values[0])
+
+
+def get_order_row(
     order_id: str,
     *,
     spreadsheet_id: str,
-) -> Tuple[Optional[int], Optional[dict]]:
+    kitchen_id: Optional[str] = None,
+) -> Tuple[Optional[int], Optional[list]]:
     """
-    Ищет заказ по order_id.
-    spreadsheet_id ОБЯЗАТЕЛЕН.
+    Возвращает (row_idx, row) заказа.
+
+    1) индекс знает строку -> читаем только ее и сверяем order_id
+    2) промах / строка съехала -> читаем колонку A, переиндексируем,
+       затем читаем одну строку
     """
+    order_id = str(order_id)
+
+    loc = order_index.lookup(spreadsheet_id, order_id)
+    if loc:
+        row = read_order_row(spreadsheet_id, loc.row_idx)
+        if row and row[0] == order_id:
+            return loc.row_idx, row
+        order_index.forget(spreadsheet_id, order_id)
+
     service = get_sheets_service()
-    sheet = service.spreadsheets()
 
-    rows = sheet.values().get(
+    ids = service.spreadsheets().values().get(
         spreadsheetId=spreadsheet_id,
-        range=ORDERS_RANGE,
+        range=ORDER_IDS_RANGE,
     ).execute().get("values", [])
 
-    for idx, row in enumerate(rows[1:], start=2):
-        if row and row[0] == order_id:
-            return idx, {
-                "order_id": row[0],
-                "created_at": row[1] if len(row) > 1 else "",
-                "user_id": row[2] if len(row) > 2 else "",
-            }
+    order_index.index_rows(spreadsheet_id, ids, kitchen_id)
+
+    loc = order_index.lookup(spreadsheet_id, order_id)
+    if not loc:
+        return None, None
+
+    row = read_order_row(spreadsheet_id, loc.row_idx)
+    if not row or row[0] != order_id:
+        return None, None
+
+    return loc.row_idx, row
+
 
-    return None, None
+def locate_order(
+    order_id: str,
+    kitchens: Dict[str, str],
+) -> Tuple[Optional[str], Optional[str], Optional[int], Optional[list]]:
+    """
+    Ищет заказ среди кухонь.
 
+    kitchens: {kitchen_id: spreadsheet_id}
+    Возвращает (kitchen_id, spreadsheet_id, row_idx, row).
+    Сначала пробует кухню из индекса, потом остальные.
+    """
+    order_id = str(order_id)
+    candidates = list(kitchens.items())
 
-def update_order_cells(
+    loc = order_index.locate(order_id)
+    if loc:
+        candidates.sort(key=lambda kv: kv[1] != loc.spreadsheet_id)
+
+    for kid, spreadsheet_id in candidates:
+        if not spreadsheet_id:
+            continue
+        try:
+            row_idx, row = get_order_row(
+                order_id,
+                spreadsheet_id=spreadsheet_id,
+                kitchen_id=kid,
+            )
+        except Exception as e:
+            log.warning(f"Failed to search order in kitchen {kid}: {e}")
+            continue
+        if row_idx:
+            return kid, spreadsheet_id, row_idx, row
+
+    return None, None, None, None
+
+
+def first_row_of(a1_range: str) -> Optional[int]:
+    """
+    "orders!A57:AF57" -> 57
+    """
+    m = re.search(r"![A-Z]+(\d+)", a1_range or "")
+    return int(m.group(1)) if m else None
+
+
+def append_order_row(
+    row_values: list,
     *,
-    row_idx: int,
-    updates: dict,
     spreadsheet_id: str,
-):
+    kitchen_id: Optional[str] = None,
+) -> Optional[int]:
     """
-    Обновляет ячейки заказа.
+    Добавляет строку заказа без чтения вкладки.
 
-    row_idx: номер строки заказа (1-based)
-    updates: словарь вида {column_name: value}
-    spreadsheet_id: ОБЯЗАТЕЛЕН
+    values().append атомарен на стороне Google, поэтому два
+    одновременных чекаута не претендуют на одну строку.
+    Номер строки берем из updatedRange ответа и кладем в order_index,
+    чтобы notify / решение / ETA находили заказ без поиска.
     """
     service = get_sheets_service()
-    sheet = service.spreadsheets()
 
-    col_map = {
-        "status": "J",
-        "handled_at": "K",
-        "handled_by": "L",
-        "reaction_seconds": "M",
-    }
+    resp = service.spreadsheets().values().append(
+        spreadsheetId=spreadsheet_id,
+        range=ORDERS_APPEND_RANGE,
+        valueInputOption="RAW",
+        insertDataOption="INSERT_ROWS",
+        body={"values": [row_values]},
+    ).execute()
 
-    for key, value in updates.items():
-        col = col_map.get(key)
-        if not col:
-            continue
+    updated_range = resp.get("updates", {}).get("updatedRange", "")
+    row_idx = first_row_of(updated_range)
+
+    if row_idx and row_values:
+        order_index.remember(spreadsheet_id, row_values[0], row_idx, kitchen_id)
+    else:
+        log.warning(f"append_order_row: no row in response range={updated_range!r}")
+
+    return row_idx
+
+
+# поля заказа, которые пишут хендлеры по имени (sheets_async.update_order_cells)
+ORDER_FIELD_COLUMNS = {
+    "status": "J",
+    "handled_at": "K",
+    "handled_by": "L",
+    "reaction_seconds": "M",
+}
 
-        sheet.values().update(
-            spreadsheetId=spreadsheet_id,
-            range=f"orders!{col}{row_idx}",
-            valueInputOption="RAW",
-            body={"values": [[value]]},
-        ).execute()
+
+def order_field_cells(updates: dict) -> dict:
+    """
+    {"status": "approved"} -> {"J": "approved"}; неизвестные поля отбрасываются.
+    """
+    return {
+        ORDER_FIELD_COLUMNS[key]: value
+        for key, value in updates.items()
+        if key in ORDER_FIELD_COLUMNS
+    }
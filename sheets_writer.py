@@ -0,0 +1,173 @@
+# sheets_writer.py
+"""
+Коалесинг записей в Google Sheets.
+
+Раньше одна логическая операция (решение стафа, ETA) писала ячейки
+по одной: values().update на каждую колонку + отдельный batchUpdate.
+Каждая запись = отдельный HTTP round trip и отдельная единица квоты.
+
+Теперь:
+- изменения операции копятся в WriteBatch
+- на выходе из операции уходит ОДИН values().batchUpdate на таблицу
+- по каждой операции считаем запросы и ячейки (write_stats)
+
+Использование:
+
+    async with sheets_writer.operation("staff_decision") as batch:
+        batch.set_row_cells(spreadsheet_id, row_idx, {"AG": "accepted"})
+        await handle_staff_decision(...)   # update_order_cells попадет сюда же
+
+Пока операция активна, storage orders.update_cells (sheets_async.update_order_cells)
+не пишет сам, а добавляет ячейки в текущий batch (contextvars, в т.ч. в потоках sheets_async).
+
+flush отдает накопленное в get_storage().orders.write_cells: на Sheets это
+локальный outbox order_store (по умолчанию, в Sheets уходит фоновой
+репликацией) или batchUpdate, на STORAGE_BACKEND=memory — память процесса.
+"""
+
+import contextvars
+import logging
+import threading
+from typing import Dict, Optional
+
+from storage import get_storage
+
+log = logging.getLogger("SHEETS_WRITER")
+
+
+_current: contextvars.ContextVar[Optional["WriteBatch"]] = contextvars.ContextVar(
+    "sheets_write_batch",
+    default=None,
+)
+
+_stats_lock = threading.Lock()
+_STATS: Dict[str, Dict[str, int]] = {}
+
+
+def current() -> Optional["WriteBatch"]:
+    """
+    Активный batch текущей операции (или None).
+    """
+    return _current.get()
+
+
+class WriteBatch:
+    def __init__(self, operation: str):
+        self.operation = operation
+        self._lock = threading.Lock()
+        # spreadsheet_id -> A1 range -> values (повторная запись в ячейку перетирает)
+        self._data: Dict[str, Dict[str, list]] = {}
+
+    # ---------- сбор ----------
+
+    def set(self, spreadsheet_id: str, range_: str, value) -> None:
+        with self._lock:
+            self._data.setdefault(spreadsheet_id, {})[range_] = [[value]]
+
+    def set_row_cells(
+        self,
+        spreadsheet_id: str,
+        row_idx: int,
+        cells: dict,
+        *,
+        sheet: str = "orders",
+    ) -> None:
+        """
+        cells: {"J": "approved", "K": "...", ...}
+        """
+        for col, value in cells.items():
+            self.set(spreadsheet_id, f"{sheet}!{col}{row_idx}", value)
+
+    def extend(self, spreadsheet_id: str, data: list) -> None:
+        """
+        data в формате batchUpdate: [{"range": ..., "values": [[...]]}, ...]
+        """
+        with self._lock:
+            target = self._data.setdefault(spreadsheet_id, {})
+            for item in data:
+                target[item["range"]] = item["values"]
+
+    @property
+    def cells(self) -> int:
+        with self._lock:
+            return sum(len(ranges) for ranges in self._data.values())
+
+    # ---------- запись ----------
+
+    def flush(self) -> int:
+        """
+        Отдает накопленное хранилищу (см. storage write_cells).
+        Блокирующий, из async вызывать через flush_async.
+        Возвращает количество HTTP-запросов.
+        """
+        with self._lock:
+            pending = self._data
+            self._data = {}
+
+        if not pending:
+            return 0
+
+        requests = get_storage().orders.write_cells(pending, operation=self.operation)
+        cells = sum(len(ranges) for ranges in pending.values())
+        _record(self.operation, requests, cells)
+
+        log.info(
+            f"[SHEETS_WRITER] op={self.operation} "
+            f"requests={requests} cells={cells}"
+        )
+
+        return requests
+
+    async def flush_async(self) -> int:
+        import sheets_async
+
+        return await sheets_async.run(self.flush)
+
+
+class operation:
+    """
+    async context manager логической операции.
+    Все записи внутри уходят одним flush на выходе
+    (и при ошибке тоже: раньше ячейки писались по ходу, частичные
+    записи были нормой, поэтому накопленное не теряем).
+    """
+
+    def __init__(self, name: str):
+        self.batch = WriteBatch(name)
+        self._token = None
+
+    async def __aenter__(self) -> WriteBatch:
+        self._token = _current.set(self.batch)
+        return self.batch
+
+    async def __aexit__(self, exc_type, exc, tb):
+        _current.reset(self._token)
+
+        try:
+            await self.batch.flush_async()
+        except Exception:
+            log.exception(f"[SHEETS_WRITER] flush failed op={self.batch.operation}")
+            if exc is None:
+                raise
+
+        return False
+
+
+def _record(operation_name: str, requests: int, cells: int) -> None:
+    with _stats_lock:
+        s = _STATS.setdefault(
+            operation_name,
+            {"operations": 0, "requests": 0, "cells": 0},
+        )
+        s["operations"] += 1
+        s["requests"] += requests
+        s["cells"] += cells
+
+
+def write_stats() -> Dict[str, Dict[str, int]]:
+    """
+    Счетчики записей по операциям:
+    {"staff_decision": {"operations": 3, "requests": 3, "cells": 18}, ...}
+    """
+    with _stats_lock:
+        return {k: dict(v) for k, v in _STATS.items()}
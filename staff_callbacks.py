@@ -1,11 +1,15 @@
 # staff_callbacks.py
 
 import logging
+from datetime import datetime
 from telegram import Update
 from telegram.ext import ContextTypes
 from telegram.constants import ParseMode
-from staff_decision import handle_staff_decision
+from staff_decision import handle_staff_decision, notify_client
 from keyboards_staff import kb_staff_pickup_eta, kb_staff_only_check
+from storage import get_storage
+import sheets_async
+import sheets_writer
 
 log = logging.getLogger("STAFF_CALLBACKS")
 
@@ -19,22 +23,8 @@ def find_order_row_index(
     то есть первая строка заголовки, данные начинаются со 2.
     """
     try:
-        service = get_sheets_service()
-        sheet = service.spreadsheets()
-
-        rows = (
-            sheet.values()
-            .get(
-                spreadsheetId=spreadsheet_id,
-                range=ORDERS_RANGE,
-            )
-            .execute()
-            .get("values", [])
-        )
-
-        for idx, r in enumerate(rows[1:], start=2):
-            if r and r[0] == str(order_id):
-                return idx
+        idx, _ = get_storage().orders.get(spreadsheet_id, order_id)
+        return idx
 
     except Exception:
         log.exception("find_order_row_index failed order_id=%s", order_id)
@@ -103,60 +93,56 @@ async def staff_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
     try:
-        await handle_staff_decision(
-            context=context,
-            bot=context.bot,
-            order_id=order_id,
-            decision=decision,
-            staff_user_id=staff_user.id,
-            staff_username=staff_user.username,
-        )
-        log.info(f"handle_staff_decision OK for order {order_id}")
-        # 3.2: kitchen_state -> orders!AG/AH (accepted / rejected)
-        try:
-            spreadsheet_id = kitchen.spreadsheet_id
-            target_idx = find_order_row_index(
-                spreadsheet_id=spreadsheet_id,
+        # J..M (решение) + AG/AH (kitchen_state) -> один batchUpdate
+        # покупателю пишем только после того, как batch записан
+        async with sheets_writer.operation("staff_decision") as batch:
+            notice = await handle_staff_decision(
+                context=context,
+                bot=context.bot,
                 order_id=order_id,
+                decision=decision,
+                staff_user_id=staff_user.id,
+                staff_username=staff_user.username,
             )
+            log.info(f"handle_staff_decision OK for order {order_id}")
+            # 3.2: kitchen_state -> orders!AG/AH (accepted / rejected)
+            try:
+                spreadsheet_id = kitchen.spreadsheet_id
+                target_idx = await sheets_async.run(
+                    find_order_row_index,
+                    spreadsheet_id=spreadsheet_id,
+                    order_id=order_id,
+                )
 
-            if target_idx is None:
-                log.warning(
-                    "[KITCHEN_STATE] row not found, skip | order=%s kitchen=%s",
+                if target_idx is None:
+                    log.warning(
+                        "[KITCHEN_STATE] row not found, skip | order=%s kitchen=%s",
+                        order_id,
+                        kitchen_id,
+                    )
+                else:
+                    state = "accepted" if decision == "approved" else "rejected"
+                    now_iso = datetime.utcnow().isoformat()
+
+                    # уходит одним batchUpdate вместе с J..M из handle_staff_decision
+                    batch.set_row_cells(spreadsheet_id, target_idx, {
+                        "AG": state,
+                        "AH": now_iso,
+                    })
+
+                    log.info(
+                        "[KITCHEN_STATE] queued | order=%s state=%s row=%s",
+                        order_id,
+                        state,
+                        target_idx,
+                    )
+
+            except Exception:
+                log.exception(
+                    "[KITCHEN_STATE] update failed | order=%s kitchen=%s",
                     order_id,
                     kitchen_id,
                 )
-            else:
-                state = "accepted" if decision == "approved" else "rejected"
-                now_iso = datetime.utcnow().isoformat()
-
-                service = get_sheets_service()
-                sheet = service.spreadsheets()
-
-                sheet.values().batchUpdate(
-                    spreadsheetId=spreadsheet_id,
-                    body={
-                        "valueInputOption": "RAW",
-                        "data": [
-                            {"range": f"orders!AG{target_idx}", "values": [[state]]},
-                            {"range": f"orders!AH{target_idx}", "values": [[now_iso]]},
-                        ],
-                    },
-                ).execute()
-
-                log.info(
-                    "[KITCHEN_STATE] updated | order=%s state=%s row=%s",
-                    order_id,
-                    state,
-                    target_idx,
-                )
-
-        except Exception:
-            log.exception(
-                "[KITCHEN_STATE] update failed | order=%s kitchen=%s",
-                order_id,
-                kitchen_id,
-            )
     except Exception:
         log.exception(f"handle_staff_decision FAILED for order {order_id}")
         try:
@@ -165,6 +151,9 @@ async def staff_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             pass
         return
 
+    if notice is not None:
+        await notify_client(context.bot, notice)
+
     suffix = "Принят в работу ✅" if decision == "approved" else "Отклонен ❌"
 
     try:
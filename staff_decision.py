@@ -1,5 +1,6 @@
 # staff_decision.py
 
+from dataclasses import dataclass
 from datetime import datetime, timezone
 import logging
 
@@ -10,6 +11,13 @@ log = logging.getLogger("STAFF_DECISION")
 
 log = logging.getLogger("STAFF_DECISION")
 
+
+@dataclass(frozen=True)
+class ClientNotice:
+    chat_id: int
+    text: str
+
+
 async def handle_staff_decision(
     *,
     context,
@@ -18,18 +26,22 @@ async def handle_staff_decision(
     decision: str,
     staff_user_id: int,
     staff_username: str | None,
-):
+) -> ClientNotice | None:
     """
     Единственная точка обработки решения стафа.
     Ищет заказ во ВСЕХ кухнях.
+
+    Покупателю сама НЕ пишет: возвращает ClientNotice, а вызывающий
+    отправляет его через notify_client() после того, как
+    sheets_writer.operation() записал статус (иначе покупатель узнал бы
+    о решении, которого нет в таблице).
     """
 
     from datetime import datetime, timezone
     import logging
 
     from kitchen_context import _REGISTRY
-    from sheets_repo import get_sheets_service, update_order_cells
-    from config import ORDERS_RANGE
+    import sheets_async
     from telegram.constants import ParseMode
 
     log = logging.getLogger("STAFF_DECISION")
@@ -39,43 +51,19 @@ async def handle_staff_decision(
     # 1️⃣ Поиск заказа во всех кухнях
     # ------------------------------------------------------------------
 
-    spreadsheet_id = None
-    row_idx = None
-    order_row = None
-    kitchen_id = None
-
-    service = get_sheets_service()
-    sheets_api = service.spreadsheets()
-
-    for kid, kitchen in _REGISTRY.items():
-        if not kitchen or not kitchen.spreadsheet_id:
-            continue
-
-        try:
-            rows = (
-                sheets_api.values()
-                .get(
-                    spreadsheetId=kitchen.spreadsheet_id,
-                    range=ORDERS_RANGE,
-                )
-                .execute()
-                .get("values", [])
-            )
-
-            for i, row in enumerate(rows[1:], start=2):
-                if row and row[0] == order_id:
-                    spreadsheet_id = kitchen.spreadsheet_id
-                    kitchen_id = kid
-                    row_idx = i
-                    order_row = row
-                    break
-
-            if spreadsheet_id:
-                break
-
-        except Exception as e:
-            log.warning(f"Failed to search order in kitchen {kid}: {e}")
-            continue
+    kitchens = {
+        kid: kitchen.spreadsheet_id
+        for kid, kitchen in _REGISTRY.items()
+        if kitchen and kitchen.spreadsheet_id
+    }
+
+    try:
+        kitchen_id, spreadsheet_id, row_idx, order_row = (
+            await sheets_async.locate_order(order_id, kitchens)
+        )
+    except Exception as e:
+        log.warning(f"Failed to search order {order_id}: {e}")
+        return
 
     if not spreadsheet_id or not row_idx or not order_row:
         log.error(
@@ -122,7 +110,7 @@ async def handle_staff_decision(
     }
 
     try:
-        update_order_cells(
+        await sheets_async.update_order_cells(
             row_idx=row_idx,
             updates=updates,
             spreadsheet_id=spreadsheet_id,
@@ -132,7 +120,7 @@ async def handle_staff_decision(
         return
 
     # ------------------------------------------------------------------
-    # 4️⃣ Уведомление клиента
+    # 4️⃣ Уведомление клиента (отправит вызывающий)
     # ------------------------------------------------------------------
 
     try:
@@ -152,15 +140,6 @@ async def handle_staff_decision(
             "Мы свяжемся с вами в ближайшее время для уточнения деталей."
         )
 
-    try:
-        await bot.send_message(
-            chat_id=client_chat_id,
-            text=client_text,
-            parse_mode=ParseMode.HTML,
-        )
-    except Exception:
-        log.exception(f"Failed to notify client {client_chat_id}")
-
     # ------------------------------------------------------------------
     # 5️⃣ Лог финального состояния
     # ------------------------------------------------------------------
@@ -168,4 +147,17 @@ async def handle_staff_decision(
     log.info(
         f"Order {order_id} handled: {decision}, "
         f"kitchen={kitchen_id}, reaction_seconds={reaction_seconds}"
-    )
\ No newline at end of file
+    )
+
+    return ClientNotice(chat_id=client_chat_id, text=client_text)
+
+
+async def notify_client(bot: Bot, notice: ClientNotice) -> None:
+    try:
+        await bot.send_message(
+            chat_id=notice.chat_id,
+            text=notice.text,
+            parse_mode=ParseMode.HTML,
+        )
+    except Exception:
+        log.exception(f"Failed to notify client {notice.chat_id}")
@@ -0,0 +1,27 @@
+# state_dir.py
+"""
+Локальное состояние бота на диске (BOT_STATE_DIR, по умолчанию .state/).
+
+Здесь только то, что должно пережить рестарт и не живет в Sheets:
+прогресс рассылок, кэш адресов и т.п.
+"""
+
+import json
+import os
+
+STATE_DIR = os.getenv("BOT_STATE_DIR", ".state")
+
+
+def state_path(*parts: str) -> str:
+    return os.path.join(STATE_DIR, *parts)
+
+
+def atomic_write_json(path: str, data) -> None:
+    """
+    tmp + os.replace: упавший процесс не оставит битый файл.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
@@ -0,0 +1,159 @@
+# storage.py
+"""
+Интерфейсы хранилища: заказы, пользователи, товары, настройки кухни.
+
+Раньше доступ к данным был размазан по main.py, sheets_repo.py,
+staff_decision.py, broadcast.py: сырые values().get/update с A1-диапазонами
+прямо в хендлерах. Поменять хранилище или прогнать логику хендлеров
+без Google было нельзя.
+
+Теперь:
+- хендлеры и фасады (sheets_async, main) работают через get_storage()
+- реализации: storage_sheets (Google Sheets, по умолчанию)
+  и storage_memory (в памяти процесса, для бенчмарков и dev)
+- выбор: STORAGE_BACKEND=sheets|memory, либо set_storage() из кода
+
+Все методы блокирующие (как sheets_repo): из async звать через sheets_async.run.
+Колонки задаются буквами листа ("T", "AA"), как в существующих таблицах.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Protocol, Tuple
+
+from users_directory import UserRecord
+
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "sheets")
+
+
+class OrderRepository(Protocol):
+    def get(
+        self,
+        spreadsheet_id: str,
+        order_id: str,
+        *,
+        kitchen_id: Optional[str] = None,
+    ) -> Tuple[Optional[int], Optional[list]]:
+        """(row_idx, row) заказа или (None, None)."""
+
+    def read_row(self, spreadsheet_id: str, row_idx: int) -> list:
+        """Строка заказа A:AF (пустой список, если строки нет)."""
+
+    def rows(self, spreadsheet_id: str) -> List[list]:
+        """Лист orders целиком A:AF, rows[0] = заголовок (поллер, дашборд)."""
+
+    def locate(
+        self,
+        order_id: str,
+        kitchens: Dict[str, str],
+    ) -> Tuple[Optional[str], Optional[str], Optional[int], Optional[list]]:
+        """
+        Поиск заказа среди кухонь {kitchen_id: spreadsheet_id}.
+        (kitchen_id, spreadsheet_id, row_idx, row) или четыре None.
+        """
+
+    def append(
+        self,
+        spreadsheet_id: str,
+        row: list,
+        *,
+        kitchen_id: Optional[str] = None,
+    ) -> Optional[int]:
+        """Новый заказ, возвращает номер строки."""
+
+    def update_cells(self, spreadsheet_id: str, row_idx: int, cells: Dict[str, object]) -> None:
+        """cells: {"T": "courier_requested", ...}"""
+
+    def write_cells(self, pending: Dict[str, Dict[str, list]], *, operation: str = "") -> int:
+        """
+        Накопленное sheets_writer.WriteBatch: spreadsheet_id -> "orders!T12" -> [[value]].
+        Возвращает количество HTTP-запросов.
+        """
+
+
+class UserRepository(Protocol):
+    def get(self, spreadsheet_id: str, user_id) -> Optional[UserRecord]:
+        ...
+
+    def user_ids(self, spreadsheet_id: str) -> List[int]:
+        ...
+
+    def rows(self, spreadsheet_id: str, first_row: int = 2) -> List[list]:
+        """Сырые строки users A:G начиная с first_row (справочник users_directory)."""
+
+    def append(self, spreadsheet_id: str, rows: List[list]) -> Optional[int]:
+        """Новые строки users A:D, возвращает номер первой (None, если неизвестен)."""
+
+    def save_contacts(
+        self,
+        spreadsheet_id: str,
+        user_id,
+        *,
+        name: str,
+        phone: str,
+        telegram_chat_id: Optional[int] = None,
+    ) -> bool:
+        """False, если пользователя нет в users."""
+
+
+class ProductRepository(Protocol):
+    def rows(self, spreadsheet_id: str) -> List[list]:
+        """Сырые строки products!A2:M (разбор остается в main)."""
+
+    def append(self, spreadsheet_id: str, row: list) -> None:
+        ...
+
+    def update_cells(self, spreadsheet_id: str, product_id: str, cells: Dict[str, object]) -> bool:
+        """False, если товара нет."""
+
+
+class KitchenSettingsRepository(Protocol):
+    def get(self, spreadsheet_id: str, key: str) -> Optional[str]:
+        """Значение из kitchen!A:B (ключ в A, значение в B)."""
+
+    def city(self, spreadsheet_id: str) -> Optional[str]:
+        """Код города кухни (kitchen!C1)."""
+
+
+@dataclass(frozen=True)
+class Storage:
+    orders: OrderRepository
+    users: UserRepository
+    products: ProductRepository
+    settings: KitchenSettingsRepository
+
+
+_lock = threading.Lock()
+_storage: Optional[Storage] = None
+
+
+def _build(backend: str) -> Storage:
+    if backend == "memory":
+        from storage_memory import memory_storage
+        return memory_storage()
+
+    if backend != "sheets":
+        raise ValueError(f"Unknown STORAGE_BACKEND={backend!r}")
+
+    from storage_sheets import sheets_storage
+    return sheets_storage()
+
+
+def get_storage() -> Storage:
+    global _storage
+    if _storage is None:
+        with _lock:
+            if _storage is None:
+                _storage = _build(STORAGE_BACKEND)
+    return _storage
+
+
+def set_storage(storage: Optional[Storage]) -> None:
+    """
+    Подмена хранилища (бенчмарки, dev). None -> снова по STORAGE_BACKEND.
+    """
+    global _storage
+    with _lock:
+        _storage = storage
@@ -0,0 +1,231 @@
+# storage_memory.py
+"""
+Хранилище в памяти процесса (реализация storage.*Repository).
+
+Для бенчмарков логики хендлеров и dev без Google:
+та же раскладка листов и колонок, что в таблицах кухни.
+
+    data = {
+        "<spreadsheet_id>": {
+            "orders":   [["order_id", ...], [...], ...],   # строка 1 = заголовок
+            "users":    [["user_id", ...], [...], ...],
+            "products": [["product_id", ...], [...], ...],
+            "kitchen":  [["address", "...", "dunpo"], ...],
+        },
+    }
+    storage.set_storage(memory_storage(data))
+
+Ничего не сохраняет между запусками.
+"""
+
+import copy
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import user_registrations
+from sheets_a1 import col_idx, split_cell
+from storage import Storage
+from users_directory import UserRecord
+
+
+class _Tabs:
+    """
+    spreadsheet_id -> лист -> строки (row_idx = индекс + 1, как в Sheets).
+    """
+
+    def __init__(self, data: Optional[dict] = None):
+        self.lock = threading.RLock()
+        self.data: Dict[str, Dict[str, List[list]]] = copy.deepcopy(data or {})
+
+    def tab(self, spreadsheet_id: str, name: str) -> List[list]:
+        return self.data.setdefault(spreadsheet_id, {}).setdefault(name, [])
+
+    def set_cell(self, spreadsheet_id: str, name: str, row_idx: int, col: str, value) -> None:
+        rows = self.tab(spreadsheet_id, name)
+        while len(rows) < row_idx:
+            rows.append([])
+        row = rows[row_idx - 1]
+        i = col_idx(col)
+        if len(row) <= i:
+            row.extend([""] * (i + 1 - len(row)))
+        row[i] = value
+
+
+class MemoryOrderRepository:
+    def __init__(self, tabs: _Tabs):
+        self._tabs = tabs
+
+    def get(
+        self,
+        spreadsheet_id: str,
+        order_id: str,
+        *,
+        kitchen_id: Optional[str] = None,
+    ) -> Tuple[Optional[int], Optional[list]]:
+        with self._tabs.lock:
+            for idx, row in enumerate(self._tabs.tab(spreadsheet_id, "orders"), start=1):
+                if idx > 1 and row and str(row[0]) == str(order_id):
+                    return idx, list(row)
+        return None, None
+
+    def read_row(self, spreadsheet_id: str, row_idx: int) -> list:
+        with self._tabs.lock:
+            rows = self._tabs.tab(spreadsheet_id, "orders")
+            return list(rows[row_idx - 1]) if 0 < row_idx <= len(rows) else []
+
+    def rows(self, spreadsheet_id: str) -> List[list]:
+        with self._tabs.lock:
+            return [list(r) for r in self._tabs.tab(spreadsheet_id, "orders")]
+
+    def locate(
+        self,
+        order_id: str,
+        kitchens: Dict[str, str],
+    ) -> Tuple[Optional[str], Optional[str], Optional[int], Optional[list]]:
+        for kitchen_id, spreadsheet_id in kitchens.items():
+            row_idx, row = self.get(spreadsheet_id, order_id)
+            if row_idx:
+                return kitchen_id, spreadsheet_id, row_idx, row
+        return None, None, None, None
+
+    def append(
+        self,
+        spreadsheet_id: str,
+        row: list,
+        *,
+        kitchen_id: Optional[str] = None,
+    ) -> Optional[int]:
+        with self._tabs.lock:
+            rows = self._tabs.tab(spreadsheet_id, "orders")
+            if not rows:
+                rows.append(["order_id"])
+            rows.append(list(row))
+            return len(rows)
+
+    def update_cells(self, spreadsheet_id: str, row_idx: int, cells: Dict[str, object]) -> None:
+        with self._tabs.lock:
+            for col, value in cells.items():
+                self._tabs.set_cell(spreadsheet_id, "orders", row_idx, col, value)
+
+    def write_cells(self, pending: Dict[str, Dict[str, list]], *, operation: str = "") -> int:
+        with self._tabs.lock:
+            for spreadsheet_id, ranges in pending.items():
+                for range_, values in ranges.items():
+                    cell = split_cell(range_)
+                    if cell is None:
+                        raise ValueError(f"memory storage writes single cells, got {range_!r}")
+                    sheet, col, row_idx = cell
+                    value = values[0][0] if values and values[0] else ""
+                    self._tabs.set_cell(spreadsheet_id, sheet, row_idx, col, value)
+        return 0
+
+
+class MemoryUserRepository:
+    def __init__(self, tabs: _Tabs):
+        self._tabs = tabs
+
+    def _find(self, spreadsheet_id: str, user_id) -> Optional[int]:
+        for idx, row in enumerate(self._tabs.tab(spreadsheet_id, "users"), start=1):
+            if idx > 1 and row and str(row[0]) == str(user_id):
+                return idx
+        return None
+
+    def get(self, spreadsheet_id: str, user_id) -> Optional[UserRecord]:
+        # как на Sheets: свежая регистрация может еще ждать в очереди
+        user_registrations.ensure_written(spreadsheet_id, user_id)
+        with self._tabs.lock:
+            idx = self._find(spreadsheet_id, user_id)
+            if idx is None:
+                return None
+            return UserRecord.from_row(idx, self._tabs.tab(spreadsheet_id, "users")[idx - 1])
+
+    def user_ids(self, spreadsheet_id: str) -> List[int]:
+        with self._tabs.lock:
+            rows = self._tabs.tab(spreadsheet_id, "users")[1:]
+            return [int(r[0]) for r in rows if r and str(r[0]).isdigit()]
+
+    def rows(self, spreadsheet_id: str, first_row: int = 2) -> List[list]:
+        with self._tabs.lock:
+            return [list(r) for r in self._tabs.tab(spreadsheet_id, "users")[first_row - 1:]]
+
+    def append(self, spreadsheet_id: str, rows: List[list]) -> Optional[int]:
+        with self._tabs.lock:
+            tab = self._tabs.tab(spreadsheet_id, "users")
+            if not tab:
+                tab.append(["user_id", "username", "full_name", "created_at"])
+            tab.extend(list(r) for r in rows)
+            return len(tab) - len(rows) + 1
+
+    def save_contacts(
+        self,
+        spreadsheet_id: str,
+        user_id,
+        *,
+        name: str,
+        phone: str,
+        telegram_chat_id: Optional[int] = None,
+    ) -> bool:
+        user_registrations.ensure_written(spreadsheet_id, user_id)
+        with self._tabs.lock:
+            idx = self._find(spreadsheet_id, user_id)
+            if idx is None:
+                return False
+            self._tabs.set_cell(spreadsheet_id, "users", idx, "E", name)
+            self._tabs.set_cell(spreadsheet_id, "users", idx, "F", phone)
+            if telegram_chat_id is not None:
+                self._tabs.set_cell(spreadsheet_id, "users", idx, "G", str(telegram_chat_id))
+            return True
+
+
+class MemoryProductRepository:
+    def __init__(self, tabs: _Tabs):
+        self._tabs = tabs
+
+    def rows(self, spreadsheet_id: str) -> List[list]:
+        with self._tabs.lock:
+            return [list(r) for r in self._tabs.tab(spreadsheet_id, "products")[1:]]
+
+    def append(self, spreadsheet_id: str, row: list) -> None:
+        with self._tabs.lock:
+            rows = self._tabs.tab(spreadsheet_id, "products")
+            if not rows:
+                rows.append(["product_id"])
+            rows.append(list(row))
+
+    def update_cells(self, spreadsheet_id: str, product_id: str, cells: Dict[str, object]) -> bool:
+        with self._tabs.lock:
+            for idx, row in enumerate(self._tabs.tab(spreadsheet_id, "products"), start=1):
+                if idx > 1 and row and row[0] == product_id:
+                    for col, value in cells.items():
+                        self._tabs.set_cell(spreadsheet_id, "products", idx, col, value)
+                    return True
+        return False
+
+
+class MemoryKitchenSettingsRepository:
+    def __init__(self, tabs: _Tabs):
+        self._tabs = tabs
+
+    def get(self, spreadsheet_id: str, key: str) -> Optional[str]:
+        with self._tabs.lock:
+            for row in self._tabs.tab(spreadsheet_id, "kitchen"):
+                if len(row) >= 2 and row[0] == key:
+                    return row[1]
+        return None
+
+    def city(self, spreadsheet_id: str) -> Optional[str]:
+        with self._tabs.lock:
+            rows = self._tabs.tab(spreadsheet_id, "kitchen")
+            if rows and len(rows[0]) > 2 and rows[0][2]:
+                return str(rows[0][2]).strip()
+        return None
+
+
+def memory_storage(data: Optional[dict] = None) -> Storage:
+    tabs = _Tabs(data)
+    return Storage(
+        orders=MemoryOrderRepository(tabs),
+        users=MemoryUserRepository(tabs),
+        products=MemoryProductRepository(tabs),
+        settings=MemoryKitchenSettingsRepository(tabs),
+    )
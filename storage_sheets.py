@@ -0,0 +1,248 @@
+# storage_sheets.py
+"""
+Хранилище поверх Google Sheets (реализация storage.*Repository).
+
+Ничего нового не читает и не пишет: собирает в одном месте то, что раньше
+делали хендлеры, и опирается на уже существующие слои:
+- заказы: sheets_repo (order_index, overlay order_store),
+  запись через sheets_writer: flush операции приходит в write_cells
+  (outbox order_store или один batchUpdate на таблицу)
+- пользователи: users_directory (справочник в памяти + дочитывание),
+  сырые чтения / append users отсюда же (rows, append)
+- товары: products!A2:M, запись одним batchUpdate
+- настройки: лист kitchen
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import order_store
+import sheets_repo
+import user_registrations
+import users_directory
+from config import ORDERS_RANGE
+from sheets_repo import get_sheets_service
+from storage import Storage
+from users_directory import UserRecord
+
+log = logging.getLogger("STORAGE_SHEETS")
+
+
+PRODUCTS_RANGE = "products!A2:M"
+PRODUCT_IDS_RANGE = "products!A2:A"
+PRODUCTS_APPEND_RANGE = "products!A:G"
+KITCHEN_SETTINGS_RANGE = "kitchen!A:B"
+KITCHEN_CITY_RANGE = "kitchen!C1"
+USERS_ROWS_RANGE = "users!A{first_row}:G"
+USERS_APPEND_RANGE = "users!A:D"
+
+
+def _batch_update(spreadsheet_id: str, data: list) -> None:
+    get_sheets_service().spreadsheets().values().batchUpdate(
+        spreadsheetId=spreadsheet_id,
+        body={
+            "valueInputOption": "RAW",
+            "data": data,
+        },
+    ).execute()
+
+
+def _get(spreadsheet_id: str, range_: str) -> list:
+    return get_sheets_service().spreadsheets().values().get(
+        spreadsheetId=spreadsheet_id,
+        range=range_,
+    ).execute().get("values", [])
+
+
+# -------------------------------------------------
+# Orders
+# -------------------------------------------------
+
+class SheetsOrderRepository:
+    def get(
+        self,
+        spreadsheet_id: str,
+        order_id: str,
+        *,
+        kitchen_id: Optional[str] = None,
+    ) -> Tuple[Optional[int], Optional[list]]:
+        return sheets_repo.get_order_row(
+            order_id,
+            spreadsheet_id=spreadsheet_id,
+            kitchen_id=kitchen_id,
+        )
+
+    def read_row(self, spreadsheet_id: str, row_idx: int) -> list:
+        return sheets_repo.read_order_row(spreadsheet_id, row_idx)
+
+    def rows(self, spreadsheet_id: str) -> List[list]:
+        return order_store.overlay_rows(spreadsheet_id, _get(spreadsheet_id, ORDERS_RANGE))
+
+    def locate(
+        self,
+        order_id: str,
+        kitchens: Dict[str, str],
+    ) -> Tuple[Optional[str], Optional[str], Optional[int], Optional[list]]:
+        return sheets_repo.locate_order(order_id, kitchens)
+
+    def append(
+        self,
+        spreadsheet_id: str,
+        row: list,
+        *,
+        kitchen_id: Optional[str] = None,
+    ) -> Optional[int]:
+        return sheets_repo.append_order_row(
+            row,
+            spreadsheet_id=spreadsheet_id,
+            kitchen_id=kitchen_id,
+        )
+
+    def update_cells(self, spreadsheet_id: str, row_idx: int, cells: Dict[str, object]) -> None:
+        import sheets_writer
+
+        batch = sheets_writer.current()
+        if batch is not None:
+            batch.set_row_cells(spreadsheet_id, row_idx, cells)
+            return
+
+        batch = sheets_writer.WriteBatch("orders.update_cells")
+        batch.set_row_cells(spreadsheet_id, row_idx, cells)
+        batch.flush()
+
+    def write_cells(self, pending: Dict[str, Dict[str, list]], *, operation: str = "") -> int:
+        if order_store.ORDER_STORE_ENABLED:
+            # локальный outbox, в Sheets уйдет order_store.replication_loop
+            order_store.write(pending, operation=operation)
+            return 0
+
+        requests = 0
+        for spreadsheet_id, ranges in pending.items():
+            if not ranges:
+                continue
+            _batch_update(spreadsheet_id, [
+                {"range": r, "values": v}
+                for r, v in ranges.items()
+            ])
+            requests += 1
+        return requests
+
+
+# -------------------------------------------------
+# Users
+# -------------------------------------------------
+
+class SheetsUserRepository:
+    def get(self, spreadsheet_id: str, user_id) -> Optional[UserRecord]:
+        rec = users_directory.get(spreadsheet_id, user_id)
+        if rec is None and user_registrations.ensure_written(spreadsheet_id, user_id):
+            rec = users_directory.get(spreadsheet_id, user_id)
+        return rec
+
+    def user_ids(self, spreadsheet_id: str) -> List[int]:
+        return users_directory.user_ids(spreadsheet_id)
+
+    def rows(self, spreadsheet_id: str, first_row: int = 2) -> List[list]:
+        return _get(spreadsheet_id, USERS_ROWS_RANGE.format(first_row=first_row))
+
+    def append(self, spreadsheet_id: str, rows: List[list]) -> Optional[int]:
+        resp = get_sheets_service().spreadsheets().values().append(
+            spreadsheetId=spreadsheet_id,
+            range=USERS_APPEND_RANGE,
+            valueInputOption="RAW",
+            insertDataOption="INSERT_ROWS",
+            body={"values": rows},
+        ).execute()
+        return sheets_repo.first_row_of(resp.get("updates", {}).get("updatedRange", ""))
+
+    def save_contacts(
+        self,
+        spreadsheet_id: str,
+        user_id,
+        *,
+        name: str,
+        phone: str,
+        telegram_chat_id: Optional[int] = None,
+    ) -> bool:
+        # строка пользователя из справочника, users целиком не читаем
+        row_idx = users_directory.find_row(spreadsheet_id, user_id)
+        if not row_idx and user_registrations.ensure_written(spreadsheet_id, user_id):
+            # зарегистрирован секунды назад, строка была только в очереди
+            row_idx = users_directory.find_row(spreadsheet_id, user_id)
+        if not row_idx:
+            return False
+
+        data = [
+            {"range": f"users!E{row_idx}", "values": [[name]]},
+            {"range": f"users!F{row_idx}", "values": [[phone]]},
+        ]
+        fields = {"name": name, "phone": phone}
+
+        if telegram_chat_id is not None:
+            data.append({"range": f"users!G{row_idx}", "values": [[str(telegram_chat_id)]]})
+            fields["telegram_chat_id"] = int(telegram_chat_id)
+
+        _batch_update(spreadsheet_id, data)
+        users_directory.update(spreadsheet_id, user_id, **fields)
+        return True
+
+
+# -------------------------------------------------
+# Products
+# -------------------------------------------------
+
+class SheetsProductRepository:
+    def rows(self, spreadsheet_id: str) -> List[list]:
+        return _get(spreadsheet_id, PRODUCTS_RANGE)
+
+    def append(self, spreadsheet_id: str, row: list) -> None:
+        get_sheets_service().spreadsheets().values().append(
+            spreadsheetId=spreadsheet_id,
+            range=PRODUCTS_APPEND_RANGE,
+            valueInputOption="RAW",
+            body={"values": [row]},
+        ).execute()
+
+    def _find_row(self, spreadsheet_id: str, product_id: str) -> Optional[int]:
+        for idx, row in enumerate(_get(spreadsheet_id, PRODUCT_IDS_RANGE), start=2):
+            if row and row[0] == product_id:
+                return idx
+        return None
+
+    def update_cells(self, spreadsheet_id: str, product_id: str, cells: Dict[str, object]) -> bool:
+        row_idx = self._find_row(spreadsheet_id, product_id)
+        if row_idx is None:
+            return False
+
+        _batch_update(spreadsheet_id, [
+            {"range": f"products!{col}{row_idx}", "values": [[value]]}
+            for col, value in cells.items()
+        ])
+        return True
+
+
+# -------------------------------------------------
+# Kitchen settings
+# -------------------------------------------------
+
+class SheetsKitchenSettingsRepository:
+    def get(self, spreadsheet_id: str, key: str) -> Optional[str]:
+        for row in _get(spreadsheet_id, KITCHEN_SETTINGS_RANGE):
+            if len(row) >= 2 and row[0] == key:
+                return row[1]
+        return None
+
+    def city(self, spreadsheet_id: str) -> Optional[str]:
+        values = _get(spreadsheet_id, KITCHEN_CITY_RANGE)
+        if values and values[0]:
+            return values[0][0].strip()
+        return None
+
+
+def sheets_storage() -> Storage:
+    return Storage(
+        orders=SheetsOrderRepository(),
+        users=SheetsUserRepository(),
+        products=SheetsProductRepository(),
+        settings=SheetsKitchenSettingsRepository(),
+    )
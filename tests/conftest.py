@@ -0,0 +1,94 @@
+# tests/conftest.py
+"""
+Общая обвязка тестов.
+
+config.py падает без BOT_TOKEN / ADMIN_IDS / SPREADSHEET_ID, а SQLite-очереди
+(courier_queue, order_store) берут путь из BOT_STATE_DIR при импорте:
+поэтому окружение выставляем здесь, до импорта модулей бота.
+"""
+
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+os.environ.setdefault("BOT_TOKEN", "123:test")
+os.environ.setdefault("ADMIN_IDS", "1")
+os.environ.setdefault("SPREADSHEET_ID", "platform")
+os.environ["BOT_STATE_DIR"] = tempfile.mkdtemp(prefix="bot-state-")
+
+
+@pytest.fixture(scope="session")
+def fake_sheets_endpoint():
+    """
+    fake_sheets_server в фоновом потоке на свободном порту (один на сессию).
+    """
+    import uvicorn
+
+    import fake_sheets_server
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    server = uvicorn.Server(uvicorn.Config(
+        fake_sheets_server.create_app(),
+        host="127.0.0.1",
+        port=port,
+        log_level="warning",
+    ))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+
+    deadline = time.monotonic() + 10
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            pytest.fail("fake_sheets_server did not start")
+        time.sleep(0.01)
+
+    yield f"http://127.0.0.1:{port}/"
+
+    server.should_exit = True
+    thread.join(5)
+
+
+@pytest.fixture
+def fake_sheets(fake_sheets_endpoint, monkeypatch):
+    """
+    Чистый fake Sheets + sheets_repo, который ходит в него (через лимитер).
+    """
+    import fake_sheets_server
+    import sheets_limiter
+    import sheets_repo
+
+    fake_sheets_server.reset()
+    # свежие bucket'ы: тесты не ждут квоту, потраченную предыдущими
+    monkeypatch.setattr(sheets_limiter, "_BUCKETS", {})
+    monkeypatch.setitem(fake_sheets_server._config, "error_rate", 0.0)
+    monkeypatch.setattr(sheets_repo, "SHEETS_API_ENDPOINT", fake_sheets_endpoint)
+    monkeypatch.setattr(sheets_repo, "_sheets_service", None)
+    yield fake_sheets_server
+    fake_sheets_server.reset()
+
+
+@pytest.fixture
+def order_outbox(tmp_path, monkeypatch):
+    """
+    Включенный order_store на свежей SQLite в tmp_path.
+    """
+    import order_store
+
+    monkeypatch.setattr(order_store, "DB_PATH", str(tmp_path / "orders.sqlite3"))
+    monkeypatch.setattr(order_store, "_conn", None)
+    monkeypatch.setattr(order_store, "ORDER_STORE_ENABLED", True)
+    yield order_store
+    if order_store._conn is not None:
+        order_store._conn.close()
@@ -0,0 +1,78 @@
+# tests/test_broadcast_engine.py
+
+import asyncio
+import threading
+
+import pytest
+
+import broadcast_engine
+import broadcast_store
+from broadcast_engine import BroadcastJob, PerChatLimiter
+
+
+@pytest.fixture(autouse=True)
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(broadcast_store, "BROADCASTS_DIR", str(tmp_path / "broadcasts"))
+    monkeypatch.setattr(broadcast_engine, "_bucket", None)
+    monkeypatch.setattr(broadcast_engine, "_chat_limiter", PerChatLimiter(0))
+    monkeypatch.setattr(broadcast_engine, "BROADCAST_CONCURRENCY", 1)
+
+
+class StuckBot:
+    """
+    Первое сообщение уходит, на втором рассылка «зависает» до отмены.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.stuck = asyncio.Event()
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.sent:
+            self.stuck.set()
+            await asyncio.sleep(3600)
+        self.sent.append(chat_id)
+
+
+def test_cancelled_job_saves_progress_off_the_loop(monkeypatch):
+    saved = []
+    real_save = broadcast_store.save_job
+
+    def save_job(state):
+        saved.append((state["status"], threading.current_thread() is threading.main_thread()))
+        real_save(state)
+
+    monkeypatch.setattr(broadcast_store, "save_job", save_job)
+
+    job = BroadcastJob(kitchen_id="k1", admin_chat_id=1, text="hi", recipients=[10, 20, 30])
+    bot = StuckBot()
+
+    async def main():
+        task = asyncio.create_task(broadcast_engine.run_job(bot, job))
+        await asyncio.wait_for(bot.stuck.wait(), 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+    # остановка бота: прогресс сохранен из потока, не из event loop
+    assert saved[-1] == ("interrupted", False)
+    state = broadcast_store.load_jobs()[0]
+    assert state["status"] == "interrupted"
+    assert state["sent"] == [10]
+    assert BroadcastJob.from_state(state).remaining() == [20, 30]
+
+
+def test_per_chat_limiter_prunes_stale_chats(monkeypatch):
+    monkeypatch.setattr(PerChatLimiter, "_PRUNE_MIN", 8)
+    limiter = PerChatLimiter(interval=0)
+
+    async def main():
+        for chat_id in range(100):
+            await limiter.wait(chat_id)
+
+    asyncio.run(main())
+
+    # интервал 0: старые записи ничего не ограничивают и вычищаются
+    assert len(limiter._last) <= 8 + 1
@@ -0,0 +1,211 @@
+# tests/test_catalog_cache.py
+
+from types import SimpleNamespace
+
+import pytest
+
+import catalog_cache
+
+
+def product(pid, *, category="Супы", price=100, available=True):
+    return {
+        "product_id": pid,
+        "name": f"Товар {pid}",
+        "price": price,
+        "available": available,
+        "category": category,
+    }
+
+
+class Loader:
+    def __init__(self, products):
+        self.products = products
+        self.calls = 0
+        self.error = None
+
+    def __call__(self, kitchen):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return list(self.products)
+
+
+@pytest.fixture
+def kitchen():
+    catalog_cache.invalidate()
+    yield SimpleNamespace(kitchen_id="k1", spreadsheet_id="sheet-k1")
+    catalog_cache.invalidate()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(catalog_cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def scheduled(monkeypatch):
+    calls = []
+    monkeypatch.setattr(
+        catalog_cache, "_schedule_refresh", lambda kitchen, loader: calls.append(kitchen)
+    )
+    return calls
+
+
+# -------------------------------------------------
+# Кэш (TTL + stale-while-revalidate)
+# -------------------------------------------------
+
+def test_fresh_hit_does_not_reload(kitchen, clock, scheduled):
+    loader = Loader([product("p1")])
+
+    first = catalog_cache.get_snapshot(kitchen, loader)
+    clock[0] += catalog_cache.CATALOG_TTL_SECONDS - 1
+    second = catalog_cache.get_snapshot(kitchen, loader)
+
+    assert loader.calls == 1
+    assert second is first
+    assert scheduled == []
+
+
+def test_stale_served_immediately_and_refreshed_once(kitchen, clock, scheduled):
+    loader = Loader([product("p1")])
+    first = catalog_cache.get_snapshot(kitchen, loader)
+
+    clock[0] += catalog_cache.CATALOG_TTL_SECONDS + 1
+    assert catalog_cache.get_snapshot(kitchen, loader) is first
+    assert catalog_cache.get_snapshot(kitchen, loader) is first
+
+    # одно фоновое обновление на все устаревшие обращения
+    assert len(scheduled) == 1
+    assert loader.calls == 1
+
+
+def test_too_stale_loads_synchronously(kitchen, clock, scheduled):
+    loader = Loader([product("p1")])
+    catalog_cache.get_snapshot(kitchen, loader)
+
+    loader.products = [product("p1"), product("p2")]
+    clock[0] += catalog_cache.CATALOG_TTL_SECONDS + catalog_cache.CATALOG_MAX_STALE_SECONDS + 1
+    snapshot = catalog_cache.get_snapshot(kitchen, loader)
+
+    assert loader.calls == 2
+    assert snapshot.get("p2") is not None
+    assert scheduled == []
+
+
+def test_load_error_keeps_old_catalog(kitchen, clock, scheduled):
+    loader = Loader([product("p1")])
+    first = catalog_cache.get_snapshot(kitchen, loader)
+
+    loader.error = RuntimeError("sheets down")
+    clock[0] += catalog_cache.CATALOG_TTL_SECONDS + catalog_cache.CATALOG_MAX_STALE_SECONDS + 1
+
+    assert catalog_cache.refresh(kitchen, loader) is None
+    assert catalog_cache.get_snapshot(kitchen, loader) is first
+
+
+def test_cold_load_error_returns_empty_and_is_not_cached(kitchen, clock, scheduled):
+    loader = Loader([product("p1")])
+    loader.error = RuntimeError("sheets down")
+
+    assert catalog_cache.get_snapshot(kitchen, loader) is catalog_cache.EMPTY
+
+    loader.error = None
+    assert catalog_cache.get_snapshot(kitchen, loader).get("p1") is not None
+
+
+def test_admin_edit_applies_in_place(kitchen, clock, scheduled):
+    loader = Loader([product("p1", price=100)])
+    before = catalog_cache.get_snapshot(kitchen, loader)
+
+    assert catalog_cache.update_product(kitchen, "p1", price=150)
+    after = catalog_cache.get_snapshot(kitchen, loader)
+
+    assert after.get("p1")["price"] == 150
+    # выданный раньше снимок не меняется
+    assert before.get("p1")["price"] == 100
+    assert loader.calls == 1
+
+
+def test_refresh_started_before_edit_is_discarded(kitchen, clock, scheduled):
+    loader = Loader([product("p1", price=100)])
+    catalog_cache.get_snapshot(kitchen, loader)
+
+    def slow_loader(k):
+        # админка правит цену, пока идет чтение Sheets
+        catalog_cache.update_product(kitchen, "p1", price=150)
+        return [product("p1", price=100)]
+
+    snapshot = catalog_cache.refresh(kitchen, slow_loader)
+
+    assert snapshot.get("p1")["price"] == 150
+    assert catalog_cache.get_snapshot(kitchen, loader).get("p1")["price"] == 150
+
+
+def test_update_unknown_product_drops_kitchen_cache(kitchen, clock, scheduled):
+    loader = Loader([product("p1")])
+    catalog_cache.get_snapshot(kitchen, loader)
+
+    assert not catalog_cache.update_product(kitchen, "missing", price=1)
+
+    catalog_cache.get_snapshot(kitchen, loader)
+    assert loader.calls == 2
+
+
+# -------------------------------------------------
+# CatalogSnapshot
+# -------------------------------------------------
+
+def test_snapshot_indexes_by_id_and_category():
+    snap = catalog_cache.CatalogSnapshot.build("k1", [
+        product("p1", category="Супы"),
+        product("p2", category="Салаты"),
+        product("p3", category="Супы", available=False),
+    ])
+
+    assert snap.get("p2")["category"] == "Салаты"
+    assert snap.get("missing") is None
+    assert [p["product_id"] for p in snap.in_category("Супы")] == ["p1"]
+    assert [p["product_id"] for p in snap.in_category("Супы", available_only=False)] == ["p1", "p3"]
+    assert snap.categories() == ["Салаты", "Супы"]
+
+
+def test_snapshot_duplicate_id_keeps_first_row():
+    snap = catalog_cache.CatalogSnapshot.build("k1", [
+        product("p1", price=100),
+        product("p1", price=999),
+    ])
+
+    assert snap.get("p1")["price"] == 100
+
+
+def test_snapshot_is_read_only():
+    snap = catalog_cache.CatalogSnapshot.build("k1", [product("p1")])
+
+    with pytest.raises(TypeError):
+        snap.get("p1")["price"] = 1
+    with pytest.raises(TypeError):
+        snap.by_id["p2"] = {}
+
+
+def test_resolve_cart_skips_unknown_products():
+    snap = catalog_cache.CatalogSnapshot.build("k1", [product("p1"), product("p2")])
+
+    lines = snap.resolve_cart({"p1": 2, "gone": 1, "p2": 3})
+
+    assert [(p["product_id"], qty) for p, qty in lines] == [("p1", 2), ("p2", 3)]
+
+
+def test_with_product_and_with_added_return_new_snapshots():
+    snap = catalog_cache.CatalogSnapshot.build("k1", [product("p1", price=100)])
+
+    edited = snap.with_product("p1", price=150)
+    added = snap.with_added(product("p2", category="Салаты"))
+
+    assert snap.get("p1")["price"] == 100
+    assert edited.get("p1")["price"] == 150
+    assert snap.with_product("missing", price=1) is None
+    assert snap.get("p2") is None
+    assert added.in_category("Салаты")[0]["product_id"] == "p2"
@@ -0,0 +1,94 @@
+# tests/test_checkout_notify.py
+"""
+Заказ из бота: push от Web API приходит до записи строки (not_found),
+поэтому чекаут уведомляет стафф сам, сразу после save_order_to_sheets.
+"""
+
+import asyncio
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import pytest
+
+import main
+import order_index
+import storage
+import webapi_client
+import webapp_orders_sync
+from storage_memory import memory_storage
+
+KITCHEN = SimpleNamespace(kitchen_id="k1", spreadsheet_id="k1-sheet", status="active")
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+        return SimpleNamespace(message_id=len(self.sent))
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = memory_storage({"k1-sheet": {"orders": [["order_id"]]}})
+    monkeypatch.setattr(storage, "_storage", store)
+    monkeypatch.setattr(order_index, "_INDEX", {})
+    monkeypatch.setattr(webapp_orders_sync, "_claims", OrderedDict())
+    monkeypatch.setattr(main, "get_active_kitchen", lambda context: KITCHEN)
+    monkeypatch.setattr(main, "get_kitchen_address_cached", lambda *, kitchen: "addr")
+    monkeypatch.setattr(main, "get_kitchen_city_cached", lambda *, kitchen: "seoul")
+    monkeypatch.setattr(main, "get_catalog", lambda kitchen: SimpleNamespace(resolve_cart=lambda cart: []))
+    return store
+
+
+@pytest.fixture
+def notified(monkeypatch):
+    calls = []
+
+    async def notify_staff(bot, kitchen, order_id, *, order_row=None):
+        calls.append((order_id, order_row[0]))
+
+    monkeypatch.setattr(main, "notify_staff", notify_staff)
+    return calls
+
+
+def test_bot_checkout_notifies_staff_right_after_save(store, notified, monkeypatch):
+    pushes = []
+
+    async def webapi_create_order(payload, *, idempotency_key=None):
+        # Web API зовет /orders/notify раньше, чем бот записал строку
+        pushes.append(await webapp_orders_sync.notify_order(None, KITCHEN, payload["order_id"]))
+        return {"status": "ok", "external_delivery_ref": None}
+
+    monkeypatch.setattr(webapi_client, "webapi_create_order", webapi_create_order)
+
+    query = SimpleNamespace(
+        data="checkout:final_send",
+        from_user=SimpleNamespace(id=5, username="buyer"),
+        message=SimpleNamespace(chat_id=5),
+    )
+
+    async def answer(*args, **kwargs):
+        pass
+
+    query.answer = answer
+    context = SimpleNamespace(bot=FakeBot(), user_data={
+        "cart": {"p1": 1},
+        "checkout": {
+            "step": "ready_to_send",
+            "type": "pickup",
+            "order_id": "o1",
+            "payment_photo_file_id": "photo",
+        },
+    })
+
+    asyncio.run(main.on_button(SimpleNamespace(callback_query=query), context))
+
+    assert pushes == ["not_found"]
+    assert notified == [("o1", "o1")]
+    row = store.orders.read_row("k1-sheet", 2)
+    assert row[30] == "1"
+    assert row[31].startswith("notified:")
+    # повторный push (или опрос) заказ больше не трогает
+    assert asyncio.run(webapp_orders_sync.notify_order(None, KITCHEN, "o1")) == "duplicate"
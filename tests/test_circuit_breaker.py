@@ -0,0 +1,173 @@
+# tests/test_circuit_breaker.py
+
+import asyncio
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+def fail(breaker, times=1):
+    for _ in range(times):
+        with pytest.raises(ConnectionError):
+            with breaker.guard():
+                raise ConnectionError("upstream down")
+
+
+def test_opens_after_threshold_consecutive_failures():
+    breaker = CircuitBreaker("t", failure_threshold=3, reset_seconds=60)
+
+    fail(breaker, 2)
+    assert breaker.state == circuit_breaker.CLOSED
+
+    fail(breaker)
+    assert breaker.state == circuit_breaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        with breaker.guard():
+            pytest.fail("open breaker must not run the call")
+    assert breaker.rejected == 1
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker("t", failure_threshold=2, reset_seconds=60)
+
+    fail(breaker)
+    with breaker.guard() as call:
+        call.status(200)
+    fail(breaker)
+
+    assert breaker.state == circuit_breaker.CLOSED
+
+
+def test_5xx_counts_and_4xx_does_not():
+    breaker = CircuitBreaker("t", failure_threshold=1, reset_seconds=60)
+
+    with breaker.guard() as call:
+        call.status(404)
+    assert breaker.state == circuit_breaker.CLOSED
+
+    with breaker.guard() as call:
+        call.status(503)
+    assert breaker.state == circuit_breaker.OPEN
+
+
+def test_half_open_allows_one_probe():
+    breaker = CircuitBreaker("t", failure_threshold=1, reset_seconds=60)
+    fail(breaker)
+    breaker.opened_at -= 60
+
+    with breaker.guard() as call:
+        assert breaker.state == circuit_breaker.HALF_OPEN
+        # второй запрос, пока проба в полете, отбивается
+        with pytest.raises(CircuitOpenError):
+            with breaker.guard():
+                pass
+        call.status(200)
+
+    assert breaker.state == circuit_breaker.CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("t", failure_threshold=5, reset_seconds=60)
+    fail(breaker, 5)
+    breaker.opened_at -= 60
+
+    fail(breaker)
+
+    assert breaker.state == circuit_breaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_cancellation_is_not_a_failure():
+    breaker = CircuitBreaker("t", failure_threshold=1, reset_seconds=60)
+
+    async def call():
+        with breaker.guard():
+            await asyncio.sleep(10)
+
+    async def main():
+        task = asyncio.create_task(call())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert breaker.state == circuit_breaker.CLOSED
+    assert breaker.failures == 0
+
+
+def test_cancelled_probe_frees_half_open_slot():
+    breaker = CircuitBreaker("t", failure_threshold=1, reset_seconds=60)
+    fail(breaker)
+    breaker.opened_at -= 60
+
+    async def probe():
+        with breaker.guard():
+            await asyncio.sleep(10)
+
+    async def main():
+        task = asyncio.create_task(probe())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+    # следующий запрос снова может быть пробой
+    with breaker.guard() as call:
+        call.status(200)
+    assert breaker.state == circuit_breaker.CLOSED
+
+
+def test_get_reads_per_upstream_thresholds(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "_BREAKERS", {})
+    monkeypatch.setenv("CIRCUIT_WEBAPI_ADDRESS_CHECK_FAILURE_THRESHOLD", "2")
+
+    breaker = circuit_breaker.get("webapi.address_check")
+
+    assert breaker.failure_threshold == 2
+    assert circuit_breaker.get("webapi.address_check") is breaker
+
+
+# -------------------------------------------------
+# webapi_check_address
+# -------------------------------------------------
+
+def test_local_queue_wait_does_not_trip_breaker(monkeypatch):
+    import httpx
+
+    import http_clients
+    import webapi_client
+
+    monkeypatch.setattr(circuit_breaker, "_BREAKERS", {})
+    monkeypatch.setattr(webapi_client, "ADDRESS_CHECK_CONCURRENCY", 1)
+    monkeypatch.setattr(webapi_client, "_address_sem", None)
+
+    async def handler(request):
+        await asyncio.sleep(0.3)
+        return httpx.Response(200, json={"ok": True, "delivery_price": 300})
+
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(http_clients, "get_client", lambda: client)
+        try:
+            # второй вызов не дождется слота: это локальная очередь, не сбой Web API
+            return await asyncio.gather(
+                webapi_client.webapi_check_address("Москва", "Тверская 1", deadline=1),
+                webapi_client.webapi_check_address("Москва", "Тверская 2", deadline=0.1),
+            )
+        finally:
+            await client.aclose()
+
+    first, second = asyncio.run(main())
+
+    assert first["delivery_price"] == 300
+    assert second is None
+    breaker = circuit_breaker.get("webapi.address_check")
+    assert breaker.failures == 0
+    assert breaker.state == circuit_breaker.CLOSED
@@ -0,0 +1,171 @@
+# tests/test_courier_job.py
+"""
+Клик ETA и задача очереди курьера (main.on_staff_eta / process_courier_job)
+на memory storage: без Sheets и без Web API.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import courier_queue
+import kitchen_context
+import main
+import storage
+from storage_memory import memory_storage
+
+BUYER_ID = 555
+BUYER_CHAT_ID = 777
+ETA_AT = "2026-01-01T10:30:00+00:00"
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+
+
+def order_row(*, eta="", courier_state="delivery_new", comment=""):
+    row = [""] * 32
+    row[0], row[2] = "o1", str(BUYER_ID)
+    row[17], row[19], row[26] = eta, courier_state, comment
+    return row
+
+
+@pytest.fixture
+def kitchen(tmp_path, monkeypatch):
+    monkeypatch.setattr(courier_queue, "DB_PATH", str(tmp_path / "courier_jobs.sqlite3"))
+    monkeypatch.setattr(courier_queue, "_conn", None)
+    monkeypatch.setattr(courier_queue, "_wakeup", None)
+    monkeypatch.setattr(courier_queue, "_loop", None)
+    monkeypatch.setattr(kitchen_context, "_REGISTRY", {
+        "k1": SimpleNamespace(
+            kitchen_id="k1",
+            spreadsheet_id="k1-sheet",
+            status="active",
+            owner_chat_id=1,
+            staff_chat_ids={2},
+        ),
+    })
+
+    def seed(row):
+        store = memory_storage({"k1-sheet": {
+            "orders": [["order_id"], row],
+            "users": [["user_id"], [str(BUYER_ID), "", "", "", "", "", str(BUYER_CHAT_ID)]],
+        }})
+        monkeypatch.setattr(storage, "_storage", store)
+        return store
+
+    yield seed
+    if courier_queue._conn is not None:
+        courier_queue._conn.close()
+
+
+@pytest.fixture
+def dispatched(monkeypatch):
+    calls = []
+
+    async def send_to_courier_and_persist(**kwargs):
+        calls.append(kwargs["pickup_eta_at"])
+        return True
+
+    monkeypatch.setattr(main, "send_to_courier_and_persist", send_to_courier_and_persist)
+    return calls
+
+
+def run_job(state=None):
+    bot = FakeBot()
+    job = courier_queue.CourierJob(
+        order_id="o1",
+        kitchen_id="k1",
+        payload={"minutes": 30, "pickup_eta_at": ETA_AT},
+        attempts=2,
+        state=state or {},
+    )
+    asyncio.run(main.process_courier_job(bot, job))
+    return bot
+
+
+def test_job_records_eta_then_dispatches(kitchen, dispatched):
+    store = kitchen(order_row())
+
+    bot = run_job()
+
+    row = store.orders.read_row("k1-sheet", 2)
+    assert (row[17], row[19], row[26]) == (ETA_AT, "courier_requested", "Курьер через 30 мин")
+    assert dispatched == [ETA_AT]
+    assert bot.sent == [BUYER_CHAT_ID]
+
+
+def test_retry_after_crash_past_own_write_still_dispatches(kitchen, dispatched):
+    # процесс упал после записи staff_eta, до checkpoint(sheet_recorded)
+    store = kitchen(order_row(
+        eta=ETA_AT,
+        courier_state="courier_requested",
+        comment="Курьер через 30 мин",
+    ))
+
+    bot = run_job()
+
+    assert dispatched == [ETA_AT]
+    assert bot.sent == [BUYER_CHAT_ID]
+    # строку второй раз не пишем: comment не задублирован
+    assert store.orders.read_row("k1-sheet", 2)[26] == "Курьер через 30 мин"
+
+
+@pytest.mark.parametrize("row", [
+    order_row(courier_state="courier_not_requested"),
+    order_row(eta="2026-01-01T09:00:00+00:00", courier_state="courier_requested"),
+])
+def test_job_stops_when_decided_by_someone_else(kitchen, dispatched, row):
+    kitchen(row)
+
+    bot = run_job()
+
+    assert dispatched == []
+    assert bot.sent == []
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.message = SimpleNamespace(chat_id=2, delete=self._delete)
+        self.alerts = []
+        self.deleted = False
+
+    async def _delete(self):
+        self.deleted = True
+
+    async def answer(self, text=None, show_alert=False):
+        if text:
+            self.alerts.append(text)
+
+
+def click_eta():
+    query = FakeQuery("staff:eta:30:k1:o1")
+    update = SimpleNamespace(callback_query=query)
+    asyncio.run(main.on_staff_eta(update, SimpleNamespace(bot=FakeBot())))
+    return query
+
+
+def test_eta_after_no_courier_alerts_staff_and_queues_nothing(kitchen):
+    kitchen(order_row(courier_state="courier_not_requested"))
+
+    query = click_eta()
+
+    assert query.alerts == ["Решение по курьеру уже принято"]
+    assert query.deleted
+    assert courier_queue.queue_stats() == {}
+
+
+def test_eta_click_queues_job(kitchen):
+    kitchen(order_row())
+
+    query = click_eta()
+
+    assert query.alerts == []
+    assert query.deleted
+    assert courier_queue.queue_stats().get("queued") == 1
@@ -0,0 +1,177 @@
+# tests/test_courier_queue.py
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import courier_queue
+
+
+@pytest.fixture(autouse=True)
+def fresh_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(courier_queue, "DB_PATH", str(tmp_path / "courier_jobs.sqlite3"))
+    monkeypatch.setattr(courier_queue, "_conn", None)
+    monkeypatch.setattr(courier_queue, "_wakeup", None)
+    monkeypatch.setattr(courier_queue, "_loop", None)
+    yield
+    if courier_queue._conn is not None:
+        courier_queue._conn.close()
+
+
+def status(order_id):
+    row = courier_queue._db().execute(
+        "SELECT status, attempts FROM courier_jobs WHERE order_id = ?", (order_id,)
+    ).fetchone()
+    return row and (row[0], row[1])
+
+
+def kill(order_id):
+    courier_queue._db().execute(
+        "UPDATE courier_jobs SET status = 'dead' WHERE order_id = ?", (order_id,)
+    )
+
+
+# -------------------------------------------------
+# SQLite
+# -------------------------------------------------
+
+def test_enqueue_once_per_order():
+    assert courier_queue.enqueue("o1", "k1", {"eta": 10})
+    assert not courier_queue.enqueue("o1", "k1", {"eta": 20})
+
+    job = courier_queue._claim()
+    assert job.payload == {"eta": 10}
+    assert job.attempts == 1
+    assert courier_queue._claim() is None
+
+
+def test_enqueue_restarts_dead_job_and_keeps_state():
+    courier_queue.enqueue("o1", "k1", {"eta": 10})
+    courier_queue.checkpoint("o1", buyer_notified=True)
+    kill("o1")
+
+    assert courier_queue.enqueue("o1", "k1", {"eta": 30})
+
+    job = courier_queue._claim()
+    assert job.payload == {"eta": 30}
+    assert job.state == {"buyer_notified": True}
+    assert job.attempts == 1
+
+
+def test_requeue_only_dead_jobs():
+    courier_queue.enqueue("o1", "k1", {})
+    assert not courier_queue.requeue("o1")
+    assert not courier_queue.requeue("missing")
+
+    kill("o1")
+    assert courier_queue.requeue("o1")
+    assert status("o1") == ("queued", 0)
+
+
+def test_fail_backs_off_then_goes_dead(monkeypatch):
+    monkeypatch.setattr(courier_queue, "COURIER_QUEUE_MAX_ATTEMPTS", 2)
+    courier_queue.enqueue("o1", "k1", {})
+
+    job = courier_queue._claim()
+    assert courier_queue._fail(job, "boom") == "queued"
+    # следующая попытка только после задержки
+    assert courier_queue._claim() is None
+
+    courier_queue._db().execute("UPDATE courier_jobs SET next_attempt_at = 0")
+    job = courier_queue._claim()
+    assert job.attempts == 2
+    assert courier_queue._fail(job, "boom") == "dead"
+    assert status("o1") == ("dead", 2)
+
+
+def test_backoff_is_capped(monkeypatch):
+    monkeypatch.setattr(courier_queue, "COURIER_QUEUE_BACKOFF_MAX", 10)
+    assert courier_queue._backoff(1) <= courier_queue.COURIER_QUEUE_BACKOFF_BASE * 1.2
+    assert courier_queue._backoff(30) <= 10 * 1.2
+
+
+def test_recover_requeues_interrupted_jobs():
+    courier_queue.enqueue("o1", "k1", {})
+    courier_queue._claim()
+    assert status("o1")[0] == "running"
+
+    assert courier_queue._recover() == 1
+    assert courier_queue._claim().order_id == "o1"
+
+
+# -------------------------------------------------
+# Workers
+# -------------------------------------------------
+
+def run_loop(handler, *, on_dead=None, until, timeout=5.0):
+    app = SimpleNamespace(running=True, bot=object())
+
+    async def main():
+        task = asyncio.create_task(
+            courier_queue.courier_queue_loop(app, handler, on_dead=on_dead, workers=1)
+        )
+        try:
+            await asyncio.wait_for(until(app), timeout)
+        finally:
+            app.running = False
+            await asyncio.wait_for(task, 3)
+
+    asyncio.run(main())
+
+
+def test_worker_runs_job_and_marks_done():
+    seen = []
+
+    async def handler(bot, job):
+        seen.append(job.order_id)
+
+    async def until(app):
+        while courier_queue.queue_stats().get("done") != 1:
+            await asyncio.sleep(0.01)
+
+    courier_queue.enqueue("o1", "k1", {})
+    run_loop(handler, until=until)
+
+    assert seen == ["o1"]
+
+
+def test_worker_calls_on_dead(monkeypatch):
+    monkeypatch.setattr(courier_queue, "COURIER_QUEUE_MAX_ATTEMPTS", 1)
+    dead = []
+
+    async def handler(bot, job):
+        raise RuntimeError("courier api down")
+
+    async def on_dead(bot, job, error):
+        dead.append((job.order_id, error))
+
+    async def until(app):
+        while not dead:
+            await asyncio.sleep(0.01)
+
+    courier_queue.enqueue("o1", "k1", {})
+    run_loop(handler, on_dead=on_dead, until=until)
+
+    assert dead == [("o1", "courier api down")]
+    assert status("o1") == ("dead", 1)
+
+
+def test_enqueue_from_thread_wakes_idle_worker():
+    seen = []
+
+    async def handler(bot, job):
+        seen.append(asyncio.get_running_loop().time())
+
+    async def until(app):
+        # воркер уже спит на пустой очереди
+        await asyncio.sleep(0.2)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await asyncio.to_thread(courier_queue.enqueue, "o1", "k1", {})
+        while not seen:
+            await asyncio.sleep(0.01)
+        # без пробуждения ждали бы таймаут ожидания (1 с)
+        assert seen[0] - started < 0.5
+
+    run_loop(handler, until=until)
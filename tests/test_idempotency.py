@@ -0,0 +1,178 @@
+# tests/test_idempotency.py
+
+import asyncio
+
+import pytest
+
+import idempotency
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    idempotency._DONE.clear()
+    idempotency._IN_FLIGHT.clear()
+    yield
+    idempotency._DONE.clear()
+    idempotency._IN_FLIGHT.clear()
+
+
+class Upstream:
+    def __init__(self, result=None, error=None, delay=0.05):
+        self.result = result if result is not None else {"status": "ok"}
+        self.error = error
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+def test_concurrent_calls_share_one_request():
+    upstream = Upstream({"status": "ok", "order_id": "o1"})
+
+    async def main():
+        return await asyncio.gather(*(
+            idempotency.single_flight("create_order:o1", upstream) for _ in range(5)
+        ))
+
+    results = asyncio.run(main())
+
+    assert upstream.calls == 1
+    assert all(r == {"status": "ok", "order_id": "o1"} for r in results)
+
+
+def test_success_is_reused_within_window():
+    upstream = Upstream()
+
+    async def main():
+        await idempotency.single_flight("k", upstream)
+        await idempotency.single_flight("k", upstream)
+
+    asyncio.run(main())
+    assert upstream.calls == 1
+
+
+def test_expired_response_goes_to_network(monkeypatch):
+    upstream = Upstream()
+
+    async def main():
+        await idempotency.single_flight("k", upstream)
+        monkeypatch.setattr(idempotency, "IDEMPOTENCY_WINDOW_SECONDS", 0)
+        await idempotency.single_flight("k", upstream)
+
+    asyncio.run(main())
+    assert upstream.calls == 2
+
+
+def test_error_reaches_all_waiters_and_is_not_cached():
+    upstream = Upstream(error=RuntimeError("http_error 502"))
+
+    async def main():
+        results = await asyncio.gather(
+            *(idempotency.single_flight("k", upstream) for _ in range(3)),
+            return_exceptions=True,
+        )
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+        upstream.error = None
+        return await idempotency.single_flight("k", upstream)
+
+    assert asyncio.run(main()) == {"status": "ok"}
+    assert upstream.calls == 2
+
+
+def test_callers_get_independent_copies():
+    upstream = Upstream({"items": [1]})
+
+    async def main():
+        first = await idempotency.single_flight("k", upstream)
+        first["items"].append(2)
+        return await idempotency.single_flight("k", upstream)
+
+    assert asyncio.run(main()) == {"items": [1]}
+
+
+def test_cancelled_leader_does_not_poison_key():
+    upstream = Upstream(delay=1)
+
+    async def main():
+        leader = asyncio.create_task(idempotency.single_flight("k", upstream))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+        upstream.delay = 0
+        return await idempotency.single_flight("k", upstream)
+
+    assert asyncio.run(main()) == {"status": "ok"}
+    assert upstream.calls == 2
+    assert idempotency._IN_FLIGHT == {}
+
+
+def test_forget_drops_cached_response():
+    upstream = Upstream()
+
+    async def main():
+        await idempotency.single_flight("k", upstream)
+        idempotency.forget("k")
+        await idempotency.single_flight("k", upstream)
+
+    asyncio.run(main())
+    assert upstream.calls == 2
+
+
+def test_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_MAX_KEYS", 3)
+    upstream = Upstream(delay=0)
+
+    async def main():
+        for i in range(5):
+            await idempotency.single_flight(f"k{i}", upstream)
+
+    asyncio.run(main())
+    assert list(idempotency._DONE) == ["k2", "k3", "k4"]
+
+
+# -------------------------------------------------
+# webapi_create_order
+# -------------------------------------------------
+
+def test_create_order_sends_idempotency_key_once(monkeypatch):
+    import httpx
+
+    import http_clients
+    import webapi_client
+
+    seen = []
+
+    async def handler(request):
+        seen.append(request.headers.get("X-IDEMPOTENCY-KEY"))
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json={"status": "ok", "order_id": "o1"})
+
+    monkeypatch.setattr(webapi_client, "WEB_API_URL", "http://webapi.test")
+
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        monkeypatch.setattr(http_clients, "get_client", lambda: client)
+        try:
+            # двойной тап «Подтвердить» -> один запрос с одним ключом
+            return await asyncio.gather(*(
+                webapi_client.webapi_create_order(
+                    {"order_id": "o1", "source": "bot"},
+                    idempotency_key="checkout:o1",
+                )
+                for _ in range(2)
+            ))
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(main())
+
+    assert seen == ["checkout:o1"]
+    assert results == [{"status": "ok", "order_id": "o1"}] * 2
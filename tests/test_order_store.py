@@ -0,0 +1,172 @@
+# tests/test_order_store.py
+
+import asyncio
+import sqlite3
+
+import pytest
+
+import order_index
+import order_store
+import sheets_repo
+import sheets_writer
+
+
+@pytest.fixture(autouse=True)
+def fresh_db(order_outbox, monkeypatch):
+    monkeypatch.setattr(order_index, "_INDEX", {})
+
+
+def seed_order(fake_sheets, spreadsheet_id, rows):
+    fake_sheets.seed({spreadsheet_id: {"orders": [["order_id", "created_at"], *rows]}})
+
+
+def sheet_rows(fake_sheets, spreadsheet_id, sheet="orders"):
+    return fake_sheets._book(spreadsheet_id).tabs[sheet]
+
+
+# -------------------------------------------------
+# Outbox
+# -------------------------------------------------
+
+def test_overlay_applies_latest_pending_cells():
+    order_store.write({"s1": {"orders!J5": [["approved"]], "orders!AH5": [["t1"]]}})
+    order_store.write({"s1": {"orders!J5": [["rejected"]]}})
+
+    row = order_store.overlay("s1", 5, ["o1", "2026-01-01"])
+
+    assert row[9] == "rejected"
+    assert row[33] == "t1"
+    assert len(row) == 34
+    # другие строки и таблицы не задеты
+    assert order_store.overlay("s1", 6, ["o2"]) == ["o2"]
+    assert order_store.overlay("s2", 5, ["o1"]) == ["o1"]
+
+
+def test_overlay_skips_multi_cell_ranges():
+    order_store.write({"s1": {"orders!J5:K5": [["approved", "now"]]}})
+
+    assert order_store.overlay("s1", 5, ["o1"]) == ["o1"]
+    assert order_store.pending_count() == 1
+
+
+def test_outbox_from_before_order_id_is_migrated():
+    old = sqlite3.connect(order_store.DB_PATH)
+    old.executescript(
+        "CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        'spreadsheet_id TEXT NOT NULL, range TEXT NOT NULL, "values" TEXT NOT NULL, '
+        "sheet TEXT, row_idx INTEGER, col_idx INTEGER, "
+        "operation TEXT NOT NULL DEFAULT '', created_at REAL NOT NULL);"
+        "INSERT INTO outbox (spreadsheet_id, range, \"values\", sheet, row_idx, col_idx, created_at) "
+        "VALUES ('s1', 'orders!J5', '[[\"approved\"]]', 'orders', 5, 9, 0);"
+    )
+    old.close()
+
+    assert order_store.overlay("s1", 5, ["o1"])[9] == "approved"
+    order_store.write({"s1": {"orders!K5": [["now"]]}})
+    assert order_store.pending_count() == 2
+
+
+def test_operation_flush_goes_to_outbox_without_sheets():
+    async def main():
+        async with sheets_writer.operation("staff_decision") as batch:
+            batch.set_row_cells("s1", 5, {"J": "approved", "AG": "accepted"})
+
+    asyncio.run(main())
+
+    assert order_store.pending_count() == 2
+    assert order_store.overlay("s1", 5, [])[32] == "accepted"
+
+
+# -------------------------------------------------
+# Репликация (fake_sheets_server)
+# -------------------------------------------------
+
+def test_replicate_coalesces_and_drains_outbox(fake_sheets):
+    seed_order(fake_sheets, "s1", [["o1", "t0"]])
+    seed_order(fake_sheets, "s2", [["o2", "t0"]])
+
+    order_store.write({"s1": {"orders!C2": [["first"]]}})
+    order_store.write({"s1": {"orders!C2": [["second"]], "orders!D2": [["x"]]}})
+    order_store.write({"s2": {"orders!C2": [["other"]]}})
+
+    assert order_store.replicate_once() == 4
+
+    assert sheet_rows(fake_sheets, "s1")[1][2:4] == ["second", "x"]
+    assert sheet_rows(fake_sheets, "s2")[1][2] == "other"
+    assert order_store.pending_count() == 0
+    # один batchUpdate на таблицу
+    assert fake_sheets.fake_stats()["requests"]["values.batchUpdate"] == 2
+
+
+def test_replicate_follows_order_moved_by_owner(fake_sheets):
+    seed_order(fake_sheets, "s1", [["o1", "t0"], ["o2", "t0"]])
+    order_index.index_rows("s1", sheet_rows(fake_sheets, "s1"))
+    order_store.write({"s1": {"orders!J2": [["approved"]], "orders!J3": [["rejected"]]}})
+
+    # владелец отсортировал строки, пока запись ждала репликации
+    rows = sheet_rows(fake_sheets, "s1")
+    rows[1], rows[2] = rows[2], rows[1]
+
+    assert order_store.overlay("s1", 2, ["o2", "t0"])[9] == "rejected"
+    assert order_store.replicate_once() == 2
+
+    assert sheet_rows(fake_sheets, "s1")[1][0::9] == ["o2", "rejected"]
+    assert sheet_rows(fake_sheets, "s1")[2][0::9] == ["o1", "approved"]
+    assert order_store.store_stats()["retargeted_cells"] >= 2
+
+
+def test_replicate_skips_deleted_order(fake_sheets):
+    seed_order(fake_sheets, "s1", [["o1", "t0"], ["o2", "t0"]])
+    order_index.index_rows("s1", sheet_rows(fake_sheets, "s1"))
+    order_store.write({"s1": {"orders!J2": [["approved"]]}})
+
+    # строку o1 удалили, на ее месте теперь o2
+    del sheet_rows(fake_sheets, "s1")[1]
+
+    assert order_store.replicate_once() == 1
+
+    assert sheet_rows(fake_sheets, "s1")[1] == ["o2", "t0"]
+    assert order_store.pending_count() == 0
+
+
+def test_read_order_row_sees_unreplicated_writes(fake_sheets):
+    seed_order(fake_sheets, "s1", [["o1", "t0", "u1"]])
+    order_store.write({"s1": {"orders!J2": [["approved"]]}})
+
+    row = sheets_repo.read_order_row("s1", 2)
+
+    assert row[:3] == ["o1", "t0", "u1"]
+    assert row[9] == "approved"
+
+
+def test_failed_spreadsheet_stays_in_outbox(fake_sheets, monkeypatch):
+    seed_order(fake_sheets, "good", [["o1"]])
+    order_store.write({"bad": {"orders!C2": [["x"]]}, "good": {"orders!C2": [["y"]]}})
+
+    real = sheets_repo.get_sheets_service()
+
+    class Values:
+        def batchUpdate(self, spreadsheetId, body):
+            if spreadsheetId == "bad":
+                raise ConnectionError("sheets down")
+            return real.spreadsheets().values().batchUpdate(
+                spreadsheetId=spreadsheetId, body=body
+            )
+
+    class Spreadsheets:
+        def values(self):
+            return Values()
+
+    class Service:
+        def spreadsheets(self):
+            return Spreadsheets()
+
+    monkeypatch.setattr(sheets_repo, "get_sheets_service", lambda: Service())
+
+    with pytest.raises(ConnectionError):
+        order_store.replicate_once()
+
+    # удачная таблица отправлена, неудачная ждет повтора
+    assert sheet_rows(fake_sheets, "good")[1][2] == "y"
+    assert order_store.pending_count() == 1
+    assert order_store.overlay("bad", 2, [])[2] == "x"
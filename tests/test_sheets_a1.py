@@ -0,0 +1,11 @@
+# tests/test_sheets_a1.py
+
+import pytest
+
+from sheets_a1 import col_idx, col_letters
+
+
+@pytest.mark.parametrize("letters, idx", [("A", 0), ("Z", 25), ("AA", 26), ("AH", 33), ("ZZ", 701)])
+def test_col_idx_and_back(letters, idx):
+    assert col_idx(letters) == idx
+    assert col_letters(idx) == letters
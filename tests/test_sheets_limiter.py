@@ -0,0 +1,241 @@
+# tests/test_sheets_limiter.py
+
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import sheets_async
+import sheets_limiter
+from sheets_limiter import PriorityBucket, SheetsDeadlineExceeded
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiter(monkeypatch):
+    monkeypatch.setattr(sheets_limiter, "_BUCKETS", {})
+    monkeypatch.setattr(sheets_limiter, "_STATS", dict.fromkeys(sheets_limiter._STATS, 0))
+    monkeypatch.setattr(sheets_limiter, "SHEETS_LIMITER_ENABLED", True)
+    # после 429 bucket пуст: быстрый refill, чтобы повторы не ждали секундами
+    for name in (
+        "SHEETS_READS_PER_MINUTE",
+        "SHEETS_WRITES_PER_MINUTE",
+        "SHEETS_SPREADSHEET_READS_PER_MINUTE",
+        "SHEETS_SPREADSHEET_WRITES_PER_MINUTE",
+    ):
+        monkeypatch.setattr(sheets_limiter, name, 6000.0)
+    # повторы без реальных пауз
+    monkeypatch.setattr(sheets_limiter, "_backoff", lambda attempt: 0.01)
+
+
+def request(method="GET", spreadsheet_id="s1", suffix="/values/orders!A1"):
+    return SimpleNamespace(
+        method=method,
+        uri=f"https://sheets.googleapis.com/v4/spreadsheets/{spreadsheet_id}{suffix}",
+    )
+
+
+def http_error(status):
+    return HttpError(httplib2.Response({"status": status}), b"{}")
+
+
+class Upstream:
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.statuses:
+            raise http_error(self.statuses.pop(0))
+        return {"ok": True}
+
+
+# -------------------------------------------------
+# PriorityBucket
+# -------------------------------------------------
+
+def test_bucket_spends_capacity_then_waits_for_refill():
+    bucket = PriorityBucket("t", per_minute=60)      # 1/с, емкость 10
+    deadline = time.monotonic() + 0.2
+
+    for _ in range(10):
+        assert bucket.acquire(sheets_limiter.INTERACTIVE, deadline)
+    assert not bucket.acquire(sheets_limiter.INTERACTIVE, deadline)
+    assert time.monotonic() >= deadline
+
+
+def test_background_leaves_interactive_reserve(monkeypatch):
+    monkeypatch.setattr(sheets_limiter, "SHEETS_INTERACTIVE_RESERVE", 0.5)
+    bucket = PriorityBucket("t", per_minute=60)      # резерв 5 из 10
+    deadline = time.monotonic() + 0.1
+
+    background = 0
+    while bucket.acquire(sheets_limiter.BACKGROUND, deadline):
+        background += 1
+
+    assert background == 5
+    # резерв остался интерактивным
+    now = time.monotonic() + 0.1
+    assert all(bucket.acquire(sheets_limiter.INTERACTIVE, now) for _ in range(5))
+
+
+def test_reserve_never_blocks_background_at_low_rate(monkeypatch):
+    monkeypatch.setattr(sheets_limiter, "SHEETS_INTERACTIVE_RESERVE", 0.9)
+    bucket = PriorityBucket("t", per_minute=6)       # емкость 1
+
+    assert bucket.acquire(sheets_limiter.BACKGROUND, time.monotonic() + 0.1)
+
+
+def test_background_waits_while_interactive_is_waiting(monkeypatch):
+    monkeypatch.setattr(sheets_limiter, "SHEETS_INTERACTIVE_RESERVE", 0)
+    bucket = PriorityBucket("t", per_minute=600)     # 10/с
+    bucket._tokens = 0.0
+    order = []
+
+    def take(priority):
+        assert bucket.acquire(priority, time.monotonic() + 5)
+        order.append(priority)
+
+    interactive = threading.Thread(target=take, args=(sheets_limiter.INTERACTIVE,))
+    interactive.start()
+    time.sleep(0.02)
+    background = threading.Thread(target=take, args=(sheets_limiter.BACKGROUND,))
+    background.start()
+    interactive.join(5)
+    background.join(5)
+
+    assert order == [sheets_limiter.INTERACTIVE, sheets_limiter.BACKGROUND]
+
+
+def test_pause_drains_tokens():
+    bucket = PriorityBucket("t", per_minute=60)
+    bucket.pause(0.2)
+
+    assert not bucket.acquire(sheets_limiter.INTERACTIVE, time.monotonic() + 0.1)
+
+
+# -------------------------------------------------
+# execute
+# -------------------------------------------------
+
+def test_retries_429_and_5xx_reads():
+    upstream = Upstream(429, 503)
+
+    assert sheets_limiter.execute(request(), upstream) == {"ok": True}
+    assert upstream.calls == 3
+    assert sheets_limiter._STATS["retries"] == 2
+
+
+def test_client_errors_are_not_retried():
+    upstream = Upstream(400)
+
+    with pytest.raises(HttpError):
+        sheets_limiter.execute(request(), upstream)
+    assert upstream.calls == 1
+
+
+def test_append_is_not_retried_on_5xx_but_is_on_429():
+    append = request("POST", suffix="/values/users!A1:append")
+
+    upstream = Upstream(503)
+    with pytest.raises(HttpError):
+        sheets_limiter.execute(append, upstream)
+    assert upstream.calls == 1
+
+    upstream = Upstream(429)
+    assert sheets_limiter.execute(append, upstream) == {"ok": True}
+    assert upstream.calls == 2
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(sheets_limiter, "SHEETS_MAX_RETRIES", 2)
+    upstream = Upstream(*[503] * 10)
+
+    with pytest.raises(HttpError):
+        sheets_limiter.execute(request(), upstream)
+    assert upstream.calls == 3
+    assert sheets_limiter._STATS["gave_up"] == 1
+
+
+def test_expired_caller_deadline_skips_the_call():
+    upstream = Upstream()
+
+    with sheets_limiter.deadline(time.monotonic() - 1):
+        with pytest.raises(SheetsDeadlineExceeded):
+            sheets_limiter.execute(request(), upstream)
+
+    assert upstream.calls == 0
+    assert sheets_limiter._STATS["expired"] == 1
+
+
+def test_no_retry_past_deadline(monkeypatch):
+    monkeypatch.setattr(sheets_limiter, "_backoff", lambda attempt: 5)
+    upstream = Upstream(429)
+
+    with sheets_limiter.deadline(time.monotonic() + 1):
+        with pytest.raises(HttpError):
+            sheets_limiter.execute(request(), upstream)
+    assert upstream.calls == 1
+
+
+def test_background_budget_applies_without_caller_deadline(monkeypatch):
+    monkeypatch.setattr(sheets_limiter, "SHEETS_BACKGROUND_BUDGET", 0.2)
+    bucket = sheets_limiter._bucket("s1", "read")
+    bucket.pause(60)
+
+    started = time.monotonic()
+    with sheets_limiter.background():
+        with pytest.raises(SheetsDeadlineExceeded):
+            sheets_limiter.execute(request(), Upstream())
+
+    assert time.monotonic() - started < 2
+
+
+# -------------------------------------------------
+# sheets_async + fake_sheets_server
+# -------------------------------------------------
+
+def test_run_timeout_releases_the_worker_thread():
+    sheets_limiter._bucket("s1", "read").pause(60)
+    finished = []
+
+    def call():
+        try:
+            sheets_limiter.execute(request(), Upstream())
+        finally:
+            finished.append(time.monotonic())
+
+    async def main():
+        started = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await sheets_async.run(call, timeout=0.3)
+        return started
+
+    started = asyncio.run(main())
+
+    # поток не ждет квоту дольше, чем ждал вызывающий
+    deadline = time.monotonic() + 2
+    while not finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert finished and finished[0] - started < 1
+
+
+def test_reads_survive_injected_429(fake_sheets, monkeypatch):
+    import sheets_repo
+
+    fake_sheets.seed({"s1": {"orders": [["order_id"], ["o1"]]}})
+    monkeypatch.setitem(fake_sheets._config, "error_rate", 0.5)
+    monkeypatch.setattr(sheets_limiter, "SHEETS_MAX_RETRIES", 20)
+
+    service = sheets_repo.get_sheets_service()
+    for _ in range(10):
+        values = service.spreadsheets().values().get(
+            spreadsheetId="s1", range="orders!A2"
+        ).execute()
+        assert values["values"] == [["o1"]]
+
+    assert sheets_limiter._STATS["rate_limited"] > 0
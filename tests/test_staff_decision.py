@@ -0,0 +1,100 @@
+# tests/test_staff_decision.py
+"""
+Решение стафа: покупатель узнает о решении только после того,
+как batch (J..M + AG/AH) записан.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import kitchen_context
+import order_index
+import order_store
+import staff_callbacks
+import storage
+from storage_sheets import sheets_storage
+
+BUYER_ID = 555
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+
+class FakeMessage:
+    def __init__(self):
+        self.text = "Заказ o1"
+        self.caption = None
+        self.edits = []
+
+    async def edit_text(self, text, **kwargs):
+        self.edits.append(text)
+
+
+class FakeQuery:
+    def __init__(self, data):
+        self.data = data
+        self.from_user = SimpleNamespace(id=2, username="staff")
+        self.message = FakeMessage()
+        self.alerts = []
+
+    async def answer(self, text=None, show_alert=False):
+        if text:
+            self.alerts.append(text)
+
+
+@pytest.fixture
+def kitchen(fake_sheets, order_outbox, monkeypatch):
+    monkeypatch.setattr(order_index, "_INDEX", {})
+    monkeypatch.setattr(storage, "_storage", sheets_storage())
+    monkeypatch.setattr(kitchen_context, "_REGISTRY", {
+        "k1": SimpleNamespace(
+            kitchen_id="k1",
+            spreadsheet_id="k1-sheet",
+            owner_chat_id=1,
+            staff_chat_ids={2},
+        ),
+    })
+    fake_sheets.seed({"k1-sheet": {"orders": [
+        ["order_id", "created_at", "user_id"],
+        ["o1", "2026-01-01T10:00:00+00:00", str(BUYER_ID)],
+    ]}})
+
+
+def decide(data):
+    bot = FakeBot()
+    query = FakeQuery(data)
+    update = SimpleNamespace(callback_query=query, effective_chat=SimpleNamespace(id=2))
+    context = SimpleNamespace(bot=bot)
+
+    asyncio.run(staff_callbacks.staff_callback(update, context))
+    return bot, query
+
+
+def test_buyer_notified_after_decision_is_stored(kitchen):
+    bot, query = decide("staff:approve:o1:k1")
+
+    row = order_store.overlay("k1-sheet", 2, ["o1"])
+    assert row[9] == "approved"      # J
+    assert row[32] == "accepted"     # AG
+    assert [chat_id for chat_id, _ in bot.sent] == [BUYER_ID, 2]
+    assert "Принят в работу" in query.message.edits[0]
+
+
+def test_buyer_not_notified_when_batch_write_fails(kitchen, monkeypatch):
+    def broken_write(pending, *, operation=""):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(order_store, "write", broken_write)
+
+    bot, query = decide("staff:reject:o1:k1")
+
+    assert bot.sent == []
+    assert query.message.edits == []
+    assert query.alerts == ["Ошибка обработки заказа"]
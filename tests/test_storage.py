@@ -0,0 +1,108 @@
+# tests/test_storage.py
+"""
+Один и тот же сценарий заказа на обоих бэкендах storage:
+sheets (через fake_sheets_server + order_store) и memory.
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import kitchen_context
+import order_index
+import sheets_writer
+import storage
+import webapp_orders_sync
+from storage_memory import memory_storage
+from storage_sheets import sheets_storage
+
+HEADER = ["order_id", "created_at", "user_id"]
+
+
+@pytest.fixture(params=["sheets", "memory"])
+def store(request, monkeypatch):
+    monkeypatch.setattr(order_index, "_INDEX", {})
+    data = {
+        "k1-sheet": {"orders": [HEADER, ["o-old", "t0", "10"]]},
+        "k2-sheet": {"orders": [HEADER]},
+    }
+
+    if request.param == "memory":
+        return memory_storage(data)
+
+    fake = request.getfixturevalue("fake_sheets")
+    request.getfixturevalue("order_outbox")
+    fake.seed(data)
+    return sheets_storage()
+
+
+def test_append_then_get(store):
+    row_idx = store.orders.append("k2-sheet", ["o1", "t1", "42"], kitchen_id="k2")
+
+    assert row_idx == 2
+    assert store.orders.get("k2-sheet", "o1") == (2, ["o1", "t1", "42"])
+    assert store.orders.get("k2-sheet", "missing") == (None, None)
+
+
+def test_get_existing_row_without_index(store):
+    assert store.orders.get("k1-sheet", "o-old") == (2, ["o-old", "t0", "10"])
+
+
+def test_locate_across_kitchens(store):
+    store.orders.append("k2-sheet", ["o1", "t1", "42"], kitchen_id="k2")
+
+    found = store.orders.locate("o1", {"k1": "k1-sheet", "k2": "k2-sheet"})
+
+    assert found == ("k2", "k2-sheet", 2, ["o1", "t1", "42"])
+    assert store.orders.locate("missing", {"k1": "k1-sheet"}) == (None, None, None, None)
+
+
+def test_update_cells_visible_on_read(store):
+    store.orders.update_cells("k1-sheet", 2, {"J": "approved"})
+
+    row = store.orders.read_row("k1-sheet", 2)
+
+    assert row[:3] == ["o-old", "t0", "10"]
+    assert row[9] == "approved"
+
+
+def test_operation_batch_goes_through_storage(store, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", store)
+
+    async def staff_decision():
+        async with sheets_writer.operation("staff_decision") as batch:
+            batch.set_row_cells("k1-sheet", 2, {"J": "approved", "AG": "accepted"})
+            store.orders.update_cells("k1-sheet", 2, {"K": "2"})
+
+    asyncio.run(staff_decision())
+
+    # на memory ни одного запроса к Google: get_sheets_service без ключа упал бы
+    row = store.orders.read_row("k1-sheet", 2)
+    assert row[9:11] == ["approved", "2"]
+    assert row[32] == "accepted"
+
+
+def test_orders_poll_reads_and_marks_through_storage(store, monkeypatch):
+    monkeypatch.setattr(storage, "_storage", store)
+    monkeypatch.setattr(kitchen_context, "_REGISTRY", {
+        "k1": SimpleNamespace(kitchen_id="k1", spreadsheet_id="k1-sheet", status="active"),
+    })
+    context = SimpleNamespace(
+        bot=None,
+        job=SimpleNamespace(data={"spreadsheet_id": "k1-sheet", "kitchen_id": "k1"}),
+    )
+
+    asyncio.run(webapp_orders_sync.orders_job(context))
+
+    # новый заказ: AE=1, уведомление на следующем проходе
+    assert store.orders.rows("k1-sheet")[1][30] == "1"
+
+
+def test_get_storage_uses_set_storage():
+    memory = memory_storage()
+    storage.set_storage(memory)
+    try:
+        assert storage.get_storage() is memory
+    finally:
+        storage.set_storage(None)
@@ -0,0 +1,131 @@
+# tests/test_user_registrations.py
+
+from types import SimpleNamespace
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+import storage
+import user_registrations
+import users_directory
+from config import SPREADSHEET_ID
+from sheets_limiter import SheetsDeadlineExceeded
+from storage_memory import memory_storage
+from storage_sheets import SheetsUserRepository, sheets_storage
+
+USERS_HEADER = ["user_id", "username", "full_name", "created_at"]
+
+
+def tg_user(uid):
+    return SimpleNamespace(id=uid, username=f"u{uid}", full_name=f"User {uid}")
+
+
+@pytest.fixture
+def registrations(fake_sheets, monkeypatch):
+    monkeypatch.setattr(user_registrations, "_known", set())
+    monkeypatch.setattr(user_registrations, "_pending", [])
+    monkeypatch.setattr(user_registrations, "_seeded", False)
+    users_directory.invalidate()
+    fake_sheets.seed({SPREADSHEET_ID: {"users": [USERS_HEADER, ["1", "old", "Old"]]}})
+    yield fake_sheets
+    users_directory.invalidate()
+
+
+def broken_append(monkeypatch, error):
+    def append(self, spreadsheet_id, rows):
+        raise error
+
+    monkeypatch.setattr(SheetsUserRepository, "append", append)
+
+
+def test_known_user_is_not_queued(registrations):
+    assert not user_registrations.register(tg_user(1))
+    assert user_registrations.register(tg_user(2))
+    assert not user_registrations.register(tg_user(2))
+    assert user_registrations.pending_count() == 1
+
+
+def test_flush_appends_all_pending_in_one_request(registrations):
+    user_registrations.register(tg_user(2))
+    user_registrations.register(tg_user(3))
+    before = registrations.fake_stats()["requests"].get("values.append", 0)
+
+    assert user_registrations.flush() == 2
+
+    rows = registrations._book(SPREADSHEET_ID).tabs["users"]
+    assert [r[0] for r in rows] == ["user_id", "1", "2", "3"]
+    assert registrations.fake_stats()["requests"]["values.append"] == before + 1
+    assert user_registrations.flush() == 0
+
+
+def test_pending_user_is_written_before_lookup(registrations):
+    user_registrations.register(tg_user(2))
+
+    rec = sheets_storage().users.get(SPREADSHEET_ID, 2)
+
+    assert rec is not None and rec.username == "u2"
+    assert user_registrations.pending_count() == 0
+
+
+@pytest.mark.parametrize("error", [
+    HttpError(httplib2.Response({"status": 429}), b"{}"),
+    SheetsDeadlineExceeded("no quota"),
+])
+def test_not_applied_append_is_requeued(registrations, monkeypatch, error):
+    user_registrations.register(tg_user(2))
+    broken_append(monkeypatch, error)
+
+    with pytest.raises(type(error)):
+        user_registrations.flush()
+
+    assert user_registrations.is_pending(SPREADSHEET_ID, 2)
+
+
+@pytest.mark.parametrize("error", [
+    HttpError(httplib2.Response({"status": 503}), b"{}"),
+    TimeoutError("read timed out"),
+])
+def test_ambiguous_append_is_not_retried(registrations, monkeypatch, error):
+    user_registrations.register(tg_user(2))
+    broken_append(monkeypatch, error)
+
+    with pytest.raises(type(error)):
+        user_registrations.flush()
+
+    # запись могла пройти: повтор дал бы дубль строки
+    assert user_registrations.pending_count() == 0
+    assert not user_registrations.register(tg_user(2))
+
+
+@pytest.mark.parametrize("status", [400, 403])
+def test_rejected_append_is_dropped_not_requeued(registrations, monkeypatch, status):
+    user_registrations.register(tg_user(2))
+    broken_append(monkeypatch, HttpError(httplib2.Response({"status": status}), b"{}"))
+
+    for _ in range(3):
+        with pytest.raises(HttpError):
+            user_registrations.flush()
+        # лист переименован / защищен: очередь не копит одну и ту же пачку
+        assert user_registrations.pending_count() == 0
+        assert user_registrations.register(tg_user(2))
+
+    assert user_registrations.pending_count() == 1
+
+
+def test_memory_backend_registers_without_sheets(monkeypatch):
+    store = memory_storage({SPREADSHEET_ID: {"users": [USERS_HEADER, ["1", "old", "Old"]]}})
+    monkeypatch.setattr(storage, "_storage", store)
+    monkeypatch.setattr(user_registrations, "_known", set())
+    monkeypatch.setattr(user_registrations, "_pending", [])
+    monkeypatch.setattr(user_registrations, "_seeded", False)
+    users_directory.invalidate()
+
+    assert not user_registrations.register(tg_user(1))
+    assert user_registrations.register(tg_user(2))
+
+    # поиск пользователя дописывает очередь и на memory
+    assert store.users.get(SPREADSHEET_ID, 2).username == "u2"
+    assert user_registrations.pending_count() == 0
+    assert users_directory.get(SPREADSHEET_ID, 2).row_idx == 3
+    users_directory.invalidate()
@@ -0,0 +1,226 @@
+# user_registrations.py
+"""
+Регистрация пользователей платформы (/start -> users платформенной таблицы).
+
+Раньше register_user_if_new на КАЖДЫЙ /start читал всю колонку users!A2:A,
+строил множество id и только потом рисовал домашний экран.
+С ростом базы /start линейно замедлялся.
+
+Теперь:
+- множество известных user_id в памяти процесса, читается один раз
+- новый пользователь сразу попадает в множество, а строка копится в очереди
+- очередь уходит в хранилище (get_storage().users.append) одним append раз в USERS_REGISTER_FLUSH_SECONDS
+  (и при остановке бота)
+
+ВАЖНО:
+- append не идемпотентен: строки возвращаются в очередь, только если запись
+  точно не прошла и может пройти позже (429 / лимитер не отправил запрос).
+  Таймаут, 5xx, обрыв — запись могла примениться, повтор = дубль: строки
+  логируем и бросаем (после рестарта seed() перечитает users, и недописанный
+  зарегистрируется). Прочие 4xx (лист переименован / защищен) повтор не
+  исправит: строки бросаем, а пользователей убираем из известных, чтобы
+  следующий /start поставил их в очередь заново
+- при падении процесса незаписанные строки теряются (до flush секунды),
+  пользователь будет зарегистрирован при следующем /start после рестарта
+- пока строка в очереди, пользователя нет в users: storage перед записью
+  контактов / поиском пользователя зовет ensure_written() (flush без ожидания)
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import List, Set
+
+from googleapiclient.errors import HttpError
+
+from config import SPREADSHEET_ID
+from sheets_limiter import SheetsDeadlineExceeded
+from storage import get_storage
+import users_directory
+
+log = logging.getLogger("USER_REGISTRATIONS")
+
+
+USERS_REGISTER_FLUSH_SECONDS = float(os.getenv("USERS_REGISTER_FLUSH_SECONDS", "10"))
+
+_lock = threading.Lock()
+_seed_lock = threading.Lock()
+# один flush за раз: ensure_written дожидается идущей записи
+_flush_lock = threading.Lock()
+_known: Set[str] = set()
+_seeded = False
+_pending: List[list] = []
+
+
+def seed() -> int:
+    """
+    Читает user_id из users один раз за жизнь процесса (блокирующий).
+    """
+    global _seeded
+
+    with _seed_lock:
+        if _seeded:
+            return len(_known)
+
+        # заодно прогревает справочник платформы (users_directory)
+        user_ids = get_storage().users.user_ids(SPREADSHEET_ID)
+
+        with _lock:
+            _known.update(str(uid) for uid in user_ids)
+            _seeded = True
+
+        log.info(f"[REGISTRATIONS] seeded known_users={len(_known)}")
+        return len(_known)
+
+
+def register(user) -> bool:
+    """
+    True, если пользователь новый (строка поставлена в очередь на запись).
+    После seed() Sheets не трогает.
+    """
+    if not _seeded:
+        seed()
+
+    uid = str(user.id)
+
+    with _lock:
+        if uid in _known:
+            return False
+
+        _known.add(uid)
+        _pending.append([
+            uid,
+            user.username or "",
+            user.full_name or "",
+            datetime.utcnow().isoformat(),
+        ])
+
+    return True
+
+
+def _status(e: Exception) -> int:
+    if isinstance(e, HttpError):
+        return int(getattr(e.resp, "status", 0) or 0)
+    return 0
+
+
+def _retryable(e: Exception) -> bool:
+    """
+    True, если append точно не записал строки и повтор может пройти.
+    """
+    return isinstance(e, SheetsDeadlineExceeded) or _status(e) == 429
+
+
+def flush() -> int:
+    """
+    Дописывает накопленные регистрации одним append (блокирующий).
+    Возвращает количество записанных строк.
+    """
+    with _flush_lock:
+        return _flush_locked()
+
+
+def _flush_locked() -> int:
+    with _lock:
+        if not _pending:
+            return 0
+        batch = list(_pending)
+        _pending.clear()
+
+    try:
+        first_row = get_storage().users.append(SPREADSHEET_ID, batch)
+    except Exception as e:
+        users = [row[0] for row in batch]
+        if _retryable(e):
+            with _lock:
+                _pending[:0] = batch
+        elif 400 <= _status(e) < 500:
+            # запрос отвергнут целиком: строк нет, но и повтор не пройдет
+            with _lock:
+                _known.difference_update(users)
+            log.error(
+                f"[REGISTRATIONS] append rejected, dropped users={users} "
+                f"(will register again on next /start): {e}"
+            )
+        else:
+            log.error(
+                f"[REGISTRATIONS] append outcome unknown, not retrying "
+                f"users={users}: {e}"
+            )
+        raise
+
+    for offset, row in enumerate(batch):
+        users_directory.add_row(
+            SPREADSHEET_ID,
+            first_row + offset if first_row else None,
+            row,
+        )
+
+    log.info(f"[REGISTRATIONS] appended users={len(batch)}")
+    return len(batch)
+
+
+def pending_count() -> int:
+    with _lock:
+        return len(_pending)
+
+
+def is_pending(spreadsheet_id: str, user_id) -> bool:
+    if spreadsheet_id != SPREADSHEET_ID:
+        return False
+    uid = str(user_id)
+    with _lock:
+        return any(row[0] == uid for row in _pending)
+
+
+def ensure_written(spreadsheet_id: str, user_id) -> bool:
+    """
+    Пользователь еще в очереди регистраций -> записать очередь сейчас
+    (блокирующий). True, если был flush.
+    """
+    if not is_pending(spreadsheet_id, user_id):
+        return False
+    try:
+        flush()
+    except Exception as e:
+        log.error(f"[REGISTRATIONS] flush for user={user_id} failed: {e}")
+    return True
+
+
+async def registrations_flush_loop(
+    app,
+    *,
+    interval: float = USERS_REGISTER_FLUSH_SECONDS,
+) -> None:
+    """
+    Фоновая запись регистраций (app.create_task из post_init).
+    На остановке приложения делает последний flush.
+    """
+    import sheets_async
+    import sheets_limiter
+
+    while not app.running:
+        await asyncio.sleep(0.5)
+
+    sheets_limiter.mark_background()
+
+    while app.running:
+        deadline = time.monotonic() + interval
+        while app.running and time.monotonic() < deadline:
+            await asyncio.sleep(min(1.0, deadline - time.monotonic()))
+
+        try:
+            await sheets_async.run(flush)
+        except Exception as e:
+            log.error(f"[REGISTRATIONS] flush failed: {e}", exc_info=True)
+
+    if pending_count():
+        try:
+            await sheets_async.run(flush)
+        except Exception:
+            log.exception(
+                f"[REGISTRATIONS] final flush failed, lost={pending_count()}"
+            )
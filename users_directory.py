@@ -0,0 +1,308 @@
+# users_directory.py
+"""
+Справочник покупателей по кухням (лист users).
+
+Раньше каждый поиск пользователя (профиль на чекауте, chat_id покупателя
+после ETA/решения стаффа, уведомление о заказе, сохранение контактов,
+рассылка) читал users целиком и шел по нему циклом.
+
+Теперь:
+- spreadsheet_id -> user_id -> UserRecord (имя, телефон, chat_id, строка)
+- первое обращение читает users!A2:G целиком
+- дальше только ДОЧИТЫВАНИЕ новых строк (лист пополняется append'ом)
+- полное перечитывание в фоне раз в USERS_FULL_REFRESH_SECONDS
+  (подхватывает ручные правки в таблице)
+- наши записи (контакты, регистрация) применяются к справочнику на месте
+
+Колонки users:
+A user_id | B username | C full_name | D created_at |
+E real_name | F phone | G telegram_chat_id
+"""
+
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional
+
+from googleapiclient.errors import HttpError
+
+log = logging.getLogger("USERS_DIRECTORY")
+
+
+# дочитывание новых строк при промахе не чаще, чем раз в N секунд
+USERS_MISS_REFRESH_SECONDS = float(os.getenv("USERS_MISS_REFRESH_SECONDS", "5"))
+USERS_FULL_REFRESH_SECONDS = float(os.getenv("USERS_FULL_REFRESH_SECONDS", "600"))
+
+_HEADER_IDS = ("user_id", "userid", "id")
+
+
+@dataclass(frozen=True)
+class UserRecord:
+    user_id: str
+    row_idx: int
+    username: str = ""
+    full_name: str = ""
+    name: str = ""
+    phone: str = ""
+    telegram_chat_id: Optional[int] = None
+
+    @classmethod
+    def from_row(cls, row_idx: int, row: list) -> "UserRecord":
+        def cell(i: int) -> str:
+            return str(row[i]) if len(row) > i and row[i] is not None else ""
+
+        chat_id = cell(6).strip()
+        try:
+            telegram_chat_id = int(chat_id) if chat_id else None
+        except ValueError:
+            telegram_chat_id = None
+
+        return cls(
+            user_id=cell(0),
+            row_idx=row_idx,
+            username=cell(1),
+            full_name=cell(2),
+            name=cell(4),
+            phone=cell(5),
+            telegram_chat_id=telegram_chat_id,
+        )
+
+
+class _Directory:
+    def __init__(self, spreadsheet_id: str):
+        self.spreadsheet_id = spreadsheet_id
+        self.users: Dict[str, UserRecord] = {}
+        self.last_row = 1           # последняя прочитанная строка (1 = заголовок)
+        self.loaded_at = 0.0        # полное чтение
+        self.tail_read_at = 0.0     # дочитывание
+        self.full_refreshing = False
+
+    def apply_rows(self, rows: List[list], first_row_idx: int) -> int:
+        added = 0
+        for idx, row in enumerate(rows, start=first_row_idx):
+            if not row or not row[0]:
+                continue
+            uid = str(row[0]).strip()
+            if uid.lower() in _HEADER_IDS:
+                continue
+            # дубли user_id: как и линейный поиск раньше, первая строка главная
+            if uid in self.users and self.users[uid].row_idx < idx:
+                continue
+            self.users[uid] = UserRecord.from_row(idx, row)
+            added += 1
+        if rows:
+            self.last_row = max(self.last_row, first_row_idx + len(rows) - 1)
+        return added
+
+
+_lock = threading.RLock()
+_DIRS: Dict[str, _Directory] = {}
+
+
+def _read(spreadsheet_id: str, first_row: int) -> List[list]:
+    # storage импортирует UserRecord отсюда
+    from storage import get_storage
+
+    return get_storage().users.rows(spreadsheet_id, first_row)
+
+
+def _full_load(spreadsheet_id: str) -> _Directory:
+    rows = _read(spreadsheet_id, 2)
+
+    fresh = _Directory(spreadsheet_id)
+    fresh.apply_rows(rows, 2)
+    fresh.loaded_at = fresh.tail_read_at = time.monotonic()
+
+    with _lock:
+        _DIRS[spreadsheet_id] = fresh
+
+    log.info(
+        f"[USERS] loaded spreadsheet_id={spreadsheet_id} "
+        f"users={len(fresh.users)} last_row={fresh.last_row}"
+    )
+    return fresh
+
+
+def _read_tail(d: _Directory) -> int:
+    """
+    Дочитывает строки после last_row. Возвращает число новых пользователей.
+    """
+    try:
+        rows = _read(d.spreadsheet_id, d.last_row + 1)
+    except HttpError as e:
+        # last_row = последняя строка сетки: диапазон за ее пределами -> 400
+        if e.resp.status != 400:
+            raise
+        rows = []
+    with _lock:
+        added = d.apply_rows(rows, d.last_row + 1)
+        d.tail_read_at = time.monotonic()
+    if added:
+        log.info(f"[USERS] +{added} spreadsheet_id={d.spreadsheet_id}")
+    return added
+
+
+def _background_full_refresh(spreadsheet_id: str) -> None:
+    try:
+        _full_load(spreadsheet_id)
+    except Exception:
+        log.exception(f"[USERS] full refresh failed spreadsheet_id={spreadsheet_id}")
+        with _lock:
+            d = _DIRS.get(spreadsheet_id)
+            if d:
+                d.full_refreshing = False
+
+
+def _directory(spreadsheet_id: str) -> _Directory:
+    """
+    Справочник таблицы (блокирующий при первом обращении).
+    """
+    with _lock:
+        d = _DIRS.get(spreadsheet_id)
+        stale = (
+            d is not None
+            and not d.full_refreshing
+            and time.monotonic() - d.loaded_at > USERS_FULL_REFRESH_SECONDS
+        )
+        if stale:
+            d.full_refreshing = True
+
+    if d is None:
+        return _full_load(spreadsheet_id)
+
+    if stale:
+        import sheets_async
+        import sheets_limiter
+
+        with sheets_limiter.background():
+            sheets_async.submit(_background_full_refresh, spreadsheet_id)
+
+    return d
+
+
+# -------------------------------------------------
+# Чтение
+# -------------------------------------------------
+
+def get(spreadsheet_id: str, user_id) -> Optional[UserRecord]:
+    """
+    Пользователь по user_id. Попадание в справочник Sheets не читает,
+    при промахе дочитываются только новые строки.
+    """
+    uid = str(user_id)
+    d = _directory(spreadsheet_id)
+
+    with _lock:
+        rec = d.users.get(uid)
+        tail_due = time.monotonic() - d.tail_read_at > USERS_MISS_REFRESH_SECONDS
+
+    if rec is not None or not tail_due:
+        return rec
+
+    _read_tail(d)
+
+    with _lock:
+        return d.users.get(uid)
+
+
+def snapshot(spreadsheet_id: str) -> Mapping[str, UserRecord]:
+    """
+    Неизменяемый срез справочника (пачка уведомлений, рассылка).
+    """
+    d = _directory(spreadsheet_id)
+    with _lock:
+        return MappingProxyType(dict(d.users))
+
+
+def user_ids(spreadsheet_id: str, *, fresh: bool = True) -> List[int]:
+    """
+    Все числовые user_id таблицы (для рассылки).
+    fresh=True сначала дочитывает новые строки.
+    """
+    d = _directory(spreadsheet_id)
+    if fresh:
+        _read_tail(d)
+    with _lock:
+        return [int(uid) for uid in d.users if uid.isdigit()]
+
+
+# -------------------------------------------------
+# Write-through
+# -------------------------------------------------
+
+def update(spreadsheet_id: str, user_id, **fields) -> bool:
+    """
+    Применяет нашу запись в users к справочнику на месте.
+    fields: name / phone / telegram_chat_id / username / full_name
+    """
+    uid = str(user_id)
+    with _lock:
+        d = _DIRS.get(spreadsheet_id)
+        if d is None or uid not in d.users:
+            return False
+        d.users[uid] = replace(d.users[uid], **fields)
+        return True
+
+
+def add_row(spreadsheet_id: str, row_idx: Optional[int], row: list) -> None:
+    """
+    Новая строка, которую мы сами дописали в users.
+    Без номера строки (append не вернул диапазон) ничего не делаем:
+    ее подхватит дочитывание.
+    """
+    if not row_idx:
+        return
+    with _lock:
+        d = _DIRS.get(spreadsheet_id)
+        if d is None:
+            return
+        if row_idx == d.last_row + 1:
+            d.apply_rows([row], row_idx)
+        else:
+            rec = UserRecord.from_row(row_idx, row)
+            d.users.setdefault(rec.user_id, rec)
+
+
+def find_row(spreadsheet_id: str, user_id) -> Optional[int]:
+    rec = get(spreadsheet_id, user_id)
+    return rec.row_idx if rec else None
+
+
+def warm_up(spreadsheet_ids) -> int:
+    """
+    Прогрев при старте. Ошибка по одной таблице не мешает остальным.
+    """
+    loaded = 0
+    for spreadsheet_id in dict.fromkeys(spreadsheet_ids):
+        if not spreadsheet_id:
+            continue
+        try:
+            _full_load(spreadsheet_id)
+            loaded += 1
+        except Exception:
+            log.exception(f"[USERS] warm-up failed spreadsheet_id={spreadsheet_id}")
+    return loaded
+
+
+def invalidate(spreadsheet_id: Optional[str] = None) -> None:
+    with _lock:
+        if spreadsheet_id is None:
+            _DIRS.clear()
+        else:
+            _DIRS.pop(spreadsheet_id, None)
+
+
+def directory_stats() -> Dict[str, dict]:
+    now = time.monotonic()
+    with _lock:
+        return {
+            sid: {
+                "users": len(d.users),
+                "last_row": d.last_row,
+                "age": round(now - d.loaded_at, 1),
+            }
+            for sid, d in _DIRS.items()
+        }
@@ -1,9 +1,14 @@
 # webapi_client.py
 
-import httpx
+import asyncio
 import os
 import logging
 
+import circuit_breaker
+import http_clients
+import idempotency
+from circuit_breaker import CircuitOpenError
+
 log = logging.getLogger(__name__)
 
 WEB_API_URL = os.getenv("WEB_API_URL", "")
@@ -11,10 +16,14 @@ API_KEY = os.getenv("WEB_API_KEY", "")
 WEB_API_TIMEOUT = 5
 
 
-async def webapi_create_order(payload: dict) -> dict:
+async def webapi_create_order(payload: dict, *, idempotency_key: str | None = None) -> dict:
     """
     Safe Web API order creation.
     Никогда не бросает исключения наружу.
+
+    idempotency_key — один на попытку чекаута (checkout["idempotency_key"]):
+    уходит в X-IDEMPOTENCY-KEY, чтобы Web API не создал второй заказ
+    на двойной тап или повтор после таймаута, и служит ключом single_flight.
     """
 
     log.info(
@@ -33,16 +42,24 @@ async def webapi_create_order(payload: dict) -> dict:
             "order_id": payload.get("order_id"),
         }
 
-    try:
-        async with httpx.AsyncClient(timeout=WEB_API_TIMEOUT) as client:
-            resp = await client.post(
+    order_id = payload.get("order_id")
+
+    headers = {
+        "X-API-KEY": API_KEY,
+        "X-ROLE": "kitchen",
+    }
+    if idempotency_key:
+        headers["X-IDEMPOTENCY-KEY"] = idempotency_key
+
+    async def _post() -> dict:
+        with circuit_breaker.get("webapi.create_order").guard() as call:
+            resp = await http_clients.get_client().post(
                 f"{WEB_API_URL}/api/v1/orders",
                 json=payload,
-                headers={
-                    "X-API-KEY": API_KEY,
-                    "X-ROLE": "kitchen",
-                },
+                headers=headers,
+                timeout=WEB_API_TIMEOUT,
             )
+            call.status(resp.status_code)
 
         if resp.status_code != 200:
             log.error(
@@ -50,20 +67,57 @@ async def webapi_create_order(payload: dict) -> dict:
                 resp.status_code,
                 resp.text,
             )
-            return {"status": "error", "reason": "http_error"}
+            raise RuntimeError(f"http_error {resp.status_code}")
 
         return resp.json()
 
+    if idempotency_key:
+        flight_key = f"webapi:create_order:{idempotency_key}"
+    elif order_id:
+        flight_key = f"{payload.get('source') or 'bot'}:create_order:{order_id}"
+    else:
+        flight_key = None
+
+    try:
+        if flight_key is None:
+            return await _post()
+        # двойной «Подтвердить» по одному заказу -> один запрос
+        return await idempotency.single_flight(flight_key, _post)
+
+    except CircuitOpenError as e:
+        log.warning("WEBAPI create_order fast-fail: %s", e)
+        return {"status": "error", "reason": "circuit_open"}
+
+    except RuntimeError:
+        return {"status": "error", "reason": "http_error"}
+
     except Exception as e:
         log.exception("WEBAPI create_order exception")
         return {"status": "error", "reason": "exception"}
 
 
-async def webapi_check_address(payload: dict) -> dict:
-    # ... existing code до result = resp.json() ...
-    
-    result = resp.json()
-    
+# -------------------------------------------------
+# Address check (checkout)
+# -------------------------------------------------
+# Раньше main.webapi_check_address делал синхронный requests.post
+# прямо из хендлера: пока геокодер думал, стоял весь бот.
+# Теперь: общий пул http_clients, не больше ADDRESS_CHECK_CONCURRENCY
+# проверок одновременно и общий дедлайн на вызов (вместе с ожиданием слота).
+
+ADDRESS_CHECK_CONCURRENCY = int(os.getenv("ADDRESS_CHECK_CONCURRENCY", "8"))
+ADDRESS_CHECK_DEADLINE = float(os.getenv("ADDRESS_CHECK_DEADLINE", "5"))
+
+_address_sem: asyncio.Semaphore | None = None
+
+
+def _get_address_sem() -> asyncio.Semaphore:
+    global _address_sem
+    if _address_sem is None:
+        _address_sem = asyncio.Semaphore(ADDRESS_CHECK_CONCURRENCY)
+    return _address_sem
+
+
+def _validate_address_contract(payload: dict, result: dict) -> dict:
     # ✅ ВАЛИДАЦИЯ КОНТРАКТА API
     if result.get("ok") is True:
         if "delivery_price" not in result:
@@ -99,4 +153,80 @@ async def webapi_check_address(payload: dict) -> dict:
                 "message": "API contract violation: invalid price format"
             }
     
-    return result
\ No newline at end of file
+    return result
+
+
+async def _post_address_check(payload: dict, call) -> dict | None:
+    from config import WEB_API_BASE_URL, WEB_API_KEY
+
+    resp = await http_clients.get_client().post(
+        f"{WEB_API_BASE_URL}/api/v1/address/check",
+        json=payload,
+        headers={
+            "X-API-KEY": WEB_API_KEY,
+        },
+        timeout=ADDRESS_CHECK_DEADLINE,
+    )
+    call.status(resp.status_code)
+
+    if resp.status_code != 200:
+        log.error(
+            "[WEBAPI] address check failed %s %s",
+            resp.status_code,
+            resp.text,
+        )
+        return None
+
+    return _validate_address_contract(payload, resp.json())
+
+
+async def webapi_check_address(
+    city: str,
+    address: str,
+    *,
+    deadline: float | None = None,
+) -> dict | None:
+    """
+    Проверка адреса доставки (нормализация + цена).
+    Никогда не бросает исключения наружу: ошибка/таймаут/open breaker -> None.
+    """
+    payload = {
+        "city": city,
+        "address": address,
+    }
+    limit = deadline if deadline is not None else ADDRESS_CHECK_DEADLINE
+
+    log.info(
+        "[WEBAPI] address check city=%r address=%r",
+        city,
+        address,
+    )
+
+    loop = asyncio.get_running_loop()
+    deadline_at = loop.time() + limit
+    sem = _get_address_sem()
+
+    # ожидание в локальной очереди — не ошибка Web API, breaker его не видит
+    try:
+        await asyncio.wait_for(sem.acquire(), limit)
+    except asyncio.TimeoutError:
+        log.error("[WEBAPI] address check queued locally > %ss city=%r", limit, city)
+        return None
+
+    try:
+        with circuit_breaker.get("webapi.address_check").guard() as call:
+            return await asyncio.wait_for(
+                _post_address_check(payload, call),
+                max(deadline_at - loop.time(), 0.1),
+            )
+    except CircuitOpenError as e:
+        log.warning("[WEBAPI] address check fast-fail: %s", e)
+        return None
+    except asyncio.TimeoutError:
+        log.error("[WEBAPI] address check deadline %ss exceeded city=%r", limit, city)
+        return None
+    except Exception as e:
+        log.exception("[WEBAPI] address check exception: %s", e)
+        return None
+    finally:
+        sem.release()
@@ -1,11 +1,19 @@
 # webapp_orders_sync.py - ФИНАЛЬНАЯ ВЕРСИЯ
 
+from collections import OrderedDict
 from datetime import datetime
+from types import SimpleNamespace
+import asyncio
 import logging
+import time
 
-from config import ORDERS_RANGE
-from sheets_repo import get_sheets_service
+from config import ORDERS_RANGE, ORDERS_POLL_INTERVAL, ORDERS_POLL_CONCURRENCY
 from kitchen_context import require
+import order_index
+import sheets_async
+import sheets_limiter
+import sheets_writer
+from storage import get_storage
 
 log = logging.getLogger("WEBAPP_SYNC")
 
@@ -13,15 +21,114 @@ log = logging.getLogger("WEBAPP_SYNC")
 ORDERS_SHEET = ORDERS_RANGE.split("!")[0]
 
 
+# -------------------------------------------------
+# Дедупликация уведомлений
+# -------------------------------------------------
+# Заказ может прийти двумя путями: push (ingest_server) и опрос.
+# Поллер мог прочитать строку до того, как push записал AF,
+# поэтому кроме AF держим в памяти, кого уже уведомили / уведомляем.
+
+_CLAIMS_MAX = 5000
+_claims: "OrderedDict[tuple, str]" = OrderedDict()
+
+
+def _claim(spreadsheet_id: str, order_id: str) -> bool:
+    key = (spreadsheet_id, str(order_id))
+    if key in _claims:
+        return False
+    _claims[key] = "inflight"
+    while len(_claims) > _CLAIMS_MAX:
+        _claims.popitem(last=False)
+    return True
+
+
+def _release(spreadsheet_id: str, order_id: str) -> None:
+    _claims.pop((spreadsheet_id, str(order_id)), None)
+
+
+def _mark_done(spreadsheet_id: str, order_id: str) -> None:
+    _claims[(spreadsheet_id, str(order_id))] = "notified"
+
+
+def _notified_marker() -> str:
+    return f"notified:{datetime.utcnow().isoformat()}"
+
+
+async def notify_order(bot, kitchen, order_id: str) -> str:
+    """
+    Уведомляет стафф об одном заказе сразу (push из Web API).
+    Пишет маркеры AE/AF, чтобы поллер его больше не трогал.
+
+    Возвращает: "notified" | "duplicate" | "not_found" | "failed"
+    """
+    spreadsheet_id = kitchen.spreadsheet_id
+    kitchen_id = kitchen.kitchen_id
+    order_id = str(order_id)
+
+    if not _claim(spreadsheet_id, order_id):
+        log.info(f"[{kitchen_id}] PUSH: order={order_id} already handled")
+        return "duplicate"
+
+    try:
+        row_idx, row = await sheets_async.get_order_row(
+            order_id,
+            spreadsheet_id=spreadsheet_id,
+            kitchen_id=kitchen_id,
+        )
+    except Exception as e:
+        _release(spreadsheet_id, order_id)
+        log.error(f"[{kitchen_id}] PUSH: read failed order={order_id}: {e}")
+        return "failed"
+
+    if not row_idx:
+        _release(spreadsheet_id, order_id)
+        log.warning(f"[{kitchen_id}] PUSH: order={order_id} not found")
+        return "not_found"
+
+    af = row[31] if len(row) > 31 else ""
+    if af:
+        _mark_done(spreadsheet_id, order_id)
+        return "duplicate"
+
+    try:
+        from main import notify_staff
+
+        await notify_staff(bot, kitchen, order_id, order_row=row)
+    except Exception as e:
+        _release(spreadsheet_id, order_id)
+        log.error(f"[{kitchen_id}] PUSH: notify_staff failed for {order_id}: {e}", exc_info=True)
+        return "failed"
+
+    _mark_done(spreadsheet_id, order_id)
+
+    try:
+        async with sheets_writer.operation("order_push") as batch:
+            batch.set_row_cells(
+                spreadsheet_id,
+                row_idx,
+                {"AE": "1", "AF": _notified_marker()},
+                sheet=ORDERS_SHEET,
+            )
+    except Exception as e:
+        # уведомление уже ушло: в этом процессе повтора не будет (_claims),
+        # но после рестарта поллер увидит пустой AF и уведомит еще раз
+        log.error(f"[{kitchen_id}] PUSH: failed to write AE/AF for {order_id}: {e}")
+
+    log.info(f"[{kitchen_id}] PUSH: order={order_id} row={row_idx} -> notified")
+    return "notified"
+
+
 async def orders_job(context):
     """
     ОБЪЕДИНЕННАЯ job: sync + notify.
     
     Логика:
-    1. Читает Google Sheets
+    1. Читает лист orders (get_storage().orders.rows)
     2. Для каждой строки:
        - Если AE пусто → пишет "1"
        - Если AE="1" и AF пусто → вызывает notify_staff() и пишет AF
+    3. Уведомления уходят пачкой по уже прочитанным строкам
+       (users читается один раз): чтений Sheets за цикл не больше двух
     """
     job = context.job
     data = job.data
@@ -36,22 +143,21 @@ async def orders_job(context):
         return
 
     bot = context.bot
-    service = get_sheets_service()
 
     try:
-        rows = service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id,
-            range=ORDERS_RANGE,
-        ).execute().get("values", [])
+        rows = await sheets_async.run(get_storage().orders.rows, spreadsheet_id)
     except Exception as e:
         log.error(f"[{kitchen_id}] Failed to read sheets: {e}")
         return
 
+    order_index.index_rows(spreadsheet_id, rows, kitchen_id)
+
     if len(rows) < 2:
         return
 
     sync_updates = []
     notify_updates = []
+    to_notify = []  # (row_idx, row)
 
     for idx, row in enumerate(rows[1:], start=2):
         order_id = row[0] if row else f"row_{idx}"
@@ -64,47 +170,53 @@ async def orders_job(context):
 
         # ===== SYNC: Если AE пусто → записываем "1" =====
         if not ae:
-            sync_updates.append({
-                "range": f"{ORDERS_SHEET}!AE{idx}",
-                "values": [["1"]],
-            })
+            sync_updates.append((idx, {"AE": "1"}))
             log.info(f"[{kitchen_id}] SYNC: order={order_id} row={idx} -> AE=1")
             continue  # пропускаем notify для этой строки (AE только что записали)
 
         # ===== NOTIFY: Если AE="1" и AF пусто → notify =====
         if ae == "1" and not af:
+            if not _claim(spreadsheet_id, order_id):
+                # уже уведомлен через push (или уведомляется прямо сейчас)
+                continue
+
             log.info(f"[{kitchen_id}] NOTIFY: order={order_id} row={idx}")
+            to_notify.append((idx, row))
+
+    # ===== NOTIFY пачкой: строки уже прочитаны, users читаем один раз =====
+    if to_notify:
+        try:
+            from main import notify_staff_batch
 
-            try:
-                from main import notify_staff
+            results = await notify_staff_batch(
+                bot,
+                kitchen,
+                [row for _, row in to_notify],
+            )
+        except Exception as e:
+            log.error(f"[{kitchen_id}] notify batch failed: {e}", exc_info=True)
+            results = {str(row[0]): e for _, row in to_notify}
 
-                await notify_staff(bot, kitchen, order_id)
+        for idx, row in to_notify:
+            order_id = str(row[0])
+            if isinstance(results.get(order_id), Exception):
+                _release(spreadsheet_id, order_id)
+                continue
 
-                notify_updates.append({
-                    "range": f"{ORDERS_SHEET}!AF{idx}",
-                    "values": [[f"notified:{datetime.utcnow().isoformat()}"]],
-                })
-                
-                log.info(f"[{kitchen_id}] NOTIFY: order={order_id} -> AF=notified")
+            _mark_done(spreadsheet_id, order_id)
 
-            except ImportError as e:
-                log.error(f"[{kitchen_id}] Failed to import notify_staff: {e}")
-                
-            except Exception as e:
-                log.error(f"[{kitchen_id}] notify_staff failed for {order_id}: {e}", exc_info=True)
+            notify_updates.append((idx, {"AF": _notified_marker()}))
+
+            log.info(f"[{kitchen_id}] NOTIFY: order={order_id} -> AF=notified")
 
     # ===== Батч-апдейты =====
     all_updates = sync_updates + notify_updates
 
     if all_updates:
         try:
-            service.spreadsheets().values().batchUpdate(
-                spreadsheetId=spreadsheet_id,
-                body={
-                    "valueInputOption": "RAW",
-                    "data": all_updates,
-                },
-            ).execute()
+            async with sheets_writer.operation("orders_poll") as batch:
+                for idx, cells in all_updates:
+                    batch.set_row_cells(spreadsheet_id, idx, cells, sheet=ORDERS_SHEET)
             
             if sync_updates:
                 log.info(f"[{kitchen_id}] Wrote {len(sync_updates)} AE updates")
@@ -112,4 +224,145 @@ async def orders_job(context):
                 log.info(f"[{kitchen_id}] Wrote {len(notify_updates)} AF updates")
                 
         except Exception as e:
-            log.error(f"[{kitchen_id}] Failed to write updates: {e}")
\ No newline at end of file
+            log.error(f"[{kitchen_id}] Failed to write updates: {e}")
+
+
+# -------------------------------------------------
+# Scheduler: опрос всех кухонь
+# -------------------------------------------------
+
+_poll_stats = {
+    "cycles": 0,
+    "last_cycle_seconds": 0.0,
+    "max_cycle_seconds": 0.0,
+    "kitchens": {},
+}
+
+
+async def poll_kitchen(bot, kitchen_id: str, spreadsheet_id: str) -> float:
+    """
+    Один проход orders_job по кухне. Возвращает длительность в секундах.
+    """
+    fake_context = SimpleNamespace(
+        bot=bot,
+        job=SimpleNamespace(
+            data={
+                "spreadsheet_id": spreadsheet_id,
+                "kitchen_id": kitchen_id,
+            }
+        ),
+    )
+
+    started = time.monotonic()
+    await orders_job(fake_context)
+    return time.monotonic() - started
+
+
+async def _poll_one(bot, kitchen, sem: asyncio.Semaphore) -> None:
+    kitchen_id = kitchen.kitchen_id
+    k_stats = _poll_stats["kitchens"].setdefault(
+        kitchen_id,
+        {"polls": 0, "errors": 0, "last_seconds": 0.0},
+    )
+
+    async with sem:
+        try:
+            k_stats["last_seconds"] = round(
+                await poll_kitchen(bot, kitchen_id, kitchen.spreadsheet_id), 3
+            )
+            k_stats["polls"] += 1
+        except Exception as e:
+            # ошибка одной кухни не мешает остальным
+            k_stats["errors"] += 1
+            log.error(f"[poll] kitchen={kitchen_id} error={e}", exc_info=True)
+
+
+def _active_kitchens() -> list:
+    from kitchen_context import load_registry, list_kitchens, get
+
+    load_registry()  # под TTL, повторно не читает
+
+    kitchens = []
+    for kitchen_id in list_kitchens():
+        kitchen = get(kitchen_id)
+        if kitchen and kitchen.status == "active":
+            kitchens.append(kitchen)
+    return kitchens
+
+
+async def poll_cycle(bot, concurrency: int = ORDERS_POLL_CONCURRENCY) -> float:
+    """
+    Опрашивает все активные кухни параллельно (не больше concurrency сразу).
+    Возвращает длительность цикла.
+    """
+    started = time.monotonic()
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    kitchens = _active_kitchens()
+    await asyncio.gather(*(_poll_one(bot, k, sem) for k in kitchens))
+
+    duration = time.monotonic() - started
+
+    _poll_stats["cycles"] += 1
+    _poll_stats["last_cycle_seconds"] = round(duration, 3)
+    _poll_stats["max_cycle_seconds"] = max(
+        _poll_stats["max_cycle_seconds"],
+        round(duration, 3),
+    )
+
+    log.info(f"[poll] cycle kitchens={len(kitchens)} duration={duration:.2f}s")
+
+    return duration
+
+
+async def orders_poll_loop(
+    app,
+    *,
+    interval: float = ORDERS_POLL_INTERVAL,
+    concurrency: int = ORDERS_POLL_CONCURRENCY,
+) -> None:
+    """
+    Фоновый опрос заказов всех кухонь (app.create_task из post_init).
+
+    Цикл держит ритм interval: пауза = interval - длительность цикла.
+    Завершается, когда приложение останавливается
+    (Application.stop ждет задачи create_task).
+    """
+    # дать боту полностью стартануть
+    while not app.running:
+        await asyncio.sleep(0.5)
+
+    # опрос уступает квоту Sheets покупателям и стаффу
+    sheets_limiter.mark_background()
+
+    log.info(
+        f"🟡 orders poll loop started interval={interval}s "
+        f"concurrency={concurrency}"
+    )
+
+    while app.running:
+        try:
+            duration = await poll_cycle(app.bot, concurrency)
+        except Exception as e:
+            log.error(f"[poll] cycle failed: {e}", exc_info=True)
+            duration = 0.0
+
+        if duration > interval:
+            log.warning(
+                f"[poll] cycle {duration:.2f}s exceeds interval {interval}s, "
+                f"consider raising ORDERS_POLL_CONCURRENCY"
+            )
+
+        # спим кусками, чтобы быстро выйти при остановке
+        deadline = time.monotonic() + max(0.5, interval - duration)
+        while app.running and time.monotonic() < deadline:
+            await asyncio.sleep(min(1.0, deadline - time.monotonic()))
+
+    log.info("orders poll loop stopped")
+
+
+def poll_stats() -> dict:
+    return {
+        **_poll_stats,
+        "kitchens": {k: dict(v) for k, v in _poll_stats["kitchens"].items()},
+    }